@@ -0,0 +1,112 @@
+import json
+from typing import Optional
+
+from sqlalchemy import ARRAY, Text, column, literal, update
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
+from sqlmodel import Session, cast, func, select
+
+from app.models import Analytic, Assignment, Submission, User
+
+
+def merge_results(session: Session, analytic_id, results: dict) -> None:
+    """
+    Store each file's result under its name in the analytic's data, leaving
+    other files' results alone. One UPDATE, so two requests writing to the
+    same analytic both keep their files instead of the last one winning.
+    """
+    data = func.coalesce(Analytic.data, literal({}, JSONB))
+    for file_name, result in results.items():
+        data = func.jsonb_set(
+            data,
+            literal([file_name], ARRAY(Text)),
+            literal(result, JSONB),
+            True,
+            type_=JSONB,
+        )
+    session.exec(update(Analytic).where(Analytic.id == analytic_id).values(data=data))
+
+
+def result_condition(
+    status: Optional[int] = None,
+    exclude_status: Optional[int] = None,
+    model: Optional[str] = None,
+) -> Optional[str]:
+    """
+    A jsonpath predicate on one file's result, None when nothing is filtered
+    on. Numbers are formatted from ints and strings JSON quoted, which is
+    also how jsonpath quotes them, so nothing can escape the literal.
+    """
+    conditions = []
+    if status is not None:
+        conditions.append(f"@.status == {int(status)}")
+    if exclude_status is not None:
+        conditions.append(f"@.status != {int(exclude_status)}")
+    if model is not None:
+        conditions.append(f"@.model == {json.dumps(model)}")
+    return " && ".join(conditions) or None
+
+
+def results_statement(user: User, condition: Optional[str], assignment_id=None):
+    """
+    File results from the analytics of user's assignments matching
+    condition, one row per file, with the number of matches on every row.
+    """
+    entry = func.jsonb_each(Analytic.data).table_valued(
+        column("key", Text), column("value", JSONB)
+    )
+
+    statement = (
+        select(
+            Analytic.id.label("analytic_id"),
+            Submission.id.label("submission_id"),
+            Submission.assignment_id,
+            Submission.student_id,
+            User.name.label("student_name"),
+            entry.c.key.label("file_name"),
+            entry.c.value.label("result"),
+            func.count().over().label("total"),
+        )
+        .select_from(Analytic)
+        .join(Submission, Submission.analytic_id == Analytic.id)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(User, User.id == Submission.student_id)
+        # a function in FROM sees the tables before it, one row per file
+        .join(entry, literal(True))
+        .where(Assignment.teacher_id == user.id)
+    )
+    if assignment_id is not None:
+        statement = statement.where(Submission.assignment_id == assignment_id)
+    if condition is not None:
+        # the whole document is checked first, through the GIN index, and
+        # then each file's result on the rows that are left
+        statement = statement.where(
+            Analytic.data.op("@?")(cast(f"$.* ? ({condition})", JSONPATH)),
+            entry.c.value.op("@?")(cast(f"$ ? ({condition})", JSONPATH)),
+        )
+    return statement
+
+
+def query_results(
+    session: Session,
+    user: User,
+    condition: Optional[str] = None,
+    assignment_id=None,
+    limit: int = 50,
+    offset: int = 0,
+) -> tuple[list, int]:
+    """One page of matching file results and the total number of them."""
+    statement = results_statement(user, condition, assignment_id)
+    rows = session.exec(
+        statement.order_by(
+            Submission.assignment_id, "student_name", Submission.id, "file_name"
+        )
+        .limit(limit)
+        .offset(offset)
+    ).all()
+
+    total = rows[0].total if rows else 0
+    if not rows and offset:
+        total = session.exec(
+            select(func.count()).select_from(statement.subquery())
+        ).one()
+    return rows, total
@@ -3,11 +3,16 @@ import os
 from typing import Annotated
 from fastapi import Depends
 
+from . import metrics, queries, timing
+
 postgresql_url = os.getenv(
     "POSTGRESQL_URL", "postgresql://postgres:postgres@db:5432/postgres"
 )
 
 engine = create_engine(postgresql_url)
+metrics.instrument_engine(engine)
+queries.instrument_engine(engine)
+timing.instrument_engine(engine)
 
 
 def create_db_and_tables():
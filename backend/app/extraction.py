@@ -0,0 +1,243 @@
+import codecs
+import logging
+import mmap
+import os
+import re
+import time
+from collections import Counter
+from typing import Iterator, List, Optional
+
+from app.llm.tokens import CHARS_PER_TOKEN, MAX_NUM_CTX, estimate_tokens
+from app.metrics import PDF_PAGE_EXTRACTION
+from app.timing import span
+from app.models import File
+
+logger = logging.getLogger(__name__)
+
+NO_TEXT_IN_PDF = "This PDF appears to contain no extractable text content. It may consist of scanned images."
+
+# how much of a file is read for prompting. fit_content cuts the text down to
+# the largest context anyway, the headroom is for what normalization drops
+EXTRACT_MAX_BYTES = int(
+    os.getenv("EXTRACT_MAX_BYTES", str(MAX_NUM_CTX * CHARS_PER_TOKEN * 4))
+)
+
+# text files at least this big are memory mapped rather than read through a
+# buffer, so only the pages actually decoded are paged in
+EXTRACT_MMAP_MIN_BYTES = int(os.getenv("EXTRACT_MMAP_MIN_BYTES", str(8 * 1024 * 1024)))
+
+READ_CHUNK_BYTES = 64 * 1024
+
+# how many lines at the top and bottom of a page are checked for running
+# headers/footers
+EDGE_LINES = 2
+
+# a header/footer has to show up on at least this share of pages to be dropped
+REPEAT_RATIO = 0.5
+MIN_PAGES_FOR_REPEATS = 3
+
+PAGE_NUMBER_RE = re.compile(
+    r"^\s*(?:page\s*)?[-–—]?\s*\d+\s*(?:(?:of|/)\s*\d+)?\s*[-–—]?\s*$",
+    re.IGNORECASE,
+)
+HYPHENATION_RE = re.compile(r"(\w)-\n[ \t]*([a-z])")
+INLINE_WHITESPACE_RE = re.compile(r"[ \t\f\v\u00a0]+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+TRAILING_WHITESPACE_RE = re.compile(r"[ \t\f\v]+$", re.MULTILINE)
+
+
+def _line_key(line: str) -> str:
+    # running headers usually differ only by the page number
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+
+def _repeated_edge_lines(pages: List[List[str]]) -> set:
+    if len(pages) < MIN_PAGES_FOR_REPEATS:
+        return set()
+
+    counts = Counter()
+    for lines in pages:
+        edges = [line for line in lines if line.strip()]
+        edges = edges[:EDGE_LINES] + edges[-EDGE_LINES:]
+        # count each shape once per page
+        counts.update({_line_key(line) for line in edges})
+
+    threshold = max(2, len(pages) * REPEAT_RATIO)
+    return {key for key, count in counts.items() if key and count >= threshold}
+
+
+def _strip_edges(lines: List[str], repeated: set) -> List[str]:
+    def is_noise(line: str) -> bool:
+        return bool(PAGE_NUMBER_RE.match(line)) or _line_key(line) in repeated
+
+    start, end = 0, len(lines)
+    checked = 0
+    while start < end and checked < EDGE_LINES:
+        if not lines[start].strip():
+            start += 1
+            continue
+        if not is_noise(lines[start]):
+            break
+        start += 1
+        checked += 1
+
+    checked = 0
+    while end > start and checked < EDGE_LINES:
+        if not lines[end - 1].strip():
+            end -= 1
+            continue
+        if not is_noise(lines[end - 1]):
+            break
+        end -= 1
+        checked += 1
+
+    return lines[start:end]
+
+
+def normalize_text(text: str) -> str:
+    # rejoin words split across lines ("photo-\nsynthesis"), then squeeze
+    # runs of spaces and blank lines
+    text = HYPHENATION_RE.sub(r"\1\2", text)
+    text = INLINE_WHITESPACE_RE.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    text = BLANK_LINES_RE.sub("\n\n", text)
+    return text.strip()
+
+
+def tidy_text(text: str) -> str:
+    # uploaded text and code keep their indentation and hyphens, only
+    # trailing whitespace and runs of blank lines go
+    text = TRAILING_WHITESPACE_RE.sub("", text)
+    text = BLANK_LINES_RE.sub("\n\n", text)
+    return text.strip("\n")
+
+
+def normalize_pages(pages: List[str], pdf: bool = True) -> tuple[str, dict]:
+    """
+    Clean up extracted text before it is sent to the LLM. Pages from a PDF
+    lose running headers, footers and page numbers repeated across pages,
+    get hyphenated words rejoined and whitespace collapsed. Other text is
+    only tidied, its layout is part of the content.
+    Returns the text and a report of how much was saved.
+    """
+    raw = "\n\n".join(pages)
+
+    if pdf:
+        split_pages = [page.splitlines() for page in pages]
+        repeated = _repeated_edge_lines(split_pages)
+        if len(pages) > 1:
+            split_pages = [_strip_edges(lines, repeated) for lines in split_pages]
+        text = normalize_text("\n\n".join("\n".join(lines) for lines in split_pages))
+    else:
+        text = tidy_text(raw)
+
+    bytes_before = len(raw.encode("utf-8"))
+    bytes_after = len(text.encode("utf-8"))
+
+    return text, {
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after,
+        "tokens_saved": estimate_tokens(raw) - estimate_tokens(text),
+    }
+
+
+def _read_chunks(path: str, max_bytes: int) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size >= EXTRACT_MMAP_MIN_BYTES:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = min(size, max_bytes)
+                for start in range(0, end, READ_CHUNK_BYTES):
+                    yield mapped[start : min(start + READ_CHUNK_BYTES, end)]
+            return
+
+        remaining = max_bytes
+        while remaining > 0:
+            chunk = file.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def read_text(path: str, max_bytes: int = EXTRACT_MAX_BYTES) -> tuple[str, bool]:
+    """
+    Decode at most max_bytes of a text file, chunk by chunk, so memory stays
+    proportional to the budget rather than the file. Returns the text and
+    whether the file was cut short.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = [decoder.decode(chunk) for chunk in _read_chunks(path, max_bytes)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), os.path.getsize(path) > max_bytes
+
+
+def extract_pages(
+    file_record: File, max_bytes: Optional[int] = None
+) -> tuple[List[str], bool]:
+    """
+    Read the text of a file page by page, up to max_bytes of text. Returns
+    the pages and whether the file was cut short. Raises ImportError when
+    pypdf is missing and OSError when a text file can't be read.
+    """
+    max_bytes = max_bytes or EXTRACT_MAX_BYTES
+
+    if file_record.filename.lower().endswith(".pdf"):
+        # Using pypdf to extract text from PDF
+        import pypdf
+
+        pages = []
+        extracted = 0
+        try:
+            with open(file_record.filepath, "rb") as pdf_file:
+                pdf_reader = pypdf.PdfReader(pdf_file)
+                for page_num in range(len(pdf_reader.pages)):
+                    if extracted >= max_bytes:
+                        return pages, True
+                    started_at = time.perf_counter()
+                    page = pdf_reader.pages[page_num]
+                    page_text = page.extract_text()
+                    PDF_PAGE_EXTRACTION.observe(time.perf_counter() - started_at)
+                    if page_text:
+                        # the budget is in bytes, cut on a character boundary
+                        encoded = page_text.encode("utf-8")
+                        pages.append(
+                            encoded[: max_bytes - extracted].decode(
+                                "utf-8", errors="ignore"
+                            )
+                        )
+                        extracted += len(encoded)
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            return [f"Error extracting text from PDF: {str(e)}"], False
+
+        return pages, extracted > max_bytes
+
+    text, truncated = read_text(file_record.filepath, max_bytes)
+    # form feeds are page breaks in text exported from pdfs/word
+    return text.split("\f"), truncated
+
+
+def extract_text(file_record: File) -> tuple[str, dict]:
+    """
+    Extract and normalize the text of a file for prompting. Returns the text
+    and the normalization report.
+    """
+    # strip headers, footers and whitespace noise before anything is counted
+    # or sent, every token dropped here is prompt evaluation we don't pay for
+    is_pdf = file_record.filename.lower().endswith(".pdf")
+    with span("extract"):
+        pages, truncated = extract_pages(file_record)
+        text, report = normalize_pages(pages, pdf=is_pdf)
+
+    if truncated:
+        logger.warning(
+            f"Only the first {EXTRACT_MAX_BYTES} bytes of {file_record.filename} were read"
+        )
+    report["read_truncated"] = truncated
+
+    if not text and is_pdf:
+        text = NO_TEXT_IN_PDF
+
+    return text, report
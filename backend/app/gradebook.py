@@ -0,0 +1,130 @@
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import Engine, Text, column, literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Session, func, select
+
+from app.models import Analytic, Assignment, Submission, User
+
+# rows fetched from the server side cursor at a time, and written out per chunk
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "500"))
+
+# fields of a file's analysis result that get their own CSV column
+RESULT_FIELDS = ("status", "model", "prompt", "analysis")
+
+COLUMNS = (
+    "assignment_id",
+    "assignment_title",
+    "due_date",
+    "submission_id",
+    "comment",
+    "student_id",
+    "student_username",
+    "student_name",
+    "file_name",
+)
+
+
+def export_statement(teacher_id, assignment_id=None):
+    """
+    One row per analyzed file of every submission to the teacher's
+    assignments, in a stable order. Submissions without results still get
+    a row, with the result columns empty.
+    """
+    entry = func.jsonb_each(Analytic.data).table_valued(
+        column("key", Text), column("value", JSONB)
+    )
+
+    statement = (
+        select(
+            Assignment.id.label("assignment_id"),
+            Assignment.title.label("assignment_title"),
+            Assignment.due_date,
+            Submission.id.label("submission_id"),
+            Submission.comment,
+            User.id.label("student_id"),
+            User.username.label("student_username"),
+            User.name.label("student_name"),
+            entry.c.key.label("file_name"),
+            entry.c.value.label("result"),
+        )
+        .select_from(Submission)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(User, User.id == Submission.student_id)
+        .outerjoin(Analytic, Analytic.id == Submission.analytic_id)
+        .outerjoin(entry, literal(True))
+        .where(Assignment.teacher_id == teacher_id)
+        .order_by(
+            Assignment.due_date,
+            Assignment.title,
+            Assignment.id,
+            User.name,
+            Submission.id,
+            entry.c.key,
+        )
+    )
+    if assignment_id is not None:
+        statement = statement.where(Assignment.id == assignment_id)
+    return statement
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _rows(bind: Engine, statement) -> Iterator[list]:
+    """
+    Batches of rows read through a server side cursor, so memory stays flat
+    however much is exported. The export runs after the response has started,
+    when the request's session may already be closed, so it reads through a
+    session of its own, closed when the generator finishes or is dropped.
+    """
+    session = Session(bind)
+    try:
+        result = session.exec(statement.execution_options(yield_per=EXPORT_BATCH))
+        yield from result.partitions()
+    finally:
+        session.close()
+
+
+def stream_csv(bind: Engine, statement) -> Iterator[str]:
+    """The export as CSV, a header and then one chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS + RESULT_FIELDS)
+    # the header goes out before the query runs
+    yield buffer.getvalue()
+
+    for rows in _rows(bind, statement):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            result = row.result or {}
+            writer.writerow(
+                [_value(row._mapping[name]) for name in COLUMNS]
+                + [result.get(field) for field in RESULT_FIELDS]
+            )
+        yield buffer.getvalue()
+
+
+def stream_ndjson(bind: Engine, statement) -> Iterator[str]:
+    """The export as one JSON object per line, with the whole result."""
+    for rows in _rows(bind, statement):
+        yield "".join(
+            json.dumps(
+                {name: _value(row._mapping[name]) for name in COLUMNS}
+                | {"result": row.result}
+            )
+            + "\n"
+            for row in rows
+        )
@@ -0,0 +1,83 @@
+import os
+import re
+from typing import List, Optional
+
+# files estimated at or below this many tokens are packed together
+BATCH_FILE_MAX_TOKENS = int(os.getenv("LLM_BATCH_FILE_MAX_TOKENS", "1024"))
+
+# total file content in one packed request
+BATCH_MAX_TOKENS = int(os.getenv("LLM_BATCH_MAX_TOKENS", "4096"))
+
+ANSWER_HEADER_RE = re.compile(
+    r"^[ \t]*#{1,6}[ \t]*FILE:[ \t]*(.+?)[ \t]*$", re.MULTILINE
+)
+
+
+def pack_files(
+    sizes: List[int],
+    budget: int = BATCH_MAX_TOKENS,
+    room: Optional[int] = None,
+    reserve: int = 0,
+) -> List[List[int]]:
+    """
+    Greedily group file indexes so that each group's total size stays within
+    the budget and, when room is given, its size plus reserve tokens for each
+    file's answer stays within room. Files keep their submission order within
+    a group.
+    """
+    groups = []
+    for index, size in enumerate(sizes):
+        for group in groups:
+            fits = group["size"] + size <= budget
+            if room is not None:
+                used = group["size"] + size + reserve * (len(group["files"]) + 1)
+                fits = fits and used <= room
+            if fits:
+                group["files"].append(index)
+                group["size"] += size
+                break
+        else:
+            groups.append({"files": [index], "size": size})
+
+    return [group["files"] for group in groups]
+
+
+def build_batch_prompt(prompt: str, documents: List[tuple[str, str, str]]) -> str:
+    """
+    documents are (file name, file type, content). Every file gets its own
+    delimited section and the model is asked to answer under a header per
+    file so the response can be split back up.
+    """
+    sections = [
+        f"=== FILE: {name} (File Type: {file_type}) ===\n{content}\n=== END FILE ==="
+        for name, file_type, content in documents
+    ]
+    names = ", ".join(name for name, _, _ in documents)
+
+    return (
+        "\n\n".join(sections)
+        + f"\n\n{prompt}\n\n"
+        + "Answer for each file separately, in the same order as above. "
+        + 'Start every answer with a line "### FILE: <file name>" using the exact '
+        + f"file name. The files are: {names}"
+    )
+
+
+def split_batch_response(text: str, names: List[str]) -> Optional[dict]:
+    """
+    Split a packed response into answers per file name. Returns None when an
+    answer is missing or empty, so the caller can fall back to one request
+    per file.
+    """
+    matches = list(ANSWER_HEADER_RE.finditer(text))
+
+    answers = {}
+    for i, match in enumerate(matches):
+        name = match.group(1).strip().strip("`*\"'")
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        answers[name] = text[match.end() : end].strip()
+
+    if any(not answers.get(name) for name in names):
+        return None
+
+    return {name: answers[name] for name in names}
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+from starlette.requests import Request
+
+from app.llm import stats
+
+# per outbound call timeout, used when there's no tighter request deadline
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# longest a request may spend on analysis. Clients can ask for less with an
+# X-Request-Timeout header in seconds.
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+
+# how often to check whether the client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+
+# absolute time.monotonic() deadline of the request being served. Tasks copy
+# the context they are created in, so work started on behalf of a request
+# sees its deadline.
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def request_timeout(header: Optional[str]) -> float:
+    try:
+        requested = float(header) if header else LLM_REQUEST_TIMEOUT
+    except ValueError:
+        requested = LLM_REQUEST_TIMEOUT
+    return max(0.0, min(requested, LLM_REQUEST_TIMEOUT))
+
+
+def set_deadline(timeout: float) -> None:
+    _deadline.set(time.monotonic() + timeout)
+
+
+def remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def llm_timeout() -> float:
+    """Timeout for an outbound call, never past the request's deadline."""
+    left = remaining()
+    if left is None:
+        return LLM_TIMEOUT
+    # httpx treats 0 as no time at all, keep a sliver so the error is a timeout
+    return max(min(LLM_TIMEOUT, left), 0.001)
+
+
+async def run_until_disconnected(request: Request, work: Awaitable[Any]) -> Any:
+    """
+    Await work, cancelling it if the client goes away first. Cancelling
+    closes the connection to ollama, which stops the generation and frees
+    the slot. Raises ClientDisconnected in that case.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+
+            if await request.is_disconnected():
+                stats.incr("client_disconnects")
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                raise ClientDisconnected()
+    except BaseException:
+        # timed out or cancelled from outside, take the work down with us
+        task.cancel()
+        raise
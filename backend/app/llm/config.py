@@ -0,0 +1,71 @@
+import json
+import os
+from typing import Optional
+
+LLM_API_URL = os.getenv("LLM_API_URL", "http://10.0.0.52:11434/api/generate")
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-r1:8b")
+
+# embeddings for retrieval come from the same ollama by default
+LLM_EMBED_URL = os.getenv(
+    "LLM_EMBED_URL", LLM_API_URL.rsplit("/api/", 1)[0] + "/api/embed"
+)
+LLM_EMBED_MODEL = os.getenv("LLM_EMBED_MODEL", "nomic-embed-text")
+
+
+def _env_bool(name: str) -> Optional[bool]:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return None
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return None
+    return int(value)
+
+
+# unset leaves it to the model. deepseek-r1 thinks by default and most of what
+# it generates is reasoning that we throw away
+LLM_THINK = _env_bool("LLM_THINK")
+
+# hard cap on generated tokens (thinking included)
+LLM_NUM_PREDICT = _env_int("LLM_NUM_PREDICT")
+
+# how long ollama keeps a model loaded after a request, e.g. "30m". Unset
+# uses ollama's default (5 minutes)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE") or None
+
+# preload the configured models when the app starts
+LLM_WARMUP = _env_bool("LLM_WARMUP") is not False
+
+# any other ollama options, e.g. LLM_OPTIONS='{"temperature": 0.2}'
+LLM_OPTIONS = json.loads(os.getenv("LLM_OPTIONS", "{}"))
+
+
+def generation_settings(
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    options: Optional[dict] = None,
+) -> dict:
+    """
+    Build the generation fields for an /api/generate request. Values passed
+    for a single request take precedence over the deployment defaults.
+    """
+    options = {**LLM_OPTIONS, **(options or {})}
+
+    num_predict = num_predict if num_predict is not None else LLM_NUM_PREDICT
+    if num_predict is not None:
+        options["num_predict"] = num_predict
+
+    settings = {"options": options}
+
+    think = think if think is not None else LLM_THINK
+    if think is not None:
+        settings["think"] = think
+
+    if LLM_KEEP_ALIVE:
+        settings["keep_alive"] = LLM_KEEP_ALIVE
+
+    return settings
@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+import numpy as np
+
+from app.llm.cancellation import llm_timeout
+from app.llm.config import LLM_EMBED_MODEL, LLM_EMBED_URL
+from app.llm.limiter import limiter
+from app.llm.tokens import CHARS_PER_TOKEN, estimate_tokens
+from app.timing import span
+from app.tracing import instrument_client, tracer
+
+logger = logging.getLogger(__name__)
+
+# documents shorter than this are always sent whole
+RAG_MIN_TOKENS = int(os.getenv("RAG_MIN_TOKENS", "4096"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "256"))
+# neighbouring chunks share this much text so a sentence cut in two is still
+# whole in one of them
+RAG_CHUNK_OVERLAP_TOKENS = RAG_CHUNK_TOKENS // 8
+
+EMBED_INDEX_DIR = os.getenv("EMBED_INDEX_DIR", os.path.join("uploads", "embeddings"))
+os.makedirs(EMBED_INDEX_DIR, exist_ok=True)
+
+# texts per /api/embed request
+EMBED_BATCH = 32
+
+CHUNK_SEPARATOR = "\n\n[...]\n\n"
+
+
+@dataclass
+class EmbeddingIndex:
+    """
+    Unit length float32 embeddings of a document's chunks, one row per
+    chunk, with the character span each row covers.
+    """
+
+    vectors: np.ndarray
+    spans: np.ndarray
+    model: str
+    digest: str
+
+    def save(self, path: str) -> None:
+        # written next to the target and renamed, a reader never sees half
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                vectors=self.vectors,
+                spans=self.spans,
+                model=np.array(self.model),
+                digest=np.array(self.digest),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingIndex":
+        with np.load(path) as data:
+            return cls(
+                vectors=data["vectors"],
+                spans=data["spans"],
+                model=str(data["model"]),
+                digest=str(data["digest"]),
+            )
+
+    def top_k(self, queries: np.ndarray, k: int) -> np.ndarray:
+        """
+        Rows of the k chunks closest to any of the queries by cosine
+        similarity, in document order.
+        """
+        # rows are unit length, so the dot product is the cosine
+        scores = (self.vectors @ queries.T).max(axis=1)
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        return np.sort(best)
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def index_path(file_id) -> str:
+    return os.path.join(EMBED_INDEX_DIR, f"{file_id}.npz")
+
+
+def chunk_spans(
+    text: str,
+    size: int = RAG_CHUNK_TOKENS * CHARS_PER_TOKEN,
+    overlap: int = RAG_CHUNK_OVERLAP_TOKENS * CHARS_PER_TOKEN,
+) -> np.ndarray:
+    """
+    Character spans of about size characters covering text. Chunks end at
+    a paragraph, sentence or word break in their last quarter when there
+    is one.
+    """
+    spans = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            floor = start + size * 3 // 4
+            for separator in ("\n\n", ". ", " "):
+                cut = text.rfind(separator, floor, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        spans.append((start, end))
+        if end == len(text):
+            break
+        start = max(end - overlap, start + 1)
+        # start on a word
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+    return np.array(spans, dtype=np.int64).reshape(-1, 2)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+async def embed(
+    client: httpx.AsyncClient, texts: List[str], model: str = LLM_EMBED_MODEL
+) -> np.ndarray:
+    """
+    Unit length float32 embeddings of texts, one row each. Calls share the
+    adaptive limit with generation, they run on the same ollama.
+    """
+    rows = []
+    for start in range(0, len(texts), EMBED_BATCH):
+        batch = texts[start : start + EMBED_BATCH]
+        async with limiter.acquire(model) as call:
+            with span("embed"), tracer.start_as_current_span(
+                "llm.embed", attributes={"llm.model": model, "llm.inputs": len(batch)}
+            ):
+                response = await client.post(
+                    LLM_EMBED_URL,
+                    json={"model": model, "input": batch},
+                    timeout=llm_timeout(),
+                )
+            call.failed = response.status_code >= 500
+            # latency is compared per input, the model has its own baseline
+            call.tokens = len(batch)
+        response.raise_for_status()
+        rows.extend(response.json()["embeddings"])
+    return normalize(np.asarray(rows, dtype=np.float32))
+
+
+async def build_index(
+    client: httpx.AsyncClient, text: str, model: str = LLM_EMBED_MODEL
+) -> EmbeddingIndex:
+    spans = chunk_spans(text)
+    vectors = await embed(client, [text[start:end] for start, end in spans], model)
+    return EmbeddingIndex(vectors, spans, model, text_digest(text))
+
+
+async def file_index(
+    client: httpx.AsyncClient, file_id, text: str, model: str = LLM_EMBED_MODEL
+) -> EmbeddingIndex:
+    """
+    The file's index from disk, rebuilt when the text or the embedding model
+    changed since it was written.
+    """
+    path = index_path(file_id)
+    digest = text_digest(text)
+    try:
+        index = await asyncio.to_thread(EmbeddingIndex.load, path)
+        if index.digest == digest and index.model == model:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = await build_index(client, text, model)
+    try:
+        await asyncio.to_thread(index.save, path)
+    except OSError as e:
+        logger.warning(f"Could not store the embedding index for {file_id}: {str(e)}")
+    return index
+
+
+async def retrieve(
+    file_id,
+    text: str,
+    questions: List[str],
+    k: int = RAG_TOP_K,
+    client: Optional[httpx.AsyncClient] = None,
+) -> tuple[str, dict]:
+    """
+    The parts of text most relevant to any of the questions, in document
+    order. Texts under RAG_MIN_TOKENS are returned whole. Returns the text
+    to send and a report for the result payload. Called from inside the
+    file's scheduler slot, so embedding counts against the teacher's turn.
+    """
+    full_tokens = estimate_tokens(text)
+    report = {"used": False, "full_tokens": full_tokens}
+    if full_tokens < RAG_MIN_TOKENS:
+        return text, report
+
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=httpx.Timeout(llm_timeout()))
+        instrument_client(client)
+    try:
+        index = await file_index(client, file_id, text)
+        queries = await embed(client, questions)
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    rows = index.top_k(queries, k)
+    parts = []
+    end_of_last = -1
+    for start, end in index.spans[rows]:
+        # overlapping neighbours are joined rather than repeated
+        if parts and start <= end_of_last:
+            parts[-1] += text[end_of_last:end]
+        else:
+            parts.append(text[start:end])
+        end_of_last = max(end_of_last, end)
+    selected = CHUNK_SEPARATOR.join(parts)
+
+    report.update(
+        {
+            "used": True,
+            "model": index.model,
+            "chunks": len(index.spans),
+            "selected_chunks": rows.tolist(),
+            "sent_tokens": estimate_tokens(selected),
+        }
+    )
+    return selected, report
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from app import metrics
+from app.llm import stats
+
+# where the adaptive limit starts, and its bounds
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "2"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# back off once latency is this many times the best seen for the model
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+
+BACKOFF = 0.9
+SMOOTHING = 0.2
+
+# the baseline creeps up a little on every sample so it can follow real
+# changes (a different gpu, an ollama upgrade) instead of sticking to an
+# old best case forever
+MIN_RTT_DRIFT = 1.01
+
+
+class LLMCall:
+    """
+    Handle for one outbound call. Set tokens to what was generated so the
+    latency can be compared between short and long answers, and failed when
+    the backend couldn't serve it.
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.failed = False
+
+
+class AdaptiveLimiter:
+    """
+    Limits concurrent outbound llm calls with additive increase/multiplicative
+    decrease. Latency per generated token is compared to the best seen for
+    the model: while it stays close and the limit is in use, the limit grows
+    by about one per round trip; once queueing inside ollama pushes it up, or
+    calls fail, the limit shrinks.
+    """
+
+    def __init__(
+        self,
+        initial: int = LLM_CONCURRENCY,
+        min_limit: int = LLM_MIN_CONCURRENCY,
+        max_limit: int = LLM_MAX_CONCURRENCY,
+        tolerance: float = LLM_LATENCY_TOLERANCE,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.tolerance = tolerance
+
+        self.in_flight = 0
+        self._rtt: Dict[str, dict] = {}
+        self._waiters = deque()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.LLM_IN_FLIGHT.set(self.in_flight)
+        metrics.LLM_CONCURRENCY_LIMIT.set(self.limit)
+
+    def _update(self, model: str, seconds: float, call: LLMCall, saturated: bool):
+        if call.failed:
+            self.limit = max(self.min_limit, self.limit * BACKOFF)
+            return
+
+        sample = seconds / max(call.tokens, 1)
+        rtt = self._rtt.get(model)
+        if rtt is None:
+            rtt = self._rtt[model] = {"ewma": sample, "min": sample}
+        else:
+            rtt["min"] = min(sample, rtt["min"] * MIN_RTT_DRIFT)
+            rtt["ewma"] += SMOOTHING * (sample - rtt["ewma"])
+
+        if rtt["ewma"] > self.tolerance * rtt["min"]:
+            self.limit = max(self.min_limit, self.limit * BACKOFF)
+        elif saturated:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    @asynccontextmanager
+    async def acquire(self, model: str):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.in_flight -= 1
+                    self._wake()
+                raise
+
+        # only grow the limit when it's actually what holds calls back
+        saturated = self.in_flight >= int(self.limit)
+        call = LLMCall()
+        started_at = time.monotonic()
+        completed = False
+        try:
+            yield call
+            completed = True
+        except Exception:
+            call.failed = True
+            raise
+        finally:
+            self.in_flight -= 1
+            elapsed = time.monotonic() - started_at
+            if not completed:
+                # timed out or the client went away, whatever ollama generated
+                # up to here is thrown away
+                stats.incr("abandoned_generations")
+                stats.incr("wasted_generation_seconds", elapsed)
+
+            # cancelled calls say nothing about the backend
+            task = asyncio.current_task()
+            if task is None or not task.cancelling():
+                self._update(model, elapsed, call, saturated)
+            self._wake()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "rtt_per_token": {model: dict(rtt) for model, rtt in self._rtt.items()},
+        }
+
+
+limiter = AdaptiveLimiter()
+stats.register("limiter", limiter.snapshot)
@@ -0,0 +1,71 @@
+import os
+from typing import List, Optional
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.llm.config import LLM_MODEL
+
+
+class Route(BaseModel):
+    """
+    A routing rule. A rule matches when the task hint is one of its tasks (if
+    it lists any) and the estimated prompt size is within its token bounds.
+    """
+
+    model: str
+    tasks: Optional[List[str]] = None
+    min_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
+    think: Optional[bool] = None
+    options: dict = {}
+
+
+def load_routes() -> List[Route]:
+    """
+    Rules come from LLM_ROUTES_FILE or LLM_ROUTES as a JSON list and are
+    checked in order, e.g.
+    [{"model": "llama3.2:3b", "max_tokens": 2000, "think": false},
+     {"model": "deepseek-r1:8b", "tasks": ["grading"]}]
+    """
+    routes_file = os.getenv("LLM_ROUTES_FILE")
+    if routes_file:
+        with open(routes_file, "r") as f:
+            raw = f.read()
+    else:
+        raw = os.getenv("LLM_ROUTES", "[]")
+
+    return TypeAdapter(List[Route]).validate_json(raw)
+
+
+LLM_ROUTES = load_routes()
+
+
+def select_route(
+    tokens: int, task: Optional[str] = None, routes: Optional[List[Route]] = None
+) -> tuple[Route, Optional[int]]:
+    """
+    Pick the model for a prompt of the given estimated size. Returns the
+    matching rule and its index, or a rule for LLM_MODEL and None when
+    nothing matches.
+    """
+    routes = LLM_ROUTES if routes is None else routes
+
+    for index, route in enumerate(routes):
+        if route.tasks is not None and task not in route.tasks:
+            continue
+        if route.min_tokens is not None and tokens < route.min_tokens:
+            continue
+        if route.max_tokens is not None and tokens > route.max_tokens:
+            continue
+        return route, index
+
+    return Route(model=LLM_MODEL), None
+
+
+def configured_models() -> List[str]:
+    """The default model and every model a rule can route to."""
+    models = [LLM_MODEL]
+    for route in LLM_ROUTES:
+        if route.model not in models:
+            models.append(route.model)
+    return models
@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional
+
+from app import metrics
+from app.llm import stats
+from app.llm.limiter import AdaptiveLimiter, limiter
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# calls allowed to wait for a slot, in total and per user
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "50"))
+LLM_USER_QUEUE_LIMIT = int(os.getenv("LLM_USER_QUEUE_LIMIT", "10"))
+
+# per user token bucket, in llm calls per minute and burst size
+LLM_USER_RATE = float(os.getenv("LLM_USER_RATE", "60"))
+LLM_USER_BURST = float(os.getenv("LLM_USER_BURST", "20"))
+
+# share of the backend per user, as a JSON object of user id to weight.
+# A teacher with weight 2 gets twice the calls of one with the default 1
+# while both have work queued
+LLM_USER_WEIGHTS = json.loads(os.getenv("LLM_USER_WEIGHTS", "{}"))
+
+# per user bookkeeping is dropped after this long without a call
+LLM_USER_IDLE_SECONDS = float(os.getenv("LLM_USER_IDLE_SECONDS", "3600"))
+PRUNE_INTERVAL = 60.0
+
+# retry hint used before any call has been timed
+DEFAULT_SERVICE_SECONDS = 30.0
+
+
+class AdmissionError(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class FairScheduler:
+    """
+    Hands out llm slots fairly between users. Interactive calls are always
+    served before bulk ones; within a priority, users are served in weighted
+    fair queueing order, so a teacher queueing a whole section only gets
+    their share of the backend instead of all of it. Each user's share is
+    their weight, 1 unless set in weights.
+    How many slots there are follows the adaptive limiter when one is given.
+    """
+
+    def __init__(
+        self,
+        limit: int = 1,
+        limiter: Optional[AdaptiveLimiter] = None,
+        queue_limit: int = LLM_QUEUE_LIMIT,
+        user_queue_limit: int = LLM_USER_QUEUE_LIMIT,
+        rate_per_minute: float = LLM_USER_RATE,
+        burst: float = LLM_USER_BURST,
+        weights: Optional[Dict[str, float]] = None,
+        idle_seconds: float = LLM_USER_IDLE_SECONDS,
+    ):
+        self._limit = limit
+        self.limiter = limiter
+        self.queue_limit = queue_limit
+        self.user_queue_limit = user_queue_limit
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.weights = {
+            str(user_id): float(weight)
+            for user_id, weight in (
+                LLM_USER_WEIGHTS if weights is None else weights
+            ).items()
+        }
+        self.idle_seconds = idle_seconds
+
+        self.in_flight = 0
+        self._queues = {priority: [] for priority in PRIORITIES}
+        self._seq = itertools.count()
+        self._clock = 0.0
+        self._finish: Dict[Hashable, float] = {}
+        self._depth: Dict[Hashable, int] = {}
+        self._buckets: Dict[Hashable, tuple[float, float]] = {}
+        self._waits: Dict[Hashable, dict] = {}
+        self._service = {"count": 0, "sum": 0.0}
+        self._last_seen: Dict[Hashable, float] = {}
+        self._pruned_at = time.monotonic()
+
+    @property
+    def limit(self) -> int:
+        if self.limiter is not None:
+            return int(self.limiter.limit)
+        return self._limit
+
+    @property
+    def queued(self) -> int:
+        return sum(self._depth.values())
+
+    def _service_seconds(self) -> float:
+        if not self._service["count"]:
+            return DEFAULT_SERVICE_SECONDS
+        return self._service["sum"] / self._service["count"]
+
+    def weight(self, user_id: Hashable) -> float:
+        return max(self.weights.get(str(user_id), 1.0), 0.01)
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """
+        Forget users who have nothing queued, no unfinished share of virtual
+        time and a full bucket, they'd be treated the same as a new user.
+        Their wait statistics go once they've been idle for idle_seconds.
+        """
+        now = time.monotonic() if now is None else now
+        self._pruned_at = now
+        for user_id, finish in list(self._finish.items()):
+            if finish <= self._clock and not self._depth.get(user_id):
+                del self._finish[user_id]
+                self._depth.pop(user_id, None)
+        for user_id, (tokens, last) in list(self._buckets.items()):
+            if tokens + (now - last) * self.rate >= self.burst:
+                del self._buckets[user_id]
+        for user_id, seen in list(self._last_seen.items()):
+            if now - seen > self.idle_seconds and not self._depth.get(user_id):
+                del self._last_seen[user_id]
+                self._waits.pop(user_id, None)
+                metrics.remove_series(metrics.LLM_USER_QUEUE_WAIT, str(user_id))
+
+    def admit(self, user_id: Hashable, cost: int = 1) -> None:
+        """
+        Take cost tokens from the user's bucket. Raises AdmissionError when
+        the user is over their rate or the queues are full.
+        """
+        if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+        if (
+            self.queued >= self.queue_limit
+            or self._depth.get(user_id, 0) >= self.user_queue_limit
+        ):
+            waiting = self.queued + 1
+            raise AdmissionError(
+                "Analysis queue is full, try again later",
+                waiting / max(self.limit, 1) * self._service_seconds(),
+            )
+
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens, last = self._buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens < cost:
+            self._buckets[user_id] = (tokens, now)
+            raise AdmissionError(
+                "Too many analysis requests, try again later",
+                (cost - tokens) / self.rate,
+            )
+
+        self._buckets[user_id] = (tokens - cost, now)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.limit:
+            entry = None
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                while queue and queue[0][3].done():
+                    # cancelled while waiting
+                    heapq.heappop(queue)
+                if queue:
+                    entry = heapq.heappop(queue)
+                    break
+
+            if entry is None:
+                break
+
+            tag, _, user_id, waiter = entry
+            self._clock = max(self._clock, tag)
+            self._dequeued(user_id)
+            self.in_flight += 1
+            waiter.set_result(None)
+
+        metrics.LLM_QUEUED.set(self.queued)
+
+    def _queued(self, user_id: Hashable) -> None:
+        self._depth[user_id] = self._depth.get(user_id, 0) + 1
+        self._last_seen[user_id] = time.monotonic()
+        metrics.LLM_USER_QUEUED.labels(str(user_id)).set(self._depth[user_id])
+
+    def _dequeued(self, user_id: Hashable) -> None:
+        self._depth[user_id] -= 1
+        if self._depth[user_id]:
+            metrics.LLM_USER_QUEUED.labels(str(user_id)).set(self._depth[user_id])
+        else:
+            metrics.remove_series(metrics.LLM_USER_QUEUED, str(user_id))
+
+    def _record_wait(self, user_id: Hashable, priority: str, seconds: float) -> None:
+        wait = self._waits.setdefault(user_id, {"count": 0, "sum": 0.0, "max": 0.0})
+        wait["count"] += 1
+        wait["sum"] += seconds
+        wait["max"] = max(wait["max"], seconds)
+        metrics.LLM_USER_QUEUE_WAIT.labels(str(user_id)).observe(seconds)
+        metrics.LLM_QUEUE_WAIT.labels(priority).observe(seconds)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, priority: str = INTERACTIVE):
+        # virtual finish time: one unit of work, scaled down by the user's
+        # weight, after the later of now and this user's previous call
+        start = max(self._clock, self._finish.get(user_id, 0.0))
+        tag = start + 1 / self.weight(user_id)
+        self._finish[user_id] = tag
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (tag, next(self._seq), user_id, waiter))
+        self._queued(user_id)
+
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted just before we were cancelled
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                waiter.cancel()
+                self._dequeued(user_id)
+                metrics.LLM_QUEUED.set(self.queued)
+            raise
+
+        started_at = time.monotonic()
+        self._record_wait(user_id, priority, started_at - queued_at)
+        stats.observe("queue_wait", started_at - queued_at)
+        try:
+            yield
+        finally:
+            self._service["count"] += 1
+            self._service["sum"] += time.monotonic() - started_at
+            self.in_flight -= 1
+            self._dispatch()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queue_depth": {
+                str(user_id): depth for user_id, depth in self._depth.items() if depth
+            },
+            "wait_seconds": {
+                str(user_id): {
+                    **wait,
+                    "avg": wait["sum"] / wait["count"] if wait["count"] else 0.0,
+                }
+                for user_id, wait in self._waits.items()
+            },
+        }
+
+
+scheduler = FairScheduler(limiter=limiter)
+stats.register("scheduler", scheduler.snapshot)
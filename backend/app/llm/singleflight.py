@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from opentelemetry import trace
+
+from app.llm import stats
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers asking for a key that
+    is already running wait for that call and share its result instead of
+    starting their own. The call is only cancelled once every caller waiting
+    on it has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, dict] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(fn()), "waiters": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+        else:
+            stats.incr("coalesced_requests")
+            # the work shows up in the trace of the request that started it
+            trace.get_current_span().add_event("coalesced")
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                call["task"].cancel()
+
+    def _forget(self, key: Hashable, call: dict) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "waiters": sum(call["waiters"] for call in self._calls.values()),
+            "max_waiters": max(
+                (call["waiters"] for call in self._calls.values()), default=0
+            ),
+        }
+
+
+analyses = SingleFlight()
+stats.register("singleflight", analyses.snapshot)
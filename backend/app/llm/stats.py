@@ -0,0 +1,55 @@
+import threading
+from typing import Callable, Dict
+
+from app import metrics
+
+# in-process counters for the llm subsystem, served from /analyze/stats and
+# mirrored to prometheus
+
+_lock = threading.Lock()
+_timings: Dict[str, dict] = {}
+_counters: Dict[str, float] = {}
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def incr(name: str, amount: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    metrics.LLM_EVENTS.labels(name).inc(amount)
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["sum"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+    metrics.LLM_DURATIONS.labels(name).observe(seconds)
+
+
+def register(name: str, provider: Callable[[], dict]) -> None:
+    """Add a section to the snapshot that is computed when it's read."""
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    with _lock:
+        timings = {
+            name: {
+                **timing,
+                "avg": timing["sum"] / timing["count"] if timing["count"] else 0.0,
+            }
+            for name, timing in _timings.items()
+        }
+        counters = dict(_counters)
+
+    res = {"counters": counters, "timings": timings}
+    for name, provider in _providers.items():
+        res[name] = provider()
+    return res
+
+
+def reset() -> None:
+    with _lock:
+        _timings.clear()
+        _counters.clear()
@@ -0,0 +1,87 @@
+import math
+import os
+from typing import Optional
+
+# rough average for english prose on llama/qwen style tokenizers. We only need
+# an estimate to size the context window, ollama reports the exact count back.
+CHARS_PER_TOKEN = 4
+
+# context window each model supports. Anything not listed gets the default.
+MODEL_CONTEXT_WINDOWS = {
+    "deepseek-r1:1.5b": 131072,
+    "deepseek-r1:7b": 131072,
+    "deepseek-r1:8b": 131072,
+    "deepseek-r1:14b": 131072,
+    "llama3.2:1b": 131072,
+    "llama3.2:3b": 131072,
+    "llama3.1:8b": 131072,
+    "qwen2.5:1.5b": 32768,
+    "qwen2.5:3b": 32768,
+    "qwen2.5:7b": 32768,
+    "gemma2:2b": 8192,
+    "phi3:mini": 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# upper bound on what we ask ollama for regardless of the model, the kv cache
+# grows with num_ctx so this is effectively a gpu memory limit
+MAX_NUM_CTX = int(os.getenv("LLM_MAX_NUM_CTX", "32768"))
+MIN_NUM_CTX = 2048
+
+# tokens kept free for the model's answer
+RESPONSE_TOKEN_RESERVE = int(os.getenv("LLM_RESPONSE_TOKEN_RESERVE", "2048"))
+
+TRUNCATION_MARKER = "\n\n[... content truncated to fit the model context ...]"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def context_window(model: str) -> int:
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def max_num_ctx(model: str) -> int:
+    return min(context_window(model), MAX_NUM_CTX)
+
+
+def size_num_ctx(tokens: int, model: str) -> int:
+    # round up to a power of two. Ollama reloads the model whenever num_ctx
+    # changes, so we only ever hand out a handful of distinct sizes.
+    num_ctx = MIN_NUM_CTX
+    while num_ctx < tokens:
+        num_ctx *= 2
+    return min(num_ctx, max_num_ctx(model))
+
+
+def fit_content(
+    content: str,
+    overhead_tokens: int,
+    model: str,
+    reserve_tokens: int = RESPONSE_TOKEN_RESERVE,
+) -> tuple[str, dict]:
+    """
+    Trim content so that it plus the rest of the prompt and the response
+    reserve fit in the model's context, and pick num_ctx for the request.
+    Returns the (possibly trimmed) content and a report for the result payload.
+    """
+    content_tokens = estimate_tokens(content)
+    available = max_num_ctx(model) - overhead_tokens - reserve_tokens
+
+    truncated = content_tokens > available
+    if truncated:
+        keep_chars = max(available, 0) * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+        content = content[: max(keep_chars, 0)] + TRUNCATION_MARKER
+
+    prompt_tokens = overhead_tokens + estimate_tokens(content)
+
+    return content, {
+        "prompt_tokens": prompt_tokens,
+        "num_ctx": size_num_ctx(prompt_tokens + reserve_tokens, model),
+        "truncated": truncated,
+        "content_tokens": content_tokens,
+        "dropped_tokens": max(content_tokens - available, 0) if truncated else 0,
+    }
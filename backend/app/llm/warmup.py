@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+
+from app.llm import stats
+from app.llm.config import LLM_API_URL, LLM_KEEP_ALIVE, LLM_WARMUP
+from app.llm.routing import configured_models
+from app.tracing import instrument_client, tracer
+
+logger = logging.getLogger(__name__)
+
+# school hours during which models are kept loaded, e.g. "07:00-16:00".
+# Empty disables the keep-warm loop.
+LLM_WARM_HOURS = os.getenv("LLM_WARM_HOURS", "")
+LLM_WARM_DAYS = os.getenv("LLM_WARM_DAYS", "mon-fri")
+LLM_WARM_INTERVAL = int(os.getenv("LLM_WARM_INTERVAL", "240"))
+
+# a generation whose model load took longer than this counts as cold
+COLD_LOAD_SECONDS = 1.0
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+_task: Optional[asyncio.Task] = None
+
+
+def parse_days(value: str) -> set:
+    days = set()
+    for part in value.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (DAYS.index(d.strip()) for d in part.split("-"))
+            days.update(range(start, end + 1))
+        else:
+            days.add(DAYS.index(part))
+    return days
+
+
+def parse_hours(value: str) -> Optional[tuple[int, int]]:
+    """Returns the window as minutes since midnight, or None when unset."""
+    if not value.strip():
+        return None
+
+    start, end = value.split("-")
+
+    def minutes(t: str) -> int:
+        hours, mins = t.strip().split(":")
+        return int(hours) * 60 + int(mins)
+
+    return minutes(start), minutes(end)
+
+
+def in_warm_window(now: datetime, hours: str, days: str) -> bool:
+    window = parse_hours(hours)
+    if window is None or now.weekday() not in parse_days(days):
+        return False
+    minute = now.hour * 60 + now.minute
+    return window[0] <= minute < window[1]
+
+
+def warm_keep_alive() -> str:
+    # long enough to last until the next ping, with some slack
+    return f"{LLM_WARM_INTERVAL * 2}s"
+
+
+async def preload_models(models: List[str], keep_alive: Optional[str]) -> None:
+    """
+    A generate request without a prompt makes ollama load the model and
+    return without generating anything.
+    """
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
+        instrument_client(client)
+        for model in models:
+            payload = {"model": model}
+            if keep_alive:
+                payload["keep_alive"] = keep_alive
+            try:
+                # runs outside any request, so every preload is its own trace
+                with tracer.start_as_current_span(
+                    "llm.preload", attributes={"llm.model": model}
+                ):
+                    response = await client.post(LLM_API_URL, json=payload)
+                if response.status_code != 200:
+                    logger.warning(
+                        f"Preloading {model} returned status code {response.status_code}"
+                    )
+                    continue
+                stats.incr("preloads")
+            except Exception as e:
+                logger.warning(f"Error preloading {model}: {str(e)}")
+
+
+async def keep_warm_loop() -> None:
+    models = configured_models()
+    logger.info(f"Preloading LLM models {models}")
+    await preload_models(models, LLM_KEEP_ALIVE)
+
+    if parse_hours(LLM_WARM_HOURS) is None:
+        return
+
+    while True:
+        if in_warm_window(datetime.now(), LLM_WARM_HOURS, LLM_WARM_DAYS):
+            await preload_models(models, warm_keep_alive())
+        await asyncio.sleep(LLM_WARM_INTERVAL)
+
+
+def start_warmup() -> None:
+    global _task
+    if LLM_WARMUP and _task is None:
+        _task = asyncio.create_task(keep_warm_loop())
+
+
+async def stop_warmup() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+
+
+def record_load(result: dict) -> dict:
+    """
+    Classify a generation as cold or warm from ollama's load_duration and
+    record its latency. Returns the latency summary for the result payload.
+    """
+    load_s = result.get("load_duration", 0) / 1e9
+    total_s = result.get("total_duration", 0) / 1e9
+    cold = load_s > COLD_LOAD_SECONDS
+
+    stats.observe("cold_generation" if cold else "warm_generation", total_s)
+
+    return {"total_s": total_s, "load_s": load_s, "cold": cold}
@@ -1,4 +1,4 @@
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Response
 import os
 from sqlmodel import create_engine, Session, SQLModel, select
 from dotenv import load_dotenv
@@ -8,15 +8,27 @@ from fastapi.middleware.cors import CORSMiddleware
 
 
 from . import models
-from .database import create_db_and_tables, get_session
+from .database import create_db_and_tables, engine, get_session
+from .metrics import MetricsMiddleware, render
+from .queries import QueryCountMiddleware
+from .timing import TimingMiddleware
+from .upload_limits import RequestSizeLimitMiddleware
+from . import search_index, tracing
 
-from .routers import users, auth, assignments, files, analyze
+from .routers import users, auth, assignments, files, analyze, uploads, search
+from .llm.warmup import start_warmup, stop_warmup
 
 load_dotenv()
 
 
 # app = FastAPI(dependencies=[Depends()])
 app = FastAPI()
+# innermost, so metrics and timing still see the requests it turns away
+app.add_middleware(RequestSizeLimitMiddleware, paths=["/assignments/submit"])
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TimingMiddleware)
+app.add_middleware(QueryCountMiddleware)
+tracing.instrument_app(app)
 
 
 # app.add_middleware(
@@ -37,6 +49,8 @@ app.include_router(auth.router)
 app.include_router(assignments.router)
 app.include_router(files.router)
 app.include_router(analyze.router)
+app.include_router(uploads.router)
+app.include_router(search.router)
 
 
 @app.on_event("startup")
@@ -44,6 +58,56 @@ def on_startup():
     create_db_and_tables()
 
 
+@app.on_event("startup")
+def start_tracing():
+    # statements are traced once tracing is configured, however that was done
+    tracing.instrument_engine(engine)
+
+
+@app.on_event("startup")
+async def start_llm_warmup():
+    # preloads the models in the background so startup isn't held up by ollama
+    start_warmup()
+
+
+@app.on_event("startup")
+async def start_upload_cleanup():
+    uploads.start_upload_cleanup()
+
+
+@app.on_event("startup")
+async def start_search_indexer():
+    # indexes files stored while the app was down, then new ones as they come
+    search_index.start_indexer()
+
+
+@app.on_event("shutdown")
+async def stop_search_indexer():
+    await search_index.stop_indexer()
+
+
+@app.on_event("shutdown")
+async def stop_upload_cleanup():
+    await uploads.stop_upload_cleanup()
+
+
+@app.on_event("shutdown")
+async def stop_llm_warmup():
+    await stop_warmup()
+
+
+@app.on_event("shutdown")
+def stop_tracing():
+    # flushes the spans still waiting to be exported
+    tracing.shutdown()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render()
+    return Response(body, media_type=content_type)
+
+
 @app.get("/")
 async def root():
     return {"message": "API Root"}
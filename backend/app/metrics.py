@@ -0,0 +1,209 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    Summary,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+# with several workers every process writes its samples to files in
+# PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them, so it doesn't matter
+# which worker serves the scrape
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ["statement"])
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Database connections currently in use",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity",
+    "Connections the pool can hand out, overflow included",
+    multiprocess_mode="livesum",
+)
+
+UPLOAD_BYTES = Counter("upload_bytes_written_total", "Bytes of uploads written")
+FILE_BYTES_SERVED = Counter("file_bytes_served_total", "Bytes of files downloaded")
+
+PDF_PAGE_EXTRACTION = Histogram(
+    "pdf_page_extraction_seconds",
+    "Time to extract the text of one PDF page",
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Model load plus prompt evaluation time reported by ollama",
+    ["model"],
+    buckets=LLM_BUCKETS,
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_generation_tokens_per_second",
+    "Generation speed reported by ollama",
+    ["model"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 40, 60, 80, 120, 200),
+)
+
+# mirrors of the llm stats counters and timings, see app/llm/stats.py
+LLM_EVENTS = Counter("llm_events_total", "LLM subsystem events", ["event"])
+LLM_DURATIONS = Histogram(
+    "llm_duration_seconds",
+    "LLM subsystem timings, including queue waits",
+    ["name"],
+    buckets=LLM_BUCKETS,
+)
+
+LLM_IN_FLIGHT = Gauge(
+    "llm_in_flight", "Outbound LLM calls in progress", multiprocess_mode="livesum"
+)
+LLM_QUEUED = Gauge(
+    "llm_queued", "LLM calls waiting for a slot", multiprocess_mode="livesum"
+)
+# per user series only exist while the user has calls queued, or until the
+# scheduler forgets an idle user, so the label stays bounded by the queue
+# limit and the teachers active recently
+LLM_USER_QUEUED = Gauge(
+    "llm_user_queued",
+    "LLM calls waiting for a slot per user",
+    ["user"],
+    multiprocess_mode="livesum",
+)
+LLM_USER_QUEUE_WAIT = Summary(
+    "llm_user_queue_wait_seconds", "Time LLM calls waited for a slot per user", ["user"]
+)
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls waited for a slot",
+    ["priority"],
+    buckets=LLM_BUCKETS,
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "llm_concurrency_limit",
+    "Current adaptive concurrency limit",
+    multiprocess_mode="liveall",
+)
+
+
+def remove_series(metric, *labels) -> None:
+    """Drop a labelled series, if it was ever set."""
+    try:
+        metric.remove(*labels)
+    except KeyError:
+        pass
+
+
+def statement_type(statement: str) -> str:
+    # label by verb only, full statements would be unbounded cardinality
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def instrument_engine(engine) -> None:
+    """Count and time every statement run through the engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        kind = statement_type(statement)
+        DB_QUERIES.labels(kind).inc()
+        DB_QUERY_DURATION.labels(kind).observe(elapsed)
+
+    # a pool running at capacity makes requests queue for a connection
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        DB_POOL_CAPACITY.inc(size() + max(getattr(engine.pool, "_max_overflow", 0), 0))
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+
+def observe_generation(model: str, result: dict) -> None:
+    """Record ollama's own timings for a finished generation."""
+    first_token_ns = result.get("load_duration", 0) + result.get(
+        "prompt_eval_duration", 0
+    )
+    if first_token_ns:
+        LLM_TIME_TO_FIRST_TOKEN.labels(model).observe(first_token_ns / 1e9)
+
+    eval_ns = result.get("eval_duration", 0)
+    if eval_ns and result.get("eval_count"):
+        LLM_TOKENS_PER_SECOND.labels(model).observe(
+            result["eval_count"] / (eval_ns / 1e9)
+        )
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request, labelled by the route template so that ids in
+    paths don't blow up the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status["code"]),
+            ).observe(time.perf_counter() - started_at)
+
+
+def render() -> tuple[bytes, str]:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,11 +1,22 @@
 from typing import Annotated, Optional, List
 import uuid
 from enum import Enum
-from datetime import datetime
-
-from sqlmodel import Field, SQLModel, Relationship, Column, JSON, ARRAY, String, UUID
+from datetime import datetime, timezone
+
+from sqlmodel import (
+    Field,
+    SQLModel,
+    Relationship,
+    Column,
+    ARRAY,
+    String,
+    UUID,
+    BigInteger,
+)
 
 from pydantic import field_validator
+from sqlalchemy import Computed, Index, LargeBinary, Text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 
 
 class RoleEnum(str, Enum):
@@ -86,6 +97,10 @@ class AssignmentBase(SQLModel):
     description: Optional[str] = None
     due_date: Optional[datetime] = None
     student_ids: List[uuid.UUID] = Field(default=[], sa_column=Column(ARRAY(UUID)))
+    # upload limits per submission, unset means the server defaults
+    max_files: Optional[int] = Field(default=None, ge=0)
+    max_file_bytes: Optional[int] = Field(default=None, ge=0, sa_type=BigInteger)
+    max_total_bytes: Optional[int] = Field(default=None, ge=0, sa_type=BigInteger)
 
 
 class Assignment(AssignmentBase, table=True):
@@ -116,7 +131,7 @@ class AssignmentUpdate(AssignmentBase):
 class SubmissionBase(SQLModel):
     comment: Optional[str] = None
     assignment_id: Optional[uuid.UUID] = Field(
-        default=None, foreign_key="assignment.id"
+        default=None, foreign_key="assignment.id", index=True
     )
     student_id: uuid.UUID = Field(foreign_key="user.id")
 
@@ -166,6 +181,7 @@ class File(FileBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     filepath: str = Field(...)
     content_type: str = Field(...)
+    size: Optional[int] = Field(default=None, sa_type=BigInteger)
 
     submission: Optional["Submission"] = Relationship(back_populates="files")
 
@@ -190,8 +206,147 @@ class FilePopulated(FileBase):
 
 
 class AnalyticBase(SQLModel):
-    data: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # results keyed by file name, JSONB so they can be queried and updated
+    # one file at a time in the database. None is stored as SQL NULL rather
+    # than a JSON null, which jsonb_set can't add keys to
+    data: Optional[dict] = Field(
+        default=None, sa_column=Column(JSONB(none_as_null=True))
+    )
 
 
 class Analytic(AnalyticBase, table=True):
+    # jsonb_ops rather than jsonb_path_ops, only it can serve the $.* paths
+    # that match any file's result
+    __table_args__ = (Index("ix_analytic_data", "data", postgresql_using="gin"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+
+
+class AnalyticResult(SQLModel):
+    """One file's result from an analytic, with where it came from."""
+
+    analytic_id: uuid.UUID
+    submission_id: uuid.UUID
+    assignment_id: uuid.UUID
+    student_id: uuid.UUID
+    student_name: str
+    file_name: str
+    result: dict
+
+
+class AnalyticResults(SQLModel):
+    total: int
+    limit: int
+    offset: int
+    results: List[AnalyticResult] = []
+
+
+class UploadSessionBase(SQLModel):
+    assignment_id: uuid.UUID = Field(foreign_key="assignment.id")
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: Optional[str] = None
+    size: int = Field(..., ge=0, sa_type=BigInteger)
+    # hex sha256 of the whole file, checked on finalize when given
+    sha256: Optional[str] = Field(default=None, min_length=64, max_length=64)
+    # attach to an existing submission instead of creating a new one
+    submission_id: Optional[uuid.UUID] = Field(
+        default=None, foreign_key="submission.id"
+    )
+    comment: Optional[str] = None
+
+
+class UploadSession(UploadSessionBase, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    student_id: uuid.UUID = Field(foreign_key="user.id")
+    # bytes received so far, the next chunk has to start here
+    offset: int = Field(default=0, sa_type=BigInteger)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True
+    )
+
+
+class UploadSessionCreate(UploadSessionBase):
+    pass
+
+
+# text search configuration the index is built with, changing it needs the
+# filecontent table recreated
+SEARCH_CONFIG = "english"
+
+
+class FileContent(SQLModel, table=True):
+    """Extracted text of a file, kept for full-text search."""
+
+    __table_args__ = (
+        Index("ix_filecontent_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    file_id: uuid.UUID = Field(foreign_key="file.id", primary_key=True)
+    text: str = Field(default="", sa_type=Text)
+    search_vector: Optional[str] = Field(
+        default=None,
+        sa_column=Column(
+            TSVECTOR,
+            Computed(
+                f"to_tsvector('{SEARCH_CONFIG}'::regconfig, text)", persisted=True
+            ),
+        ),
+    )
+    indexed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class SearchHit(SQLModel):
+    file_id: uuid.UUID
+    filename: str
+    submission_id: uuid.UUID
+    assignment_id: uuid.UUID
+    student_id: uuid.UUID
+    student_name: str
+    rank: float
+    # HTML escaped text with the matches wrapped in <mark></mark>
+    headline: str
+
+
+class SearchResults(SQLModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[SearchHit] = []
+
+
+class FileSignature(SQLModel, table=True):
+    """MinHash signature of a file's text, for finding near duplicates."""
+
+    file_id: uuid.UUID = Field(foreign_key="file.id", primary_key=True)
+    # uint32 hash minimums, app.similarity.NUM_PERM of them
+    signature: bytes = Field(sa_type=LargeBinary)
+    shingle_count: int = Field(default=0)
+
+
+class SimilarFile(SQLModel):
+    file_id: uuid.UUID
+    filename: str
+    submission_id: uuid.UUID
+    student_id: uuid.UUID
+    student_name: str
+
+
+class SimilarPair(SQLModel):
+    file_ids: List[uuid.UUID]
+    # estimated Jaccard similarity of the two files' word shingles
+    similarity: float
+
+
+class SimilarityCluster(SQLModel):
+    files: List[SimilarFile]
+    pairs: List[SimilarPair]
+    max_similarity: float
+
+
+class SimilarityReport(SQLModel):
+    assignment_id: uuid.UUID
+    threshold: float
+    files_compared: int
+    clusters: List[SimilarityCluster] = []
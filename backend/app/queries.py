@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+# the same statement shape run this many times in one request is reported as
+# a possible N+1, usually a lazy relationship loaded row by row
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger(__name__)
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    # statements are parameterized already, literals are folded in case a
+    # query was built by hand
+    return WHITESPACE_RE.sub(" ", LITERAL_RE.sub("?", statement)).strip()
+
+
+class QueryLog:
+    """Statements counted while a request or a test block runs."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict:
+        """Statement shapes run at least threshold times."""
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_request_log: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+# process wide logs, the test client runs the app in another thread so a
+# context variable set in the test wouldn't be seen
+_captures: List[QueryLog] = []
+
+
+@contextmanager
+def capture():
+    """Count every statement run in the process while the block runs."""
+    log = QueryLog()
+    _captures.append(log)
+    try:
+        yield log
+    finally:
+        _captures.remove(log)
+
+
+@contextmanager
+def assert_max_queries(budget: int):
+    """Fail when the block runs more than budget statements."""
+    with capture() as log:
+        yield log
+
+    if log.count > budget:
+        shapes = "\n".join(f"  {n}x {shape}" for shape, n in log.shapes.most_common())
+        raise AssertionError(f"{log.count} queries run, budget is {budget}:\n{shapes}")
+
+
+def instrument_engine(engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_log_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_log_started_at"].pop()
+        log = _request_log.get()
+        if log is not None:
+            log.record(statement, elapsed)
+        for log in _captures:
+            log.record(statement, elapsed)
+
+
+class QueryCountMiddleware:
+    """
+    Counts the statements of each request and logs the ones that repeat a
+    statement shape often enough to look like an N+1.
+    """
+
+    def __init__(self, app, threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = _request_log.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_log.reset(token)
+            repeated = log.repeated(self.threshold)
+            if repeated:
+                route = scope.get("route")
+                logger.warning(
+                    json.dumps(
+                        {
+                            "message": "possible N+1 queries",
+                            "method": scope["method"],
+                            "route": getattr(route, "path", scope["path"]),
+                            "queries": log.count,
+                            "ms": round(log.seconds * 1000, 2),
+                            "repeated": repeated,
+                        }
+                    )
+                )
@@ -1,3 +1,4 @@
+import asyncio
 import re
 from fastapi import (
     APIRouter,
@@ -8,15 +9,18 @@ from fastapi import (
     Form,
     Body,
     Query,
+    Request,
 )
 from sqlmodel import Session, select, or_, text, JSON, cast, literal
-from typing import Annotated, List
+from typing import Annotated, List, Literal, Optional
 import os
 import uuid
 import tempfile
 import shutil
 from ..models import (
     Analytic,
+    AnalyticResult,
+    AnalyticResults,
     File,
     FileCreate,
     User,
@@ -28,12 +32,45 @@ from ..models import (
 from ..database import get_session
 from app.models import Submission
 from app.routers.auth import get_current_user
+from app.analytics import merge_results, query_results, result_condition
+from app.extraction import extract_text
+from app.llm.cancellation import (
+    ClientDisconnected,
+    llm_timeout,
+    request_timeout,
+    run_until_disconnected,
+    set_deadline,
+)
+from app.llm.config import LLM_API_URL, generation_settings
+from app.llm.embeddings import retrieve as retrieve_chunks
+from app.llm import stats
+from app.llm.limiter import limiter
+from app.llm.routing import select_route
+from app.llm.scheduler import BULK, INTERACTIVE, AdmissionError, scheduler
+from app.llm.singleflight import analyses
+from app.llm.warmup import record_load
+from app.metrics import observe_generation
+from app.timing import span
+from app.tracing import instrument_client, tracer
+from app.llm.batching import (
+    BATCH_FILE_MAX_TOKENS,
+    BATCH_MAX_TOKENS,
+    build_batch_prompt,
+    pack_files,
+    split_batch_response,
+)
+from app.llm.tokens import (
+    RESPONSE_TOKEN_RESERVE,
+    estimate_tokens,
+    fit_content,
+    max_num_ctx,
+    size_num_ctx,
+)
 import logging
 import httpx
 
 logger = logging.getLogger(__name__)
 
-LLM_API_URL = os.getenv("LLM_API_URL", "http://10.0.0.52:11434/api/generate")
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -48,100 +85,231 @@ router = APIRouter(
 )
 
 
+def build_document_prefix(file_type: str, file_content: str) -> str:
+    # the document goes first so that every question asked about the same file
+    # shares an identical prompt prefix that ollama can reuse
+    return f"File Type: {file_type}\n\nFile Content:\n{file_content}\n\n"
+
+
+def clean_llm_response(result: dict) -> str:
+    cleaned_analysis = re.sub(
+        r"<think\b[^>]*>.*?</think>",
+        "",
+        result.get("response", ""),
+        flags=re.DOTALL,
+    )
+    return cleaned_analysis.strip()
+
+
 async def llm_analyze(
-    file_record: File, prompt: str = "Please summarize this file"
+    file_record: File,
+    prompt: str = "Please summarize this file",
+    follow_ups: Optional[List[str]] = None,
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+    retrieve: bool = False,
 ) -> dict:
-    file_path = file_record.filepath
-    file_content = ""
+    try:
+        # reading and pdf parsing block, keep them off the event loop
+        file_content, normalization_report = await asyncio.to_thread(
+            extract_text, file_record
+        )
+    except ImportError:
+        logger.error(
+            "pypdf library not installed. Please install it to analyze PDF files."
+        )
+        return {
+            "status": 500,
+            "file_name": file_record.filename,
+            "prompt": prompt,
+            "analysis": "Error: pypdf library required for PDF analysis is not installed.",
+        }
+    except Exception as e:
+        logger.error(f"Error reading file: {str(e)}")
+        return {
+            "status": 500,
+            "file_name": file_record.filename,
+            "prompt": prompt,
+            "analysis": f"Error reading file: {str(e)}",
+        }
+
+    return await analyze_text(
+        file_record,
+        file_content,
+        normalization_report,
+        prompt,
+        follow_ups,
+        think=think,
+        num_predict=num_predict,
+        task=task,
+        retrieve=retrieve,
+    )
+
+
+async def analyze_text(
+    file_record: File,
+    file_content: str,
+    normalization_report: dict,
+    prompt: str,
+    follow_ups: Optional[List[str]] = None,
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+    retrieve: bool = False,
+) -> dict:
+    file_type = (
+        file_record.content_type if file_record.content_type is not None else "text"
+    )
+
+    # the context has to hold the document, the first question and answer and
+    # then one follow-up question and answer at a time
+    follow_ups = follow_ups or []
 
-    # Check if it's a PDF file
-    if file_record.filename.lower().endswith(".pdf"):
+    # questions about a part of a long document only need the parts that
+    # match them. All questions share one selection so follow-ups can keep
+    # reusing the first answer's context
+    retrieval_report = None
+    if retrieve:
         try:
-            # Using pypdf to extract text from PDF
-            import pypdf
-
-            with open(file_path, "rb") as pdf_file:
-                pdf_reader = pypdf.PdfReader(pdf_file)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text:
-                        file_content += page_text + "\n\n"
-
-                if not file_content.strip():
-                    file_content = "This PDF appears to contain no extractable text content. It may consist of scanned images."
-        except ImportError:
-            logger.error(
-                "pypdf library not installed. Please install it to analyze PDF files."
+            file_content, retrieval_report = await retrieve_chunks(
+                file_record.id, file_content, [prompt, *follow_ups]
             )
-            return {
-                "status": 500,
-                "file_name": file_record.filename,
-                "prompt": prompt,
-                "analysis": "Error: pypdf library required for PDF analysis is not installed.",
-            }
         except Exception as e:
-            logger.error(f"Error extracting text from PDF: {str(e)}")
-            file_content = f"Error extracting text from PDF: {str(e)}"
-    else:
-        # Handle text files as before
-        try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-                file_content = file.read()
-        except Exception as e:
-            logger.error(f"Error reading file: {str(e)}")
-            return {
-                "status": 500,
-                "file_name": file_record.filename,
-                "prompt": prompt,
-                "analysis": f"Error reading file: {str(e)}",
-            }
+            logger.warning(
+                f"Retrieval failed for {file_record.filename}, sending all of it: {str(e)}"
+            )
+            retrieval_report = {"used": False, "error": str(e)}
+    overhead_tokens = (
+        estimate_tokens(build_document_prefix(file_type, ""))
+        + estimate_tokens(prompt)
+        + max((estimate_tokens(f) for f in follow_ups), default=0)
+    )
 
-    file_type = (
-        file_record.content_type if file_record.content_type is not None else "text"
+    # small documents and light tasks can go to a smaller, faster model
+    estimated_tokens = overhead_tokens + estimate_tokens(file_content)
+    route, route_index = select_route(estimated_tokens, task)
+    model = route.model
+
+    settings = generation_settings(
+        think if think is not None else route.think, num_predict, route.options
     )
 
-    try:
-        logger.info(
-            f"Sending request to LLM API: {LLM_API_URL} for file {file_record.filename}"
+    answer_tokens = settings["options"].get("num_predict", RESPONSE_TOKEN_RESERVE)
+    reserve_tokens = answer_tokens * (2 if follow_ups else 1)
+    with span("prompt"):
+        file_content, token_report = fit_content(
+            file_content, overhead_tokens, model, reserve_tokens
         )
-
-        llm_prompt = (
-            f"{prompt}\n\nFile Type: {file_type}\n\nFile Content:\n{file_content}"
+    if token_report["truncated"]:
+        logger.warning(
+            f"Truncated {file_record.filename} by ~{token_report['dropped_tokens']} "
+            f"tokens to fit num_ctx {token_report['num_ctx']}"
         )
 
-        print(LLM_API_URL)
+    # num_ctx has to stay the same across follow-ups, ollama reloads the model
+    # (and drops the cached context) when it changes
+    settings["options"]["num_ctx"] = token_report["num_ctx"]
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-            response = await client.post(
-                LLM_API_URL,
-                json={"model": "deepseek-r1:8b", "prompt": llm_prompt, "stream": False},
-            )
+    token_report["prompt_eval_count"] = 0
+    token_report["eval_count"] = 0
+    token_report["kept_tokens"] = 0
+    latency = {"total_s": 0.0, "load_s": 0.0, "cold": False}
 
-        if response.status_code != 200:
-            logger.error(f"LLM API returned status code {response.status_code}")
-            return {
-                "status": response.status_code,
-                "file_name": file_record.filename,
-                "prompt": prompt,
-                "analysis": "Error: Failed to get response from LLM",
-            }
-
-        result = response.json()
-
-        cleaned_analysis = re.sub(
-            r"<think\b[^>]*>.*?</think>",
-            "",
-            result.get("response", ""),
-            flags=re.DOTALL,
+    try:
+        logger.info(
+            f"Sending request to LLM API: {LLM_API_URL} for file {file_record.filename} using {model}"
         )
 
-        return {
-            "status": response.status_code,
+        document_prefix = build_document_prefix(file_type, file_content)
+        document_context = None
+        responses = []
+
+        async with httpx.AsyncClient(timeout=httpx.Timeout(llm_timeout())) as client:
+            instrument_client(client)
+            # follow-up questions continue from the context of the first answer,
+            # so the document is only evaluated once per file. Every follow-up
+            # branches off the same context so questions stay independent.
+            for question in [prompt, *follow_ups]:
+                payload = {"model": model, "stream": False, **settings}
+                if document_context:
+                    payload["prompt"] = question
+                    payload["context"] = document_context
+                else:
+                    payload["prompt"] = f"{document_prefix}{question}"
+
+                async with limiter.acquire(model) as call:
+                    with span("llm"), tracer.start_as_current_span(
+                        "llm.generate",
+                        attributes={
+                            "llm.model": model,
+                            "file.name": file_record.filename,
+                        },
+                    ):
+                        response = await client.post(LLM_API_URL, json=payload)
+
+                    # 5xx and timeouts mean ollama is struggling, back off
+                    call.failed = response.status_code >= 500
+                    if response.status_code == 200:
+                        result = response.json()
+                        call.tokens = result.get("eval_count", 0)
+
+                if response.status_code != 200:
+                    logger.error(f"LLM API returned status code {response.status_code}")
+                    return {
+                        "status": response.status_code,
+                        "file_name": file_record.filename,
+                        "prompt": question,
+                        "analysis": "Error: Failed to get response from LLM",
+                    }
+
+                if not responses:
+                    document_context = result.get("context")
+
+                analysis = clean_llm_response(result)
+                responses.append({"prompt": question, "analysis": analysis})
+
+                # eval_count includes the reasoning, which never reaches the teacher
+                token_report["prompt_eval_count"] += result.get("prompt_eval_count", 0)
+                token_report["eval_count"] += result.get("eval_count", 0)
+                token_report["kept_tokens"] += estimate_tokens(analysis)
+
+                load = record_load(result)
+                observe_generation(model, result)
+                latency["total_s"] += load["total_s"]
+                latency["load_s"] += load["load_s"]
+                latency["cold"] = latency["cold"] or load["cold"]
+
+        token_report["discarded_tokens"] = max(
+            token_report["eval_count"] - token_report["kept_tokens"], 0
+        )
+        logger.info(
+            f"{file_record.filename}: generated {token_report['eval_count']} tokens, "
+            f"kept ~{token_report['kept_tokens']}"
+        )
+
+        res = {
+            "status": 200,
             "file_name": file_record.filename,
             "prompt": prompt,
-            "analysis": cleaned_analysis.strip(),
+            "analysis": responses[0]["analysis"],
+            # recorded so a result can be reproduced with the same model
+            "model": model,
+            "route": {
+                "rule": route_index,
+                "task": task,
+                "estimated_tokens": estimated_tokens,
+            },
+            "tokens": token_report,
+            "latency": latency,
+            "normalization": normalization_report,
         }
+        if follow_ups:
+            res["responses"] = responses
+        if retrieval_report is not None:
+            res["retrieval"] = retrieval_report
+
+        return res
 
     except Exception as e:
         logger.error(f"Error during LLM analysis: {str(e)}")
@@ -153,6 +321,285 @@ async def llm_analyze(
         }
 
 
+async def analyze_packed(
+    documents: List[tuple[File, str, dict]],
+    prompt: str,
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Analyze several small files with a single request. Returns results keyed
+    by file name, or None when the request fails or the response can't be
+    split back into one answer per file.
+    """
+    names = [file_record.filename for file_record, _, _ in documents]
+    batch_prompt = build_batch_prompt(
+        prompt,
+        [
+            (file_record.filename, file_record.content_type or "text", content)
+            for file_record, content, _ in documents
+        ],
+    )
+
+    estimated_tokens = estimate_tokens(batch_prompt)
+    route, route_index = select_route(estimated_tokens, task)
+    model = route.model
+
+    settings = generation_settings(
+        think if think is not None else route.think, num_predict, route.options
+    )
+    answer_tokens = settings["options"].get("num_predict", RESPONSE_TOKEN_RESERVE)
+    needed_tokens = estimated_tokens + answer_tokens * len(documents)
+    if needed_tokens > max_num_ctx(model):
+        # routed to a model too small for the pack, ollama would cut it short
+        logger.warning(
+            f"Packed request for files {names} needs ~{needed_tokens} tokens, "
+            f"more than {model} holds"
+        )
+        return None
+    settings["options"]["num_ctx"] = size_num_ctx(needed_tokens, model)
+
+    try:
+        logger.info(
+            f"Sending batched request to LLM API: {LLM_API_URL} for files {names} using {model}"
+        )
+
+        async with httpx.AsyncClient(timeout=httpx.Timeout(llm_timeout())) as client:
+            instrument_client(client)
+            async with limiter.acquire(model) as call:
+                with span("llm"), tracer.start_as_current_span(
+                    "llm.generate_batch",
+                    attributes={"llm.model": model, "llm.files": len(names)},
+                ):
+                    response = await client.post(
+                        LLM_API_URL,
+                        json={
+                            "model": model,
+                            "prompt": batch_prompt,
+                            "stream": False,
+                            **settings,
+                        },
+                    )
+
+                call.failed = response.status_code >= 500
+                if response.status_code == 200:
+                    result = response.json()
+                    call.tokens = result.get("eval_count", 0)
+
+        if response.status_code != 200:
+            logger.error(f"LLM API returned status code {response.status_code}")
+            return None
+    except Exception as e:
+        logger.error(f"Error during batched LLM analysis: {str(e)}")
+        return None
+
+    latency = record_load(result)
+    observe_generation(model, result)
+
+    answers = split_batch_response(clean_llm_response(result), names)
+    if answers is None:
+        logger.warning(f"Could not split batched response for files {names}")
+        return None
+
+    # token counts are for the whole batch, shared by every file in it
+    token_report = {
+        "prompt_tokens": estimated_tokens,
+        "num_ctx": settings["options"]["num_ctx"],
+        "truncated": False,
+        "prompt_eval_count": result.get("prompt_eval_count", 0),
+        "eval_count": result.get("eval_count", 0),
+        "kept_tokens": sum(estimate_tokens(a) for a in answers.values()),
+    }
+    token_report["discarded_tokens"] = max(
+        token_report["eval_count"] - token_report["kept_tokens"], 0
+    )
+
+    return {
+        file_record.filename: {
+            "status": 200,
+            "file_name": file_record.filename,
+            "prompt": prompt,
+            "analysis": answers[file_record.filename],
+            "model": model,
+            "route": {
+                "rule": route_index,
+                "task": task,
+                "estimated_tokens": estimated_tokens,
+            },
+            "batch": names,
+            "tokens": token_report,
+            "latency": latency,
+            "normalization": normalization_report,
+        }
+        for file_record, _, normalization_report in documents
+    }
+
+
+def pack_room(
+    prompt: str,
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+) -> tuple[int, int]:
+    """
+    Tokens a packed request has for file content and answers, in the context
+    of the model a full pack is routed to, and how many each answer takes.
+    """
+    route, _ = select_route(BATCH_MAX_TOKENS, task)
+    settings = generation_settings(
+        think if think is not None else route.think, num_predict, route.options
+    )
+    answer_tokens = settings["options"].get("num_predict", RESPONSE_TOKEN_RESERVE)
+    room = max_num_ctx(route.model) - estimate_tokens(build_batch_prompt(prompt, []))
+    return room, answer_tokens
+
+
+async def llm_analyze_batch(
+    user_id: uuid.UUID,
+    file_records: List[File],
+    prompt: str,
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+    priority: str = INTERACTIVE,
+) -> dict:
+    """
+    Analyze files with one prompt, packing small files into shared requests
+    up to BATCH_MAX_TOKENS and what the model's context holds. Larger files,
+    files that fail to read and packed requests whose response can't be split
+    are analyzed one file at a time. Every LLM call waits for its own
+    scheduler slot. Returns results keyed by file name, in submission order.
+    """
+    results = {}
+    small_files = []
+
+    async def analyze_one(file_record, file_content, normalization_report):
+        async with scheduler.slot(user_id, priority):
+            return await analyze_text(
+                file_record,
+                file_content,
+                normalization_report,
+                prompt,
+                think=think,
+                num_predict=num_predict,
+                task=task,
+            )
+
+    for file_record in file_records:
+        try:
+            file_content, normalization_report = await asyncio.to_thread(
+                extract_text, file_record
+            )
+        except Exception:
+            # llm_analyze reports the read error
+            async with scheduler.slot(user_id, priority):
+                results[file_record.filename] = await llm_analyze(
+                    file_record, prompt, think=think, num_predict=num_predict, task=task
+                )
+            continue
+
+        if estimate_tokens(file_content) > BATCH_FILE_MAX_TOKENS:
+            results[file_record.filename] = await analyze_one(
+                file_record, file_content, normalization_report
+            )
+        else:
+            small_files.append((file_record, file_content, normalization_report))
+
+    # a pack that doesn't fit the context would be cut short without a word
+    room, answer_tokens = pack_room(prompt, think, num_predict, task)
+    groups = pack_files(
+        [estimate_tokens(content) for _, content, _ in small_files],
+        room=room,
+        reserve=answer_tokens,
+    )
+    for group in groups:
+        documents = [small_files[i] for i in group]
+
+        packed = None
+        if len(documents) > 1:
+            async with scheduler.slot(user_id, priority):
+                packed = await analyze_packed(
+                    documents, prompt, think, num_predict, task
+                )
+
+        if packed is not None:
+            results.update(packed)
+            continue
+
+        for file_record, file_content, normalization_report in documents:
+            results[file_record.filename] = await analyze_one(
+                file_record, file_content, normalization_report
+            )
+
+    return {
+        file_record.filename: results[file_record.filename]
+        for file_record in file_records
+    }
+
+
+async def run_analysis(
+    user_id: uuid.UUID,
+    files: List[File],
+    prompts: List[str],
+    think: Optional[bool] = None,
+    num_predict: Optional[int] = None,
+    task: Optional[str] = None,
+    batch: bool = False,
+    priority: str = INTERACTIVE,
+    retrieve: bool = False,
+) -> dict:
+    """
+    Admit and schedule the LLM work for a request. Returns results keyed by
+    file name.
+    """
+    # rejects before any work is done when the teacher is over their rate or
+    # the queue is full. Every prompt is a call per file, follow-ups included
+    try:
+        scheduler.admit(user_id, cost=len(files) * len(prompts))
+    except AdmissionError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    if batch:
+        # small files share requests, results come back per file
+        return await llm_analyze_batch(
+            user_id,
+            files,
+            prompts[0],
+            think=think,
+            num_predict=num_predict,
+            task=task,
+            priority=priority,
+        )
+
+    results = {}
+
+    # no need to thread multiple files, only analyzing a couple of files
+    for file_record in files:
+        # every file waits for its turn, so other teachers' requests are
+        # interleaved with a long running one
+        with tracer.start_as_current_span(
+            "analyze.file", attributes={"file.name": file_record.filename}
+        ):
+            async with scheduler.slot(user_id, priority):
+                # pass it the File object, the first prompt and any follow-ups
+                results[file_record.filename] = await llm_analyze(
+                    file_record,
+                    prompts[0],
+                    prompts[1:],
+                    think=think,
+                    num_predict=num_predict,
+                    task=task,
+                    retrieve=retrieve,
+                )
+
+    return results
+
+
 # async def llm_analyze(
 #     file_record: File, prompt: str = "Please summarize this file"
 # ) -> dict:
@@ -248,7 +695,17 @@ async def create_analytic(
 
 @router.post("/request", response_model=Analytic, status_code=201)
 async def request_analytic(
-    prompt: Annotated[str, Body(embed=True)],
+    request: Request,
+    prompt: Annotated[Optional[str], Body(embed=True)] = None,
+    prompts: Annotated[Optional[List[str]], Body(embed=True)] = None,
+    think: Annotated[Optional[bool], Body(embed=True)] = None,
+    num_predict: Annotated[Optional[int], Body(embed=True, gt=0)] = None,
+    task: Annotated[Optional[str], Body(embed=True)] = None,
+    batch: Annotated[bool, Body(embed=True)] = False,
+    # scripts and bulk runs queue behind a teacher waiting on the page, which
+    # asks for interactive itself
+    priority: Annotated[Literal["interactive", "bulk"], Body(embed=True)] = BULK,
+    retrieve: Annotated[bool, Body(embed=True)] = False,
     submission_id: uuid.UUID = Query(...),
     session: Session = Depends(get_session),
     user: User = Depends(get_current_user),
@@ -270,6 +727,21 @@ async def request_analytic(
             detail="Analytic not found. Try creating an analytic on the requested submission first",
         )
 
+    # a single prompt is the common case, a list lets teachers ask several
+    # questions of the same document while paying for it only once
+    prompts = [p for p in (prompts or [prompt]) if p and p.strip()]
+    if not prompts:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one prompt is required.",
+        )
+
+    if batch and (len(prompts) > 1 or retrieve):
+        raise HTTPException(
+            status_code=422,
+            detail="Batching takes a single prompt and can't be combined with retrieve.",
+        )
+
     files = submission.files
     if len(files) < 1:
         raise HTTPException(
@@ -277,24 +749,110 @@ async def request_analytic(
             detail="No files found in the submission.",
         )
 
-    analytic_data = {}
+    # identical requests running at the same time (a double click, two
+    # co-teachers opening the same submission) share one analysis. The model
+    # and options follow from these and the deployment config.
+    key = (submission.id, tuple(prompts), think, num_predict, task, batch, retrieve)
 
-    # no need to thread multiple files, only analyzing a couple of files
-    for file_record in files:
-        # pass it the File object and the prompt
-        res = await llm_analyze(file_record, prompt)
+    # the deadline follows the work into the llm calls, and the work is
+    # abandoned if the teacher closes the tab before it's done
+    timeout = request_timeout(request.headers.get("X-Request-Timeout"))
+    set_deadline(timeout)
+    try:
+        async with asyncio.timeout(timeout):
+            results = await run_until_disconnected(
+                request,
+                analyses.do(
+                    key,
+                    lambda: run_analysis(
+                        user.id,
+                        files,
+                        prompts,
+                        think=think,
+                        num_predict=num_predict,
+                        task=task,
+                        batch=batch,
+                        priority=priority,
+                        retrieve=retrieve,
+                    ),
+                ),
+            )
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client closed request")
+
+    # only these files' results are replaced, in the database, so requests
+    # for other files or prompts running at the same time aren't lost.
+    # Failures are stored too and can be found through /analyze/results
+    merge_results(session, analytic.id, results)
+    session.commit()
+
+    for file_name, res in results.items():
         if not res.get("status") == 200:
             raise HTTPException(
                 status_code=res.get("status"),
-                detail=f"Error analyzing file {file_record.filename}: {res.get('analysis')}",
+                detail=f"Error analyzing file {file_name}: {res.get('analysis')}",
             )
 
-        analytic_data[file_record.filename] = res
-
-    analytic.data = analytic_data
-
-    session.add(analytic)
-    session.commit()
     session.refresh(analytic)
 
     return analytic
+
+
+@router.get("/results", response_model=AnalyticResults)
+async def get_analytic_results(
+    assignment_id: Optional[uuid.UUID] = None,
+    status: Optional[int] = None,
+    exclude_status: Optional[int] = None,
+    model: Optional[str] = Query(None, max_length=200),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> AnalyticResults:
+    """
+    File results across the analytics of the teacher's assignments, one per
+    file, filtered in the database. exclude_status=200 finds every failed
+    analysis.
+    """
+    if user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can query analytics")
+
+    if assignment_id is not None:
+        assignment = session.get(Assignment, assignment_id)
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+        if assignment.teacher_id != user.id:
+            raise HTTPException(
+                status_code=403, detail="You are not authorized to view this assignment"
+            )
+
+    condition = result_condition(status, exclude_status, model)
+    rows, total = query_results(session, user, condition, assignment_id, limit, offset)
+
+    return AnalyticResults(
+        total=total,
+        limit=limit,
+        offset=offset,
+        results=[
+            AnalyticResult(
+                analytic_id=row.analytic_id,
+                submission_id=row.submission_id,
+                assignment_id=row.assignment_id,
+                student_id=row.student_id,
+                student_name=row.student_name,
+                file_name=row.file_name,
+                result=row.result,
+            )
+            for row in rows
+        ],
+    )
+
+
+@router.get("/stats")
+async def get_llm_stats(user: User = Depends(get_current_user)) -> dict:
+    if user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view stats")
+
+    return stats.snapshot()
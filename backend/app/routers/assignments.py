@@ -6,10 +6,13 @@ from fastapi import (
     HTTPException,
     Form,
     Body,
+    Query,
 )
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select, or_, text, JSON, cast, literal
+from sqlalchemy.orm import selectinload
 import sqlmodel
-from typing import List
+from typing import List, Literal, Optional
 import os
 import uuid
 import tempfile
@@ -22,8 +25,21 @@ from ..models import (
     AssignmentUpdate,
     AssignmentPopulated,
     SubmissionPopulated,
+    SimilarFile,
+    SimilarPair,
+    SimilarityCluster,
+    SimilarityReport,
 )
+from .. import gradebook, search_index, similarity
 from ..database import get_session
+from ..metrics import UPLOAD_BYTES
+from ..upload_limits import (
+    SNIFF_BYTES,
+    LimitedWriter,
+    UploadLimits,
+    UploadRejected,
+    sniff_content_type,
+)
 from app.models import Submission
 from app.routers.auth import get_current_user
 
@@ -65,22 +81,44 @@ async def create_submission(
             status_code=403, detail="You are not assigned to this assignment"
         )
 
+    # the count and declared sizes are known once the form is parsed, check
+    # them before copying anything
+    limits = UploadLimits.for_assignment(assignment)
+    try:
+        limits.check_files(file.size for file in files or [])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
     # create temp directory to store files
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_file_paths = []
+        total_left = limits.max_total_bytes
 
         if files:
             for file in files:
                 if not file.filename:
                     raise HTTPException(status_code=400, detail="File name is required")
 
-                temp_path = os.path.join(temp_dir, file.filename)
+                filename = os.path.basename(file.filename)
+                temp_path = os.path.join(temp_dir, filename)
                 try:
-                    with open(temp_path, "wb") as buffer:
-                        shutil.copyfileobj(file.file, buffer)
-                    temp_file_paths.append(
-                        (temp_path, file.filename, file.content_type)
+                    # tell the type from the first bytes before writing any
+                    head = file.file.read(SNIFF_BYTES)
+                    content_type = sniff_content_type(
+                        filename, head, complete=len(head) < SNIFF_BYTES
                     )
+                    with open(temp_path, "wb") as buffer:
+                        writer = LimitedWriter(
+                            buffer,
+                            min(limits.max_file_bytes, total_left),
+                            f"{filename} goes over the upload size limit",
+                        )
+                        writer.write(head)
+                        shutil.copyfileobj(file.file, writer)
+                    total_left -= writer.written
+                    temp_file_paths.append((temp_path, filename, content_type))
+                except UploadRejected as e:
+                    raise HTTPException(status_code=e.status_code, detail=e.detail)
                 except Exception as e:
                     raise HTTPException(
                         status_code=500, detail=f"Error saving file: {str(e)}"
@@ -106,6 +144,7 @@ async def create_submission(
 
                     # move from tmp to perm storage
                     shutil.copy2(temp_path, perm_path)
+                    UPLOAD_BYTES.inc(os.path.getsize(perm_path))
 
                     print(filename, perm_path)
 
@@ -121,6 +160,7 @@ async def create_submission(
 
             session.commit()
             session.refresh(submission)
+            search_index.notify()
 
             return submission
 
@@ -193,6 +233,47 @@ async def get_assignments(
     # )  # bad line of code
 
 
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@router.get("/export")
+async def export_gradebook(
+    format: Literal["csv", "ndjson"] = "csv",
+    assignment_id: Optional[uuid.UUID] = None,
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Every submission to the teacher's assignments with its student and
+    analysis results, one row per file, streamed as it's read.
+    """
+    if user.role != "teacher":
+        raise HTTPException(
+            status_code=403, detail="Only teachers can export the gradebook"
+        )
+
+    if assignment_id is not None:
+        assignment = session.get(Assignment, assignment_id)
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+        if assignment.teacher_id != user.id:
+            raise HTTPException(
+                status_code=403, detail="You are not authorized to view this assignment"
+            )
+
+    statement = gradebook.export_statement(user.id, assignment_id)
+    write = gradebook.stream_csv if format == "csv" else gradebook.stream_ndjson
+
+    return StreamingResponse(
+        write(session.get_bind(), statement),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="gradebook.{format}"'},
+    )
+
+
 @router.get("/{assignment_id}", response_model=AssignmentPopulated)
 async def get_assignment(
     assignment_id: uuid.UUID,
@@ -220,6 +301,13 @@ async def get_assignment(
     )
 
 
+SUBMISSION_RELATIONS = (
+    selectinload(Submission.student),
+    selectinload(Submission.files),
+    selectinload(Submission.analytic),
+)
+
+
 @router.get("/{assignment_id}/submissions", response_model=List[SubmissionPopulated])
 async def get_assignment_submissions(
     assignment_id: uuid.UUID,
@@ -236,8 +324,12 @@ async def get_assignment_submissions(
                 status_code=403, detail="You are not authorized to view this assignment"
             )
 
+        # the response includes every submission's student, files and
+        # analytic, load them up front instead of once per submission
         submissions = session.exec(
-            select(Submission).where(Submission.assignment_id == assignment_id)
+            select(Submission)
+            .where(Submission.assignment_id == assignment_id)
+            .options(*SUBMISSION_RELATIONS)
         ).all()
 
         return submissions
@@ -248,10 +340,12 @@ async def get_assignment_submissions(
             )
 
         submissions = session.exec(
-            select(Submission).where(
+            select(Submission)
+            .where(
                 Submission.assignment_id == assignment_id,
                 Submission.student_id == user.id,
             )
+            .options(*SUBMISSION_RELATIONS)
         ).all()
 
         # remove analytics_id and analytics from the response
@@ -259,6 +353,58 @@ async def get_assignment_submissions(
     return submissions
 
 
+@router.get("/{assignment_id}/similarity", response_model=SimilarityReport)
+async def get_assignment_similarity(
+    assignment_id: uuid.UUID,
+    threshold: float = Query(
+        similarity.SIMILARITY_THRESHOLD, ge=similarity.MIN_THRESHOLD, le=1
+    ),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> SimilarityReport:
+    """
+    Groups of near duplicate files submitted by different students, most
+    similar first. Files are compared by the word shingles they share.
+    """
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    if user.role != "teacher" or assignment.teacher_id != user.id:
+        raise HTTPException(
+            status_code=403, detail="You are not authorized to view this assignment"
+        )
+
+    rows, clusters = similarity.assignment_clusters(session, assignment_id, threshold)
+
+    def similar_file(i: int) -> SimilarFile:
+        _, file_id, filename, submission_id, student_id, student_name = rows[i]
+        return SimilarFile(
+            file_id=file_id,
+            filename=filename,
+            submission_id=submission_id,
+            student_id=student_id,
+            student_name=student_name,
+        )
+
+    return SimilarityReport(
+        assignment_id=assignment_id,
+        threshold=threshold,
+        files_compared=len(rows),
+        clusters=[
+            SimilarityCluster(
+                files=[similar_file(i) for i in cluster["files"]],
+                pairs=[
+                    SimilarPair(file_ids=[rows[a][1], rows[b][1]], similarity=estimate)
+                    for a, b, estimate in cluster["pairs"]
+                ],
+                max_similarity=max(estimate for _, _, estimate in cluster["pairs"]),
+            )
+            for cluster in clusters
+        ],
+    )
+
+
 @router.put("/{assignment_id}", response_model=Assignment)
 async def update_assignment(
     assignment_id: uuid.UUID,
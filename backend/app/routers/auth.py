@@ -6,6 +6,7 @@ from pydantic import BaseModel
 
 from app.models import UserCreate, UserPublic, User, RoleEnum
 from ..database import SessionDep, get_session
+from ..timing import span
 from datetime import datetime, timedelta, timezone
 
 from fastapi import Depends, HTTPException, status, APIRouter, Request
@@ -58,25 +59,26 @@ def create_access_token(data, expires_delta: Optional[timedelta] = None) -> str:
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)], db: SessionDep
 ) -> User:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-
-        user_id: uuid.UUID = uuid.UUID(payload.get("sub"))
-        if user_id is None:
+    with span("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+            user_id: uuid.UUID = uuid.UUID(payload.get("sub"))
+            if user_id is None:
+                raise HTTPException(
+                    status_code=401, detail="Invalid authentication credentials"
+                )
+            token_data = TokenData(id=user_id, role=payload.get("role"))
+        except Exception as e:
             raise HTTPException(
                 status_code=401, detail="Invalid authentication credentials"
             )
-        token_data = TokenData(id=user_id, role=payload.get("role"))
-    except Exception as e:
-        raise HTTPException(
-            status_code=401, detail="Invalid authentication credentials"
-        )
 
-    user = db.exec(select(User).where(User.id == token_data.id)).first()
-    if user is None:
-        raise HTTPException(
-            status_code=401, detail="Invalid authentication credentials"
-        )
+        user = db.exec(select(User).where(User.id == token_data.id)).first()
+        if user is None:
+            raise HTTPException(
+                status_code=401, detail="Invalid authentication credentials"
+            )
     return user
 
 
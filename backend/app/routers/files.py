@@ -2,11 +2,14 @@ from app.database import get_session
 from app.routers.auth import get_current_user
 from fastapi.responses import FileResponse
 from fastapi import APIRouter, HTTPException, Depends
+import os
 import uuid
 import logging
 
+import anyio
 from sqlmodel import Session
 
+from ..metrics import FILE_BYTES_SERVED
 from ..models import File, Submission, Assignment, User
 
 logger = logging.getLogger(__name__)
@@ -22,6 +25,11 @@ router = APIRouter(
 )
 
 
+def _stat_file(path: str) -> os.stat_result:
+    with open(path, "rb") as f:
+        return os.fstat(f.fileno())
+
+
 @router.get("/{file_id}", response_class=FileResponse)
 async def get_file(
     file_id: uuid.UUID,
@@ -51,16 +59,19 @@ async def get_file(
             status_code=403, detail="You do not have permission to access this file"
         )
 
-    # try to find file on file system
+    # try to find file on file system, off the event loop. The stat is handed
+    # to FileResponse, which streams the file in chunks from a thread
     try:
-        f = open(file_record.filepath, "rb")
-        f.close()
+        stat_result = await anyio.to_thread.run_sync(_stat_file, file_record.filepath)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found on the server")
 
+    FILE_BYTES_SERVED.inc(stat_result.st_size)
+
     return FileResponse(
         path=file_record.filepath,
         filename=file_record.filename,
+        stat_result=stat_result,
         media_type=file_record.content_type
         if file_record.content_type is not None
         else "application/octet-stream",
@@ -0,0 +1,70 @@
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session
+
+from .. import search_index
+from ..database import get_session
+from ..models import Assignment, SearchHit, SearchResults, User
+from .auth import get_current_user
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"],
+    dependencies=[],
+    responses={
+        404: {"description": "Not found"},
+        500: {"description": "Internal server error"},
+    },
+)
+
+
+@router.get("/", response_model=SearchResults)
+async def search_submissions(
+    q: str = Query(..., min_length=1, max_length=200),
+    assignment_id: Optional[uuid.UUID] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> SearchResults:
+    """
+    Search the text of submitted files. Accepts web search syntax: quoted
+    phrases, "or" and -word. Teachers search their assignments, students
+    their own submissions.
+    """
+    if assignment_id is not None:
+        assignment = session.get(Assignment, assignment_id)
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+        if user.role == "teacher" and assignment.teacher_id != user.id:
+            raise HTTPException(
+                status_code=403, detail="You are not authorized to view this assignment"
+            )
+        elif user.role == "student" and user.id not in assignment.student_ids:
+            raise HTTPException(
+                status_code=403, detail="You are not authorized to view this assignment"
+            )
+
+    rows, total = search_index.search(session, q, user, assignment_id, limit, offset)
+
+    return SearchResults(
+        query=q,
+        total=total,
+        limit=limit,
+        offset=offset,
+        results=[
+            SearchHit(
+                file_id=row.file_id,
+                filename=row.filename,
+                submission_id=row.submission_id,
+                assignment_id=row.assignment_id,
+                student_id=row.student_id,
+                student_name=row.student_name,
+                rank=row.rank,
+                headline=search_index.render_headline(row.headline),
+            )
+            for row in rows
+        ],
+    )
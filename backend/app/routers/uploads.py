@@ -0,0 +1,508 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from sqlmodel import Session, select
+from starlette.requests import ClientDisconnect
+
+from .. import search_index
+from ..database import engine, get_session
+from ..metrics import UPLOAD_BYTES
+from ..upload_limits import (
+    SNIFF_BYTES,
+    UploadLimits,
+    UploadRejected,
+    sniff_content_type,
+)
+from ..models import (
+    Assignment,
+    File,
+    Submission,
+    SubmissionPopulated,
+    UploadSession,
+    UploadSessionCreate,
+    User,
+)
+from .assignments import UPLOAD_DIR
+from .auth import get_current_user
+
+logger = logging.getLogger(__name__)
+
+# chunks are written straight into the storage area so finalizing is a rename
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, "partial")
+os.makedirs(PARTIAL_DIR, exist_ok=True)
+
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(32 * 1024**2)))
+# uploads without a chunk for this long are deleted with their data
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+UPLOAD_CLEANUP_INTERVAL = int(os.getenv("UPLOAD_CLEANUP_INTERVAL", "3600"))
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+_task: Optional[asyncio.Task] = None
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"],
+    dependencies=[],
+    responses={
+        404: {"description": "Not found"},
+        500: {"description": "Internal server error"},
+    },
+)
+
+
+def partial_path(upload_id: uuid.UUID) -> str:
+    return os.path.join(PARTIAL_DIR, f"{upload_id}.part")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_path(upload_id: uuid.UUID) -> str:
+    # one per request, concurrent chunks for the same offset never share it
+    return os.path.join(PARTIAL_DIR, f"{upload_id}.{uuid.uuid4().hex}.chunk")
+
+
+def _touch(path: str) -> None:
+    open(path, "wb").close()
+
+
+def _append(path: str, chunk: str, offset: int) -> None:
+    """Copy the staged chunk into the partial file at offset."""
+    with open(path, "r+b") as f, open(chunk, "rb") as source:
+        f.seek(offset)
+        try:
+            shutil.copyfileobj(source, f, HASH_BLOCK_BYTES)
+            f.truncate()
+        except BaseException:
+            # back to what the committed offset says is there
+            f.truncate(offset)
+            raise
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_upload(session: Session, upload_id: uuid.UUID, user: User) -> UploadSession:
+    upload = session.get(UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.student_id != user.id:
+        raise HTTPException(
+            status_code=403, detail="You are not authorized to access this upload"
+        )
+    return upload
+
+
+def lock_upload(session: Session, upload_id: uuid.UUID, user: User) -> UploadSession:
+    """
+    The upload, locked until the session commits or rolls back. Chunk
+    writes and finalizing hold it, so only one of them touches the files
+    at a time.
+    """
+    upload = session.exec(
+        select(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.student_id != user.id:
+        raise HTTPException(
+            status_code=403, detail="You are not authorized to access this upload"
+        )
+    return upload
+
+
+def check_limits(
+    assignment: Assignment, submission: Optional[Submission], size: int
+) -> None:
+    """Would adding a file of size bytes to the submission break its limits."""
+    sizes = [file.size for file in submission.files] if submission else []
+    try:
+        UploadLimits.for_assignment(assignment).check_files([*sizes, size])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def offset_conflict(offset: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=409,
+        content={
+            "detail": "Chunk does not start at the upload offset",
+            "offset": offset,
+        },
+        headers={"Upload-Offset": str(offset)},
+    )
+
+
+def _commit_chunk(
+    session: Session,
+    upload_id: uuid.UUID,
+    user: User,
+    staged: str,
+    offset: int,
+    written: int,
+    content_type: Optional[str],
+):
+    """
+    Copy the staged chunk into the partial file and move the offset on, under
+    the upload's row lock. Called in a worker thread, like _finalize and
+    _delete, so a request waiting for the lock never holds up the event loop
+    the lock's holder needs to finish.
+    """
+    try:
+        # another chunk for this offset may have won while this one streamed
+        upload = lock_upload(session, upload_id, user)
+        if upload.offset != offset:
+            return offset_conflict(upload.offset)
+
+        _append(partial_path(upload_id), staged, offset)
+        upload.offset = offset + written
+        upload.updated_at = datetime.now(timezone.utc)
+        if content_type is not None:
+            upload.content_type = content_type
+        session.add(upload)
+        session.commit()
+    finally:
+        session.rollback()
+
+    session.refresh(upload)
+    return upload
+
+
+def _finalize(session: Session, upload_id: uuid.UUID, user: User):
+    # a second finalize waits here and then finds the upload gone
+    upload = lock_upload(session, upload_id, user)
+    if upload.offset != upload.size:
+        session.rollback()
+        return offset_conflict(upload.offset)
+
+    path = partial_path(upload_id)
+    if upload.sha256:
+        checksum = file_sha256(path)
+        if checksum != upload.sha256:
+            # the data on disk is wrong somewhere, so there is nothing to resume
+            session.delete(upload)
+            session.commit()
+            _remove(path)
+            raise HTTPException(
+                status_code=400, detail="File checksum mismatch, upload discarded"
+            )
+
+    if upload.submission_id is not None:
+        submission = session.get(Submission, upload.submission_id)
+        if not submission:
+            raise HTTPException(status_code=404, detail="Submission not found")
+        # other files may have been added since the upload started
+        check_limits(
+            session.get(Assignment, upload.assignment_id), submission, upload.size
+        )
+    else:
+        submission = Submission(
+            comment=upload.comment,
+            assignment_id=upload.assignment_id,
+            student_id=user.id,
+        )
+        session.add(submission)
+        session.flush()  # get submission.id without committing
+
+    # the file's id keeps two files of the same name in one submission apart
+    file_id = uuid.uuid4()
+    perm_path = os.path.join(
+        UPLOAD_DIR, f"submission_{submission.id}_{file_id}_{upload.filename}"
+    )
+    session.add(
+        File(
+            id=file_id,
+            filename=upload.filename,
+            filepath=perm_path,
+            size=upload.size,
+            submission_id=submission.id,
+            content_type=upload.content_type or "application/octet-stream",
+        )
+    )
+    session.delete(upload)
+
+    os.replace(path, perm_path)
+    try:
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        os.replace(perm_path, path)
+        raise HTTPException(
+            status_code=500, detail=f"Error creating submission: {str(e)}"
+        )
+
+    session.refresh(submission)
+    return submission
+
+
+def _delete(session: Session, upload_id: uuid.UUID, user: User) -> None:
+    # waits for a chunk being copied in, so its file isn't removed under it
+    upload = lock_upload(session, upload_id, user)
+    session.delete(upload)
+    session.commit()
+    _remove(partial_path(upload_id))
+
+
+@router.post("/", response_model=UploadSession, status_code=201)
+async def create_upload(
+    upload: UploadSessionCreate,
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> UploadSession:
+    if user.role != "student":
+        raise HTTPException(
+            status_code=403, detail="Only students can submit assignments"
+        )
+
+    assignment = session.get(Assignment, upload.assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    if user.id not in assignment.student_ids:
+        raise HTTPException(
+            status_code=403, detail="You are not assigned to this assignment"
+        )
+
+    submission = None
+    if upload.submission_id is not None:
+        submission = session.get(Submission, upload.submission_id)
+        if (
+            not submission
+            or submission.student_id != user.id
+            or submission.assignment_id != assignment.id
+        ):
+            raise HTTPException(status_code=404, detail="Submission not found")
+
+    # turned away on the declared size, before a single byte is sent
+    check_limits(assignment, submission, upload.size)
+
+    filename = os.path.basename(upload.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="File name is required")
+
+    db_upload = UploadSession(
+        **upload.model_dump(exclude={"filename", "sha256"}),
+        filename=filename,
+        sha256=upload.sha256.lower() if upload.sha256 else None,
+        student_id=user.id,
+    )
+
+    # the partial file exists from the start so every chunk opens it for update
+    await anyio.to_thread.run_sync(_touch, partial_path(db_upload.id))
+
+    session.add(db_upload)
+    session.commit()
+    session.refresh(db_upload)
+    return db_upload
+
+
+@router.get("/{upload_id}", response_model=UploadSession)
+async def get_upload_status(
+    upload_id: uuid.UUID,
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> UploadSession:
+    """Where to resume: the next chunk has to start at offset."""
+    return get_upload(session, upload_id, user)
+
+
+@router.put("/{upload_id}", response_model=UploadSession)
+async def upload_chunk(
+    upload_id: uuid.UUID,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: Optional[str] = Header(None),
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """
+    Write the request body at offset. The chunk is staged in a file of its
+    own and only copied into place, under the upload's row lock, if the
+    offset is still where it started. A chunk that fails its Chunk-SHA256
+    check, is cut off half way or loses to another chunk for the same
+    offset is dropped and can be sent again. The first chunk is held back
+    until the file's type is known from its first SNIFF_BYTES.
+    """
+    upload = get_upload(session, upload_id, user)
+    if offset != upload.offset:
+        return offset_conflict(upload.offset)
+    size = upload.size
+    filename = upload.filename
+
+    # hand the connection back to the pool while the chunk streams in
+    session.rollback()
+
+    staged = chunk_path(upload_id)
+    digest = hashlib.sha256()
+    written = 0
+    error = None
+    content_type = None
+    head = b"" if offset == 0 else None
+    f = await anyio.to_thread.run_sync(open, staged, "wb")
+    try:
+        async for piece in request.stream():
+            written += len(piece)
+            if written > UPLOAD_CHUNK_MAX_BYTES:
+                error = HTTPException(status_code=413, detail="Chunk is too large")
+                break
+            if offset + written > size:
+                error = HTTPException(
+                    status_code=400, detail="Chunk goes past the end of the file"
+                )
+                break
+            digest.update(piece)
+            if head is not None:
+                head += piece
+                if len(head) < SNIFF_BYTES:
+                    continue
+                content_type = sniff_content_type(filename, head, written == size)
+                piece, head = head, None
+            await anyio.to_thread.run_sync(f.write, piece)
+
+        if error is None and head is not None:
+            # the whole chunk was shorter than what's sniffed
+            content_type = sniff_content_type(filename, head, written == size)
+            await anyio.to_thread.run_sync(f.write, head)
+
+        if (
+            error is None
+            and chunk_sha256
+            and chunk_sha256.lower() != digest.hexdigest()
+        ):
+            error = HTTPException(status_code=400, detail="Chunk checksum mismatch")
+    except UploadRejected as e:
+        error = HTTPException(status_code=e.status_code, detail=e.detail)
+    except ClientDisconnect:
+        error = HTTPException(status_code=400, detail="Chunk was not received")
+    finally:
+        await anyio.to_thread.run_sync(f.close)
+
+    try:
+        if error is not None:
+            raise error
+        upload = await anyio.to_thread.run_sync(
+            _commit_chunk,
+            session,
+            upload_id,
+            user,
+            staged,
+            offset,
+            written,
+            content_type,
+        )
+    finally:
+        await anyio.to_thread.run_sync(_remove, staged)
+
+    if isinstance(upload, UploadSession):
+        UPLOAD_BYTES.inc(written)
+    return upload
+
+
+@router.post(
+    "/{upload_id}/finalize", response_model=SubmissionPopulated, status_code=201
+)
+async def finalize_upload(
+    upload_id: uuid.UUID,
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+) -> SubmissionPopulated:
+    """
+    Check the assembled file against its checksum and attach it to the
+    submission, creating the submission if the upload didn't name one.
+    """
+    submission = await anyio.to_thread.run_sync(_finalize, session, upload_id, user)
+    if isinstance(submission, Submission):
+        search_index.notify()
+    return submission
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def delete_upload(
+    upload_id: uuid.UUID,
+    session: Session = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    await anyio.to_thread.run_sync(_delete, session, upload_id, user)
+
+
+def cleanup_abandoned_uploads(session: Session, ttl: int = UPLOAD_SESSION_TTL) -> int:
+    """
+    Delete uploads that haven't received a chunk in ttl seconds, and partial
+    files no upload points to. Returns the number of uploads deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    stale = session.exec(
+        select(UploadSession).where(UploadSession.updated_at < cutoff)
+    ).all()
+    for upload in stale:
+        session.delete(upload)
+    session.commit()
+
+    for upload in stale:
+        _remove(partial_path(upload.id))
+
+    # files left behind by a crash between writing and committing
+    known = {
+        f"{upload_id}.part"
+        for upload_id in session.exec(select(UploadSession.id)).all()
+    }
+    for entry in os.scandir(PARTIAL_DIR):
+        if entry.name not in known and entry.stat().st_mtime < cutoff.timestamp():
+            _remove(entry.path)
+
+    if stale:
+        logger.info(f"Deleted {len(stale)} abandoned uploads")
+    return len(stale)
+
+
+def _cleanup_once() -> int:
+    with Session(engine) as session:
+        return cleanup_abandoned_uploads(session)
+
+
+async def cleanup_loop() -> None:
+    while True:
+        try:
+            await anyio.to_thread.run_sync(_cleanup_once)
+        except Exception as e:
+            logger.warning(f"Error cleaning up uploads: {str(e)}")
+        await asyncio.sleep(UPLOAD_CLEANUP_INTERVAL)
+
+
+def start_upload_cleanup() -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(cleanup_loop())
+
+
+async def stop_upload_cleanup() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
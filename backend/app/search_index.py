@@ -0,0 +1,200 @@
+import asyncio
+import html
+import logging
+import os
+from typing import Optional
+
+import anyio
+from sqlalchemy import desc
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, func, select
+
+from app.database import engine
+from app.extraction import NO_TEXT_IN_PDF, extract_text
+from app.similarity import sign_pending
+from app.models import SEARCH_CONFIG, Assignment, File, FileContent, Submission, User
+
+logger = logging.getLogger(__name__)
+
+# how often the indexer looks for files nobody told it about, e.g. ones
+# stored while the app was down
+SEARCH_INDEX_INTERVAL = int(os.getenv("SEARCH_INDEX_INTERVAL", "300"))
+SEARCH_INDEX_BATCH = int(os.getenv("SEARCH_INDEX_BATCH", "20"))
+
+# ts_headline marks matches with these private use characters rather than
+# tags, so the student's text can be escaped before they become <mark>s
+MARK_START = "\ue000"
+MARK_STOP = "\ue001"
+HEADLINE_OPTIONS = (
+    f'StartSel="{MARK_START}", StopSel="{MARK_STOP}", '
+    "MaxFragments=3, MaxWords=20, MinWords=5"
+)
+
+_task: Optional[asyncio.Task] = None
+_wake: Optional[asyncio.Event] = None
+
+
+def index_file(session: Session, file_record: File) -> None:
+    """
+    Extract a file's text and store it for searching. Every worker runs an
+    indexer, a file another one stored first is left as it is.
+    """
+    try:
+        text, _ = extract_text(file_record)
+    except OSError as e:
+        # stored empty so the file isn't retried on every pass
+        logger.warning(f"Could not index {file_record.filepath}: {str(e)}")
+        text = ""
+    if text == NO_TEXT_IN_PDF:
+        text = ""
+
+    session.exec(
+        insert(FileContent)
+        .values(file_id=file_record.id, text=text.replace("\x00", ""))
+        .on_conflict_do_nothing(index_elements=[FileContent.file_id])
+    )
+
+
+def index_pending(session: Session, limit: int = SEARCH_INDEX_BATCH) -> int:
+    """Index up to limit files that have no text stored yet."""
+    pending = session.exec(
+        select(File)
+        .outerjoin(FileContent, FileContent.file_id == File.id)
+        .where(FileContent.file_id.is_(None))
+        .limit(limit)
+    ).all()
+    for file_record in pending:
+        index_file(session, file_record)
+        session.commit()
+    return len(pending)
+
+
+def search_statement(query: str, user: User, assignment_id=None):
+    """
+    Files matching query that user may see, best match first, with the
+    number of matches on every row. Teachers search their assignments'
+    submissions, students their own.
+    """
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank_cd(FileContent.search_vector, tsquery)
+
+    statement = (
+        select(
+            FileContent.file_id,
+            FileContent.text,
+            File.filename,
+            File.submission_id,
+            Submission.assignment_id,
+            Submission.student_id,
+            User.name.label("student_name"),
+            rank.label("rank"),
+            func.count().over().label("total"),
+        )
+        .join(File, File.id == FileContent.file_id)
+        .join(Submission, Submission.id == File.submission_id)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(User, User.id == Submission.student_id)
+        .where(FileContent.search_vector.op("@@")(tsquery))
+    )
+
+    if user.role == "teacher":
+        statement = statement.where(Assignment.teacher_id == user.id)
+    else:
+        statement = statement.where(Submission.student_id == user.id)
+    if assignment_id is not None:
+        statement = statement.where(Submission.assignment_id == assignment_id)
+
+    return statement, tsquery
+
+
+def search(
+    session: Session,
+    query: str,
+    user: User,
+    assignment_id=None,
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[list, int]:
+    """
+    One page of hits and the total number of them. Headlines are only
+    built for the rows on the page, ts_headline reparses the whole text.
+    """
+    statement, tsquery = search_statement(query, user, assignment_id)
+    page = (
+        statement.order_by(desc("rank"), FileContent.file_id)
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+    rows = session.exec(
+        select(
+            page,
+            func.ts_headline(
+                SEARCH_CONFIG,
+                # a student typing the markers can't fake a match
+                func.translate(page.c.text, MARK_START + MARK_STOP, ""),
+                tsquery,
+                HEADLINE_OPTIONS,
+            ).label("headline"),
+        ).order_by(page.c.rank.desc(), page.c.file_id)
+    ).all()
+
+    total = rows[0].total if rows else 0
+    if not rows and offset:
+        total = session.exec(
+            select(func.count()).select_from(statement.subquery())
+        ).one()
+    return rows, total
+
+
+def render_headline(headline: str) -> str:
+    """The headline HTML escaped, with the matches wrapped in <mark></mark>."""
+    return (
+        html.escape(headline)
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_STOP, "</mark>")
+    )
+
+
+async def indexer_loop() -> None:
+    while True:
+        _wake.clear()
+        try:
+            while await anyio.to_thread.run_sync(_index_batch):
+                pass
+        except Exception as e:
+            logger.warning(f"Error indexing files for search: {str(e)}")
+        try:
+            await asyncio.wait_for(_wake.wait(), SEARCH_INDEX_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _index_batch() -> int:
+    with Session(engine) as session:
+        # signatures for near duplicate detection are made from the stored text
+        return index_pending(session) + sign_pending(session)
+
+
+def notify() -> None:
+    """New files were stored, index them now rather than on the next pass."""
+    if _wake is not None:
+        _wake.set()
+
+
+def start_indexer() -> None:
+    global _task, _wake
+    if _task is None:
+        _wake = asyncio.Event()
+        _task = asyncio.create_task(indexer_loop())
+
+
+async def stop_indexer() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
@@ -0,0 +1,243 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from app.models import File, FileContent, FileSignature, Submission, User
+
+# words per shingle
+SHINGLE_SIZE = int(os.getenv("SIMILARITY_SHINGLE_SIZE", "5"))
+
+# the signature is split into BANDS bands of ROWS hashes. Two files become
+# candidates when any band matches, which for 32 x 4 happens for most pairs
+# above roughly (1 / 32) ** (1 / 4) = 0.42 similarity
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+# below this, most pairs that similar never share a band, so asking for a
+# lower threshold would quietly find next to nothing
+MIN_THRESHOLD = 0.42
+
+# estimated Jaccard similarity from which two files count as near duplicates
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
+
+# a band value shared by more files than this is template or starter code
+# most of the class has, it's skipped rather than pairing all of them up
+SIMILARITY_MAX_BUCKET = int(os.getenv("SIMILARITY_MAX_BUCKET", "100"))
+
+# files with fewer shingles than this, like a one line note, are left out
+MIN_SHINGLES = 10
+
+SIMILARITY_SIGN_BATCH = int(os.getenv("SIMILARITY_SIGN_BATCH", "50"))
+
+# a prime just above 2**32, so (a * x + b) with 32 bit a, b and x fits in uint64
+PRIME = np.uint64((1 << 32) + 15)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# shingles hashed against all permutations at once, in blocks of this many
+BLOCK = 4096
+
+_rng = np.random.RandomState(1)
+# fixed seed, signatures stored in the database have to stay comparable
+PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+SHINGLE_WEIGHTS = _rng.randint(1, 1 << 62, size=SHINGLE_SIZE, dtype=np.uint64) | 1
+BAND_WEIGHTS = _rng.randint(1, 1 << 62, size=ROWS, dtype=np.uint64) | 1
+
+WORD_RE = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    32 bit hashes of the distinct runs of size words in text, ignoring case
+    and punctuation.
+    """
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return np.empty(0, dtype=np.uint64)
+
+    # crc32 rather than hash(), which differs between processes
+    tokens = np.fromiter(
+        (zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words)
+    )
+    windows = np.lib.stride_tricks.sliding_window_view(tokens, size)
+    # weights are only used mod 2**64, overflow is the point
+    with np.errstate(over="ignore"):
+        combined = (windows * SHINGLE_WEIGHTS[:size]).sum(axis=1, dtype=np.uint64)
+    return np.unique((combined >> np.uint64(32)) ^ (combined & MAX_HASH))
+
+
+def minhash(hashes: np.ndarray) -> np.ndarray:
+    """The NUM_PERM minimums of the shingle hashes under each permutation."""
+    signature = np.full(NUM_PERM, MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), BLOCK):
+        block = hashes[start : start + BLOCK]
+        permuted = (np.outer(PERM_A, block) + PERM_B[:, None]) % PRIME
+        np.minimum(signature, permuted.min(axis=1) & MAX_HASH, out=signature)
+    return signature.astype(np.uint32)
+
+
+def signature_for(text: str) -> Tuple[np.ndarray, int]:
+    hashes = shingle_hashes(text)
+    return minhash(hashes), len(hashes)
+
+
+def sign_pending(session: Session, limit: int = SIMILARITY_SIGN_BATCH) -> int:
+    """
+    Sign up to limit files whose text is stored but not yet signed. Works
+    off the text kept for search, so nothing is extracted twice.
+    """
+    pending = session.exec(
+        select(FileContent)
+        .outerjoin(FileSignature, FileSignature.file_id == FileContent.file_id)
+        .where(FileSignature.file_id.is_(None))
+        .limit(limit)
+    ).all()
+    for content in pending:
+        signature, count = signature_for(content.text)
+        # another worker's indexer may have signed it in the meantime
+        session.exec(
+            insert(FileSignature)
+            .values(
+                file_id=content.file_id,
+                signature=signature.tobytes(),
+                shingle_count=count,
+            )
+            .on_conflict_do_nothing(index_elements=[FileSignature.file_id])
+        )
+    session.commit()
+    return len(pending)
+
+
+def candidate_pairs(
+    signatures: np.ndarray, max_bucket: int = SIMILARITY_MAX_BUCKET
+) -> np.ndarray:
+    """
+    Pairs (i, j), i < j, of rows that share at least one band, found by
+    sorting every band's hashes at once and pairing up the runs of equal
+    values. Runs longer than max_bucket are left out.
+    """
+    n = len(signatures)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    bands = signatures.astype(np.uint64).reshape(n, BANDS, ROWS)
+    with np.errstate(over="ignore"):
+        keys = (bands * BAND_WEIGHTS).sum(axis=2, dtype=np.uint64)
+
+    # one entry per band and row, equal hashes of a band next to each other
+    # and rows in order within them
+    band = np.repeat(np.arange(BANDS), n)
+    hashes = keys.T.ravel()
+    rows = np.tile(np.arange(n), BANDS)
+    order = np.lexsort((rows, hashes, band))
+    band, hashes, rows = band[order], hashes[order], rows[order]
+
+    starts = np.flatnonzero(
+        np.r_[True, (band[1:] != band[:-1]) | (hashes[1:] != hashes[:-1])]
+    )
+    sizes = np.diff(np.r_[starts, len(rows)])
+
+    # runs of the same length pair up the same way, one index per length
+    found = []
+    for size in np.unique(sizes[(sizes >= 2) & (sizes <= max_bucket)]):
+        first = starts[sizes == size][:, None]
+        a, b = np.triu_indices(size, 1)
+        found.append(np.stack([rows[first + a], rows[first + b]], axis=-1))
+
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.concatenate([pairs.reshape(-1, 2) for pairs in found])
+    # the same pair found in several bands is kept once
+    return np.unique(pairs, axis=0).astype(np.int64)
+
+
+def similar_pairs(
+    signatures: np.ndarray, threshold: float = SIMILARITY_THRESHOLD
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Candidate pairs whose estimated similarity reaches threshold."""
+    pairs = candidate_pairs(signatures)
+    if not len(pairs):
+        return pairs, np.empty(0)
+    estimates = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+    keep = estimates >= threshold
+    return pairs[keep], estimates[keep]
+
+
+def clusters(n: int, pairs: np.ndarray) -> List[List[int]]:
+    """Connected groups of rows, for rows in at least one pair."""
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+
+    groups: Dict[int, List[int]] = {}
+    for i in sorted({int(i) for pair in pairs for i in pair}):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def assignment_clusters(
+    session: Session, assignment_id, threshold: float = SIMILARITY_THRESHOLD
+) -> Tuple[List, List[dict]]:
+    """
+    Groups of near duplicate files across an assignment's submissions. Pairs
+    from the same student, like a resubmission, don't count. Returns the
+    files compared and the clusters, each with its files (as indexes into
+    the former) and pairs.
+    """
+    rows = session.exec(
+        select(
+            FileSignature.signature,
+            File.id,
+            File.filename,
+            File.submission_id,
+            Submission.student_id,
+            User.name,
+        )
+        .join(File, File.id == FileSignature.file_id)
+        .join(Submission, Submission.id == File.submission_id)
+        .join(User, User.id == Submission.student_id)
+        .where(
+            Submission.assignment_id == assignment_id,
+            FileSignature.shingle_count >= MIN_SHINGLES,
+        )
+        .order_by(File.id)
+    ).all()
+    if not rows:
+        return rows, []
+
+    signatures = np.frombuffer(
+        b"".join(row[0] for row in rows), dtype=np.uint32
+    ).reshape(len(rows), NUM_PERM)
+    pairs, estimates = similar_pairs(signatures, threshold)
+
+    students = np.array([row[4] for row in rows])
+    across = students[pairs[:, 0]] != students[pairs[:, 1]] if len(pairs) else []
+    pairs, estimates = pairs[across], estimates[across]
+
+    found = []
+    for members in clusters(len(rows), pairs):
+        inside = np.isin(pairs[:, 0], members)
+        found.append(
+            {
+                "files": members,
+                "pairs": [
+                    (int(a), int(b), float(estimate))
+                    for (a, b), estimate in zip(pairs[inside], estimates[inside])
+                ],
+            }
+        )
+    found.sort(key=lambda cluster: -max(p[2] for p in cluster["pairs"]))
+    return rows, found
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+# requests slower than this are written to the slow request log with their
+# full span tree
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+
+slow_log = logging.getLogger("app.slow_requests")
+
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started_at
+
+    def to_dict(self) -> dict:
+        res = {"name": self.name, "ms": round((self.duration or 0) * 1000, 2)}
+        if self.children:
+            res["children"] = [child.to_dict() for child in self.children]
+        return res
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block as a child of the current span. Does nothing outside a
+    request, so it's cheap to leave in code that also runs from scripts.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield
+        return
+
+    child = Span(name)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield
+    finally:
+        child.finish()
+        _current.reset(token)
+
+
+def totals(root: Span) -> dict:
+    """Time and count per span name, summed over the whole tree."""
+    res = {}
+
+    def walk(node: Span):
+        for child in node.children:
+            entry = res.setdefault(child.name, {"dur": 0.0, "count": 0})
+            entry["dur"] += child.duration or 0.0
+            entry["count"] += 1
+            walk(child)
+
+    walk(root)
+    return res
+
+
+def server_timing(root: Span) -> str:
+    parts = []
+    for name, entry in totals(root).items():
+        part = f"{name};dur={entry['dur'] * 1000:.1f}"
+        if entry["count"] > 1:
+            part += f';desc="{entry["count"]}x"'
+        parts.append(part)
+    parts.append(f"total;dur={(time.perf_counter() - root.started_at) * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def instrument_engine(engine) -> None:
+    """Add a db span for every statement run inside a request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is not None:
+            child = Span("db")
+            parent.children.append(child)
+            conn.info.setdefault("timing_spans", []).append(child)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("timing_spans")
+        if _current.get() is not None and spans:
+            spans.pop().finish()
+
+
+class TimingMiddleware:
+    """
+    Collects the spans of each request, sends the breakdown in a
+    Server-Timing header and logs requests slower than SLOW_REQUEST_SECONDS.
+    """
+
+    def __init__(self, app, slow_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root = Span("request")
+        token = _current.set(root)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(root).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            root.finish()
+            if root.duration >= self.slow_seconds:
+                slow_log.warning(
+                    json.dumps(
+                        {
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "status": status["code"],
+                            "ms": round(root.duration * 1000, 2),
+                            "spans": [child.to_dict() for child in root.children],
+                        }
+                    )
+                )
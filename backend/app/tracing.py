@@ -0,0 +1,136 @@
+import logging
+import os
+import weakref
+from typing import Optional
+
+from opentelemetry import trace
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SimpleSpanProcessor,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+
+from app.metrics import statement_type
+
+logger = logging.getLogger(__name__)
+
+# tracing is switched on by pointing it at a collector, the standard OTLP
+# variables (OTEL_EXPORTER_OTLP_*) configure the exporter itself
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv(
+    "OTEL_EXPORTER_OTLP_ENDPOINT"
+)
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "analysis-backend")
+
+# share of new traces that are recorded. Requests that arrive with a sampled
+# traceparent from the frontend are always recorded
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+
+tracer = trace.get_tracer("app")
+
+_provider: Optional[TracerProvider] = None
+_instrumented_engines = weakref.WeakSet()
+
+
+def configure(
+    exporter: Optional[SpanExporter] = None,
+    sample_ratio: float = TRACE_SAMPLE_RATIO,
+    batch: bool = True,
+) -> Optional[TracerProvider]:
+    """
+    Set up the tracer provider. Without an exporter one is only created when
+    an OTLP endpoint is configured, otherwise tracing stays off. Tests can
+    pass an InMemorySpanExporter with batch=False to read spans back.
+    """
+    global _provider
+
+    if exporter is None:
+        if not OTLP_ENDPOINT:
+            return None
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        exporter = OTLPSpanExporter()
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    processor = BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter)
+    provider.add_span_processor(processor)
+
+    # the global provider can only be set once per process
+    if _provider is None:
+        trace.set_tracer_provider(provider)
+    _provider = provider
+    return provider
+
+
+def instrument_app(app) -> None:
+    if _provider is not None:
+        FastAPIInstrumentor.instrument_app(
+            app, tracer_provider=_provider, excluded_urls="/metrics"
+        )
+
+
+def instrument_engine(engine) -> None:
+    """
+    Add a client span for every statement run through the engine. Call it
+    after configure(), the app does from its startup hook. Instrumenting an
+    engine again does nothing.
+    """
+    if _provider is None or engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+
+    # hooked up directly rather than through the sqlalchemy instrumentation
+    # package, which doesn't support sqlalchemy 2.1 yet
+    db_tracer = _provider.get_tracer("app.db")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        db_span = db_tracer.start_span(
+            statement_type(statement),
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": engine.dialect.name,
+                "db.statement": statement,
+            },
+        )
+        conn.info.setdefault("trace_spans", []).append(db_span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        spans = exception_context.connection.info.get("trace_spans")
+        if spans:
+            db_span = spans.pop()
+            db_span.set_status(Status(StatusCode.ERROR))
+            db_span.record_exception(exception_context.original_exception)
+            db_span.end()
+
+
+def instrument_client(client) -> None:
+    """Trace requests made with an httpx client and pass the context on."""
+    if _provider is not None:
+        HTTPXClientInstrumentor.instrument_client(client, tracer_provider=_provider)
+
+
+def shutdown() -> None:
+    if _provider is not None:
+        _provider.shutdown()
+
+
+configure()
@@ -0,0 +1,208 @@
+import codecs
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+# server wide defaults, an assignment can set its own instead
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "10"))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(50 * 1024**2)))
+UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(100 * 1024**2)))
+
+# largest multipart submission request, checked before the body is parsed.
+# Bigger files go through the resumable uploads
+UPLOAD_MAX_REQUEST_BYTES = int(
+    os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(UPLOAD_MAX_TOTAL_BYTES + 1024**2))
+)
+
+# how much of the start of a file is looked at to tell its type
+SNIFF_BYTES = 4096
+
+PDF_MAGIC = b"%PDF-"
+
+# common binary formats, named so the error says what was sent
+SIGNATURES = {
+    b"PK\x03\x04": "a zip archive or office document",
+    b"\x89PNG": "a PNG image",
+    b"\xff\xd8\xff": "a JPEG image",
+    b"GIF8": "a GIF image",
+    b"\x7fELF": "an executable",
+    b"MZ": "an executable",
+    b"\xd0\xcf\x11\xe0": "an office document",
+}
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadLimits:
+    max_files: int = UPLOAD_MAX_FILES
+    max_file_bytes: int = UPLOAD_MAX_FILE_BYTES
+    max_total_bytes: int = UPLOAD_MAX_TOTAL_BYTES
+
+    @classmethod
+    def for_assignment(cls, assignment) -> "UploadLimits":
+        limits = cls()
+        for name in ("max_files", "max_file_bytes", "max_total_bytes"):
+            value = getattr(assignment, name, None)
+            if value is not None:
+                setattr(limits, name, value)
+        return limits
+
+    def check_files(self, sizes: Iterable[Optional[int]]) -> None:
+        """
+        Reject a set of files by count and declared size, before any of them
+        is read. Sizes that aren't known yet are skipped and caught while
+        copying.
+        """
+        sizes = list(sizes)
+        if len(sizes) > self.max_files:
+            raise UploadRejected(
+                400, f"At most {self.max_files} files can be submitted"
+            )
+        for size in sizes:
+            if size is not None and size > self.max_file_bytes:
+                raise UploadRejected(
+                    413, f"Files can be at most {self.max_file_bytes} bytes"
+                )
+        if sum(size or 0 for size in sizes) > self.max_total_bytes:
+            raise UploadRejected(
+                413, f"Files can be at most {self.max_total_bytes} bytes in total"
+            )
+
+
+def _is_utf8(data: bytes, complete: bool) -> bool:
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=complete)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_content_type(filename: str, head: bytes, complete: bool = False) -> str:
+    """
+    The content type of a file from its first bytes: application/pdf or
+    text/plain, the two kinds extraction can read. complete says head is
+    the whole file rather than a prefix that may end mid character. Raises
+    UploadRejected (415) for anything else, or when the file's name says
+    otherwise, since extraction goes by the name.
+    """
+    is_pdf_name = filename.lower().endswith(".pdf")
+
+    if head.startswith(PDF_MAGIC):
+        if not is_pdf_name:
+            raise UploadRejected(415, f"{filename} is a PDF without a .pdf name")
+        return "application/pdf"
+
+    if is_pdf_name:
+        raise UploadRejected(415, f"{filename} is not a PDF")
+
+    for magic, kind in SIGNATURES.items():
+        if head.startswith(magic):
+            raise UploadRejected(
+                415, f"{filename} looks like {kind}, only PDF and text are supported"
+            )
+
+    if b"\x00" in head or not _is_utf8(head, complete):
+        raise UploadRejected(
+            415,
+            f"{filename} is not a PDF or UTF-8 text, which are all that's supported",
+        )
+    return "text/plain"
+
+
+class LimitedWriter:
+    """
+    File-like wrapper that stops a copy once more than max_bytes have been
+    written, so an upload that lied about its size can't fill the disk.
+    """
+
+    def __init__(self, f, max_bytes: int, detail: str):
+        self.f = f
+        self.max_bytes = max_bytes
+        self.detail = detail
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        if self.written > self.max_bytes:
+            raise UploadRejected(413, self.detail)
+        return self.f.write(data)
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Answers 413 for requests to paths whose body is bigger than max_bytes,
+    straight away when Content-Length says so, otherwise as soon as that
+    much has streamed in. Multipart bodies are spooled to disk before a
+    route runs, so this is the only place a too big upload can be stopped
+    before it costs disk space.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES, paths=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def reject(self, send) -> None:
+        body = json.dumps(
+            {"detail": f"Request body is larger than {self.max_bytes} bytes"}
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self.reject(send)
+            return
+
+        state = {"received": 0, "rejected": False, "started": False}
+
+        async def receive_wrapper():
+            if state["rejected"]:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_bytes and not state["started"]:
+                    state["rejected"] = True
+                    await self.reject(send)
+                    # the route sees a client that went away and gives up
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def send_wrapper(message):
+            if state["rejected"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            # the 413 is already out, whatever the route made of the
+            # disconnect doesn't matter
+            if not state["rejected"]:
+                raise
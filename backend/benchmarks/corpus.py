@@ -0,0 +1,145 @@
+import argparse
+import os
+import random
+import textwrap
+from typing import List
+
+SIZES = {"small": 2_000, "medium": 20_000, "large": 120_000}
+
+VOCABULARY = (
+    "analysis argument author balance cause claim conclusion context data "
+    "debate define develop effect essay evidence example experiment explain "
+    "factor finding history hypothesis impact interpret method observe "
+    "paragraph photosynthesis population primary question reason research "
+    "result revolution science sentence source structure study summary "
+    "support theory thesis topic variable"
+).split()
+
+LINES_PER_PAGE = 46
+LINE_WIDTH = 90
+
+
+def essay_text(chars: int, seed: str) -> str:
+    """Deterministic essay-like text of about chars characters."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 20))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_bytes(text: str, title: str = "Essay") -> bytes:
+    """
+    A plain PDF with one text stream per page and a running header and page
+    number, like exported coursework. Written by hand so generating a corpus
+    needs nothing beyond the app's own dependencies.
+    """
+    lines = []
+    for paragraph in text.split("\n\n"):
+        lines.extend(textwrap.wrap(paragraph, LINE_WIDTH) or [""])
+        lines.append("")
+    pages = [
+        lines[i : i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)
+    ] or [[]]
+
+    objects = [b"", b""]  # catalog and page tree are filled in below
+    font_id = 3
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for number, page_lines in enumerate(pages, start=1):
+        body = [f"{title}", ""] + page_lines + ["", f"Page {number} of {len(pages)}"]
+        ops = ["BT", "/F1 10 Tf", "13 TL", "50 770 Td"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in body]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (font_id, content_id)
+        )
+        page_ids.append(len(objects))
+
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for object_id, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % object_id + obj + b"\nendobj\n"
+
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_at,
+    )
+    return bytes(out)
+
+
+def generate_corpus(directory: str, per_size: int = 3, seed: int = 0) -> List[dict]:
+    """
+    Write per_size text and PDF files for every size in SIZES. Returns a
+    description of every file written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for size_name, chars in SIZES.items():
+        for i in range(per_size):
+            text = essay_text(chars, seed=f"{seed}-{size_name}-{i}")
+            for kind in ("txt", "pdf"):
+                filename = f"{size_name}{i}.{kind}"
+                path = os.path.join(directory, filename)
+                if kind == "txt":
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(text)
+                    content_type = "text/plain"
+                else:
+                    with open(path, "wb") as f:
+                        f.write(pdf_bytes(text, title=f"Essay {size_name} {i}"))
+                    content_type = "application/pdf"
+                files.append(
+                    {
+                        "filename": filename,
+                        "filepath": os.path.abspath(path),
+                        "content_type": content_type,
+                        "size": size_name,
+                        "bytes": os.path.getsize(path),
+                    }
+                )
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus")
+    parser.add_argument("directory")
+    parser.add_argument("--per-size", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for entry in generate_corpus(args.directory, args.per_size, args.seed):
+        print(f"{entry['filepath']}\t{entry['bytes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import percentile, summarize
+
+PASSWORD = "loadtest-password"
+
+
+def arrival_times(count: int, window: float, peak: float, seed: int = 0) -> List[float]:
+    """
+    Arrival offsets in seconds, bunched up towards the end of the window the
+    way submissions pile up before a deadline. peak 1 is a steady rate, higher
+    values push more of the arrivals into the last minutes.
+    """
+    rng = random.Random(seed)
+    return sorted(window * rng.random() ** (1 / peak) for _ in range(count))
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Sum every sample of the metrics the report needs."""
+    wanted = {
+        "db_pool_checked_out",
+        "db_pool_capacity",
+        "upload_bytes_written_total",
+        "file_bytes_served_total",
+    }
+    values = defaultdict(float)
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name in wanted:
+                values[sample.name] += sample.value
+    return dict(values)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, name: str, request) -> Optional[httpx.Response]:
+        started_at = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            self.status[name][type(e).__name__] += 1
+            self.latencies[name].append(time.perf_counter() - started_at)
+            return None
+
+        self.latencies[name].append(time.perf_counter() - started_at)
+        self.status[name][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        total = 0
+        for name, values in sorted(self.latencies.items()):
+            total += len(values)
+            operations[name] = {
+                **summarize(values),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / len(values), 4),
+                "status": dict(self.status[name]),
+            }
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "operations": operations,
+        }
+
+
+async def login(client: httpx.AsyncClient, recorder: Recorder, username: str):
+    response = await recorder.call(
+        "login",
+        client.post("/auth/token", data={"username": username, "password": PASSWORD}),
+    )
+    if response is None:
+        return None
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def seed(
+    client: httpx.AsyncClient,
+    students: int,
+    teachers: int,
+    assignments: int,
+    parallel: int,
+) -> dict:
+    """
+    Sign up teachers and students through the API and have every teacher
+    create assignments that enroll all students.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    gate = asyncio.Semaphore(parallel)
+
+    async def signup(role: str, i: int) -> dict:
+        username = f"rush-{run_id}-{role}{i}"
+        async with gate:
+            response = await client.post(
+                "/auth/signup",
+                json={
+                    "name": f"Load {role} {i}",
+                    "username": username,
+                    "password": PASSWORD,
+                    "role": role,
+                },
+            )
+        response.raise_for_status()
+        return {"username": username, "id": response.json()["id"]}
+
+    student_users = await asyncio.gather(
+        *(signup("student", i) for i in range(students))
+    )
+    teacher_users = await asyncio.gather(
+        *(signup("teacher", i) for i in range(teachers))
+    )
+
+    assignment_ids = []
+    seeding = Recorder()
+    for teacher in teacher_users:
+        headers = await login(client, seeding, teacher["username"])
+        if headers is None:
+            raise RuntimeError(f"Could not log in as {teacher['username']}")
+        for i in range(assignments):
+            response = await client.post(
+                "/assignments/",
+                json={
+                    "title": f"Essay {i}",
+                    "description": "Deadline rush load test",
+                    "student_ids": [student["id"] for student in student_users],
+                },
+                headers=headers,
+            )
+            response.raise_for_status()
+            assignment_ids.append(response.json()["id"])
+
+    return {
+        "students": student_users,
+        "teachers": teacher_users,
+        "assignments": assignment_ids,
+    }
+
+
+async def student_session(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    student: dict,
+    assignment_ids: List[str],
+    corpus: List[dict],
+    rng: random.Random,
+):
+    """Log in, look up the assignment, upload, and sometimes check the upload."""
+    headers = await login(client, recorder, student["username"])
+    if headers is None:
+        return
+
+    await recorder.call(
+        "list_assignments", client.get("/assignments/", headers=headers)
+    )
+
+    uploads = []
+    for entry in rng.sample(corpus, k=rng.choice((1, 1, 2))):
+        with open(entry["filepath"], "rb") as f:
+            uploads.append(
+                ("files", (entry["filename"], f.read(), entry["content_type"]))
+            )
+
+    response = await recorder.call(
+        "submit",
+        client.post(
+            "/assignments/submit",
+            data={"assignment_id": rng.choice(assignment_ids), "comment": "done"},
+            files=uploads,
+            headers=headers,
+        ),
+    )
+
+    if response is not None and rng.random() < 0.3:
+        file_id = rng.choice(response.json()["files"])["id"]
+        await recorder.call(
+            "download", client.get(f"/files/{file_id}", headers=headers)
+        )
+
+
+async def teacher_session(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    teacher: dict,
+    deadline: float,
+    rng: random.Random,
+):
+    """Browse submissions and open files until the rush is over."""
+    headers = await login(client, recorder, teacher["username"])
+    if headers is None:
+        return
+
+    while time.monotonic() < deadline:
+        response = await recorder.call(
+            "list_assignments", client.get("/assignments/", headers=headers)
+        )
+        if response is not None and response.json():
+            assignment = rng.choice(response.json())
+            submissions = await recorder.call(
+                "list_submissions",
+                client.get(
+                    f"/assignments/{assignment['id']}/submissions", headers=headers
+                ),
+            )
+            files = [
+                file
+                for submission in (submissions.json() if submissions else [])
+                for file in submission.get("files") or []
+            ]
+            if files:
+                await recorder.call(
+                    "download",
+                    client.get(f"/files/{rng.choice(files)['id']}", headers=headers),
+                )
+
+        await asyncio.sleep(rng.uniform(1, 3))
+
+
+async def sample_metrics(
+    client: httpx.AsyncClient, samples: List[dict], interval: float, stop
+):
+    while not stop.is_set():
+        try:
+            response = await client.get("/metrics")
+            samples.append({"t": time.monotonic(), **parse_metrics(response.text)})
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def server_report(samples: List[dict]) -> dict:
+    if len(samples) < 2:
+        return {}
+
+    elapsed = samples[-1]["t"] - samples[0]["t"]
+    capacity = max(sample.get("db_pool_capacity", 0) for sample in samples)
+    in_use = [sample.get("db_pool_checked_out", 0) for sample in samples]
+
+    def rate(name: str) -> float:
+        delta = samples[-1].get(name, 0) - samples[0].get(name, 0)
+        return round(delta / elapsed / 1_000_000, 3) if elapsed else 0.0
+
+    return {
+        "db_pool": {
+            "capacity": capacity,
+            "max_in_use": max(in_use),
+            "mean_in_use": round(sum(in_use) / len(in_use), 2),
+            # share of samples with every connection handed out
+            "saturated": round(
+                sum(1 for n in in_use if capacity and n >= capacity) / len(in_use), 3
+            ),
+        },
+        "disk_mb_per_s": {
+            "uploads_written": rate("upload_bytes_written_total"),
+            "files_served": rate("file_bytes_served_total"),
+        },
+    }
+
+
+async def rush(args) -> dict:
+    rng = random.Random(args.seed)
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="deadline-rush-")
+    corpus = [
+        entry
+        for entry in generate_corpus(corpus_dir, per_size=2, seed=args.seed)
+        if entry["size"] != "large"
+    ]
+
+    limits = httpx.Limits(max_connections=args.connections)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=timeout
+    ) as client:
+        print(f"Seeding {args.students} students and {args.teachers} teachers...")
+        seeded = await seed(
+            client, args.students, args.teachers, args.assignments, args.seed_parallel
+        )
+
+        recorder = Recorder()
+        samples = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(
+            sample_metrics(client, samples, args.sample_interval, stop)
+        )
+
+        started_at = time.monotonic()
+        deadline = started_at + args.window
+
+        async def arrive(offset: float, student: dict):
+            await asyncio.sleep(offset)
+            await student_session(
+                client,
+                recorder,
+                student,
+                seeded["assignments"],
+                corpus,
+                random.Random(rng.random()),
+            )
+
+        print(f"Replaying a {args.window:.0f}s rush...")
+        offsets = arrival_times(args.students, args.window, args.peak, args.seed)
+        await asyncio.gather(
+            *(
+                arrive(offset, student)
+                for offset, student in zip(offsets, seeded["students"])
+            ),
+            *(
+                teacher_session(
+                    client, recorder, teacher, deadline, random.Random(rng.random())
+                )
+                for teacher in seeded["teachers"]
+            ),
+        )
+        elapsed = time.monotonic() - started_at
+
+        stop.set()
+        await sampler
+
+    return {**recorder.report(elapsed), "server": server_report(samples)}
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"\n{report['requests']} requests in {report['elapsed_s']}s "
+        f"({report['rps']} req/s)\n"
+    )
+    print(
+        f"{'operation':<18}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    )
+    for name, row in report["operations"].items():
+        print(
+            f"{name:<18}{row['n']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+            f"{row['p99_ms']:>10}{row['error_rate']:>8.1%}"
+        )
+
+    server = report["server"]
+    if server:
+        pool = server["db_pool"]
+        disk = server["disk_mb_per_s"]
+        print(
+            f"\ndb pool: max {pool['max_in_use']:.0f}/{pool['capacity']:.0f} in use, "
+            f"mean {pool['mean_in_use']}, saturated {pool['saturated']:.0%} of samples"
+        )
+        print(
+            f"disk: {disk['uploads_written']} MB/s written, "
+            f"{disk['files_served']} MB/s served"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate the submission rush before a due date"
+    )
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--teachers", type=int, default=5)
+    parser.add_argument("--assignments", type=int, default=1)
+    parser.add_argument(
+        "--window", type=float, default=600, help="seconds the rush is spread over"
+    )
+    parser.add_argument(
+        "--peak", type=float, default=3, help="how strongly arrivals bunch up late"
+    )
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument(
+        "--seed-parallel", type=int, default=4, help="signups run at once when seeding"
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--corpus", help="directory for the generated uploads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(rush(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.llm.tokens import estimate_tokens
+
+WORDS = (
+    "the essay argues that evidence supports a clear thesis but the second "
+    "paragraph needs stronger sources and the conclusion restates rather than "
+    "extends the analysis overall structure is sound"
+).split()
+
+
+@dataclass
+class FakeOllamaSettings:
+    """
+    How the stand-in behaves. Times are scaled by speed, so a benchmark can
+    keep the shape of real latencies while running faster than a real gpu.
+    """
+
+    load_seconds: float = 2.0
+    prompt_tokens_per_second: float = 1500.0
+    tokens_per_second: float = 40.0
+    response_tokens: int = 200
+    # requests served at once, like OLLAMA_NUM_PARALLEL
+    parallel: int = 4
+    speed: float = 1.0
+    seed: int = 0
+    embed_dims: int = 256
+
+
+def fake_answer(prompt: str, tokens: int, seed: int = 0) -> str:
+    # the same prompt always gets the same answer
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode()).digest()
+    rng = random.Random(digest)
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+
+def fake_embedding(text: str, dims: int) -> list:
+    """
+    A hashed bag of words. Texts sharing words get similar vectors, which is
+    all retrieval needs to be tested without a real model.
+    """
+    vector = [0.0] * dims
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode()) % dims] += 1.0
+    return vector
+
+
+def create_app(settings: Optional[FakeOllamaSettings] = None) -> FastAPI:
+    """A deterministic stand-in for ollama's /api/generate and /api/embed."""
+    settings = settings or FakeOllamaSettings()
+    app = FastAPI()
+    state = {"loaded": set(), "slots": None, "requests": 0}
+
+    def plan(payload: dict) -> dict:
+        model = payload.get("model", "fake")
+        prompt = payload.get("prompt", "")
+        options = payload.get("options") or {}
+
+        load_s = 0.0
+        if model not in state["loaded"]:
+            state["loaded"].add(model)
+            load_s = settings.load_seconds
+
+        prompt_tokens = estimate_tokens(prompt)
+        response_tokens = min(
+            options.get("num_predict") or settings.response_tokens,
+            settings.response_tokens,
+        )
+        return {
+            "model": model,
+            "prompt": prompt,
+            "load_s": load_s,
+            "prompt_tokens": prompt_tokens,
+            "prompt_s": prompt_tokens / settings.prompt_tokens_per_second,
+            "response_tokens": response_tokens if prompt else 0,
+            "token_s": 1 / settings.tokens_per_second,
+        }
+
+    def final(run: dict, response: str, total_s: float) -> dict:
+        ns = 1_000_000_000
+        return {
+            "model": run["model"],
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": response,
+            "done": True,
+            "context": [len(run["prompt"]) % 32000, run["prompt_tokens"]],
+            "total_duration": int(total_s * ns),
+            "load_duration": int(run["load_s"] * ns),
+            "prompt_eval_count": run["prompt_tokens"],
+            "prompt_eval_duration": int(run["prompt_s"] * ns),
+            "eval_count": run["response_tokens"],
+            "eval_duration": int(run["response_tokens"] * run["token_s"] * ns),
+        }
+
+    async def sleep(seconds: float):
+        await asyncio.sleep(seconds / settings.speed)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        if state["slots"] is None:
+            state["slots"] = asyncio.Semaphore(settings.parallel)
+
+        payload = await request.json()
+        state["requests"] += 1
+        run = plan(payload)
+        answer = fake_answer(run["prompt"], run["response_tokens"], settings.seed)
+
+        if not payload.get("stream", True):
+            started_at = time.perf_counter()
+            async with state["slots"]:
+                await sleep(
+                    run["load_s"]
+                    + run["prompt_s"]
+                    + run["response_tokens"] * run["token_s"]
+                )
+            return JSONResponse(
+                final(run, answer, (time.perf_counter() - started_at) * settings.speed)
+            )
+
+        async def chunks():
+            started_at = time.perf_counter()
+            async with state["slots"]:
+                await sleep(run["load_s"] + run["prompt_s"])
+                words = answer.split(" ") if answer else []
+                for i, word in enumerate(words):
+                    await sleep(run["token_s"])
+                    chunk = {
+                        "model": run["model"],
+                        "response": word if i == 0 else f" {word}",
+                        "done": False,
+                    }
+                    yield json.dumps(chunk) + "\n"
+            total_s = (time.perf_counter() - started_at) * settings.speed
+            yield json.dumps(final(run, "", total_s)) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        payload = await request.json()
+        state["requests"] += 1
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        return {
+            "model": payload.get("model", "fake"),
+            "embeddings": [fake_embedding(text, settings.embed_dims) for text in texts],
+        }
+
+    @app.get("/api/stats")
+    async def stats():
+        return {"requests": state["requests"], "loaded": sorted(state["loaded"])}
+
+    return app
+
+
+class FakeOllamaServer:
+    """Runs the stand-in on a background thread, for use from a benchmark."""
+
+    def __init__(
+        self,
+        settings: Optional[FakeOllamaSettings] = None,
+        host: str = "127.0.0.1",
+        port: int = 11435,
+    ):
+        config = uvicorn.Config(
+            create_app(settings), host=host, port=port, log_level="warning"
+        )
+        self.server = uvicorn.Server(config)
+        self.url = f"http://{host}:{port}/api/generate"
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake ollama API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=1500.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    settings = FakeOllamaSettings(
+        load_seconds=args.load_seconds,
+        prompt_tokens_per_second=args.prompt_tokens_per_second,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        parallel=args.parallel,
+        speed=args.speed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
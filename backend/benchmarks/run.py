@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_ollama import FakeOllamaServer, FakeOllamaSettings
+
+PROMPT = "Summarize this essay and list its main weaknesses."
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "n": len(values),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench_stages(corpus: List[dict], persist: bool) -> Dict[str, dict]:
+    """Time every stage of analysing each file of the corpus once."""
+    from sqlmodel import Session
+
+    from app.database import engine
+    from app.models import Analytic, File
+    from app.routers.analyze import llm_analyze
+    from app.timing import Span, _current, span, totals
+
+    stages = defaultdict(list)
+    by_size = defaultdict(list)
+    for entry in corpus:
+        file_record = File(
+            filename=entry["filename"],
+            filepath=entry["filepath"],
+            content_type=entry["content_type"],
+        )
+
+        root = Span("file")
+        token = _current.set(root)
+        try:
+            # extract (which reads the file), prompt and llm spans are recorded
+            # by the app itself
+            result = await llm_analyze(file_record, PROMPT)
+
+            if persist:
+                with span("persist"):
+                    with Session(engine) as session:
+                        analytic = Analytic(data={entry["filename"]: result})
+                        session.add(analytic)
+                        session.commit()
+                        session.delete(analytic)
+                        session.commit()
+        finally:
+            _current.reset(token)
+            root.finish()
+
+        for name, entry_totals in totals(root).items():
+            stages[name].append(entry_totals["dur"])
+        stages["total"].append(root.duration)
+        by_size[f"{entry['size']} {entry['content_type']}"].append(root.duration)
+
+    return {
+        "stages": {name: summarize(values) for name, values in stages.items()},
+        "by_size": {name: summarize(values) for name, values in by_size.items()},
+    }
+
+
+async def bench_concurrency(
+    corpus: List[dict], concurrency: int, requests: int
+) -> dict:
+    """
+    Push requests through admission, scheduling, extraction and the llm call,
+    concurrency at a time, every request from a different teacher.
+    """
+    from app.models import File
+    from app.routers.analyze import run_analysis
+
+    latencies = []
+    errors = 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        entry = corpus[i % len(corpus)]
+        file_record = File(
+            filename=entry["filename"],
+            filepath=entry["filepath"],
+            content_type=entry["content_type"],
+        )
+        async with gate:
+            started_at = time.perf_counter()
+            try:
+                results = await run_analysis(uuid.uuid4(), [file_record], [PROMPT])
+                if results[entry["filename"]]["status"] != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 2),
+        **summarize(latencies),
+    }
+
+
+def print_report(report: dict) -> None:
+    print("\nPer stage (one file at a time)")
+    print(f"{'stage':<10}{'n':>6}{'mean ms':>12}{'p50 ms':>12}{'p95 ms':>12}")
+    for name, row in report["stages"].items():
+        print(
+            f"{name:<10}{row['n']:>6}{row['mean_ms']:>12}{row['p50_ms']:>12}{row['p95_ms']:>12}"
+        )
+
+    print("\nPer file kind")
+    for name, row in report["by_size"].items():
+        print(f"{name:<30}{row['mean_ms']:>12} ms mean")
+
+    print("\nEnd to end")
+    print(f"{'concurrency':<13}{'rps':>8}{'p50 ms':>12}{'p95 ms':>12}{'errors':>8}")
+    for row in report["concurrency"]:
+        print(
+            f"{row['concurrency']:<13}{row['rps']:>8}{row['p50_ms']:>12}{row['p95_ms']:>12}{row['errors']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analyze pipeline")
+    parser.add_argument("--corpus", help="directory for the generated corpus")
+    parser.add_argument("--per-size", type=int, default=2)
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--speed", type=float, default=20.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument(
+        "--persist", action="store_true", help="also time writing results to the db"
+    )
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    settings = FakeOllamaSettings(
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        parallel=args.parallel,
+        speed=args.speed,
+    )
+    server = FakeOllamaServer(settings, port=free_port())
+
+    # the app reads its settings on import, and the benchmark shouldn't be
+    # held back by the per teacher rate limits
+    os.environ["LLM_API_URL"] = server.url
+    os.environ.setdefault("LLM_USER_RATE", "1000000")
+    os.environ.setdefault("LLM_USER_BURST", "1000000")
+    os.environ.setdefault("LLM_QUEUE_LIMIT", "1000000")
+    os.environ.setdefault("LLM_USER_QUEUE_LIMIT", "1000000")
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="analyze-bench-")
+    corpus = generate_corpus(corpus_dir, args.per_size)
+
+    async def run():
+        report = await bench_stages(corpus, args.persist)
+        report["concurrency"] = [
+            await bench_concurrency(corpus, int(level), args.requests)
+            for level in args.concurrency.split(",")
+        ]
+        return report
+
+    with server:
+        report = asyncio.run(run())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
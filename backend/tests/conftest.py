@@ -8,6 +8,7 @@ from typing import Generator, Dict
 from app.main import app
 from app.database import get_session
 from app.models import User, Assignment, Submission, File, Analytic
+from app.queries import assert_max_queries, instrument_engine
 from passlib.context import CryptContext
 
 # Test database configuration
@@ -22,6 +23,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 def test_db_engine():
     """Create a test database engine."""
     engine = create_engine(TEST_DATABASE_URL)
+    instrument_engine(engine)
 
     # Create all tables
     SQLModel.metadata.drop_all(engine)  # Drop existing tables to start fresh
@@ -47,6 +49,12 @@ def db_session(test_db_engine):
     connection.close()
 
 
+@pytest.fixture
+def query_budget():
+    """Fail the test when a block runs more queries than allowed."""
+    return assert_max_queries
+
+
 @pytest.fixture
 def client(db_session):
     """Create a test client with the test database session."""
@@ -0,0 +1,151 @@
+import uuid
+
+import pytest
+from sqlmodel import Session
+
+from app.analytics import merge_results, result_condition
+from app.models import Analytic, Assignment, Submission, User
+
+
+def result(status=200, model="deepseek-r1:8b", analysis="Fine"):
+    return {"status": status, "model": model, "analysis": analysis}
+
+
+def test_merge_results_keeps_other_files(db_session, test_db_engine):
+    """Test that writers touching different files of one analytic don't clobber each other."""
+    analytic = Analytic(id=uuid.uuid4(), data={"a.txt": result()})
+    db_session.add(analytic)
+    db_session.commit()
+
+    # a second request that loaded the analytic before the first one wrote
+    with Session(test_db_engine) as other:
+        stale = other.get(Analytic, analytic.id)
+        merge_results(db_session, analytic.id, {"b.txt": result(500)})
+        db_session.commit()
+        merge_results(other, stale.id, {"c.txt": result(), "a.txt": result(404)})
+        other.commit()
+
+    db_session.refresh(analytic)
+    assert analytic.data == {
+        "a.txt": result(404),
+        "b.txt": result(500),
+        "c.txt": result(),
+    }
+
+
+def test_merge_results_into_empty_analytic(db_session):
+    """Test merging into an analytic that has no data yet."""
+    analytic = Analytic(id=uuid.uuid4())
+    db_session.add(analytic)
+    db_session.commit()
+
+    merge_results(db_session, analytic.id, {'it\'s "quoted".txt': result()})
+    db_session.commit()
+
+    db_session.refresh(analytic)
+    assert analytic.data == {'it\'s "quoted".txt': result()}
+
+
+def test_result_condition():
+    """Test that filter values can't break out of the jsonpath literal."""
+    assert result_condition() is None
+    assert result_condition(exclude_status=200) == "@.status != 200"
+    assert (
+        result_condition(status=500, model='x" || true || "')
+        == '@.status == 500 && @.model == "x\\" || true || \\""'
+    )
+
+
+@pytest.fixture
+def analyzed_submissions(db_session, test_assignment, test_submission):
+    """Store results for two submissions, one with a failed file."""
+    other_student = User(
+        username=f"student_{uuid.uuid4().hex[:8]}",
+        name="Another Student",
+        password="password123",
+        role="student",
+    )
+    other = Submission(assignment_id=test_assignment.id, student_id=other_student.id)
+    test_submission.analytic = Analytic(
+        data={"essay.txt": result(), "notes.txt": result(500, analysis="Error")}
+    )
+    other.analytic = Analytic(data={"essay.txt": result(model="llama3.2:3b")})
+    db_session.add_all([other_student, other, test_submission])
+    db_session.commit()
+    return test_submission, other
+
+
+def test_query_failed_results(
+    client, teacher_headers, test_assignment, analyzed_submissions
+):
+    """Test finding every failed file in an assignment."""
+    response = client.get(
+        "/analyze/results",
+        params={"assignment_id": str(test_assignment.id), "exclude_status": 200},
+        headers=teacher_headers,
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    hit = data["results"][0]
+    assert hit["file_name"] == "notes.txt"
+    assert hit["submission_id"] == str(analyzed_submissions[0].id)
+    assert hit["student_name"] == "Test Student"
+    assert hit["result"]["analysis"] == "Error"
+
+
+def test_query_results_filters_and_pages(
+    client, teacher_headers, test_assignment, analyzed_submissions
+):
+    """Test filtering on the model and paging through every result."""
+    response = client.get(
+        "/analyze/results", params={"model": "llama3.2:3b"}, headers=teacher_headers
+    )
+    assert [r["student_name"] for r in response.json()["results"]] == [
+        "Another Student"
+    ]
+
+    pages = [
+        client.get(
+            "/analyze/results",
+            params={
+                "assignment_id": str(test_assignment.id),
+                "limit": 2,
+                "offset": offset,
+            },
+            headers=teacher_headers,
+        ).json()
+        for offset in (0, 2, 4)
+    ]
+    assert [len(page["results"]) for page in pages] == [2, 1, 0]
+    assert [page["total"] for page in pages] == [3, 3, 3]
+    assert [(r["student_name"], r["file_name"]) for r in pages[0]["results"]] == [
+        ("Another Student", "essay.txt"),
+        ("Test Student", "essay.txt"),
+    ]
+
+
+def test_query_results_scope(
+    client, db_session, student_headers, teacher_headers, analyzed_submissions
+):
+    """Test that only teachers query results, and only for their assignments."""
+    response = client.get("/analyze/results", headers=student_headers)
+    assert response.status_code == 403
+
+    other_teacher = User(
+        username=f"teacher_{uuid.uuid4().hex[:8]}",
+        name="Other Teacher",
+        password="password123",
+        role="teacher",
+    )
+    other_assignment = Assignment(title="Other", teacher_id=other_teacher.id)
+    db_session.add_all([other_teacher, other_assignment])
+    db_session.commit()
+
+    response = client.get(
+        "/analyze/results",
+        params={"assignment_id": str(other_assignment.id)},
+        headers=teacher_headers,
+    )
+    assert response.status_code == 403
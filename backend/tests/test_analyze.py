@@ -1,10 +1,16 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 import uuid
+import os
 import httpx
 from unittest.mock import patch, MagicMock
 
-from app.models import Analytic
+from app.models import Analytic, File
+from app.routers import analyze
+from app.llm.scheduler import AdmissionError
 
 
 @pytest.fixture
@@ -152,3 +158,318 @@ def test_request_analytic_api_error(
 
     assert response.status_code == 500
     assert "Error analyzing file" in response.json()["detail"]
+
+
+@patch("httpx.AsyncClient")
+def test_request_analytic_multiple_prompts(
+    mock_async_client, client, test_analytic, test_file, teacher_headers
+):
+    """Test that follow-up prompts reuse the context of the first response."""
+    mock_client = MagicMock()
+    mock_client.__aenter__.return_value = mock_client
+    mock_client.post = AsyncMock(
+        side_effect=[
+            MockResponse(
+                status_code=200,
+                json_data={"response": "Summary", "context": [1, 2, 3]},
+            ),
+            MockResponse(status_code=200, json_data={"response": "Score: 4/5"}),
+        ]
+    )
+    mock_async_client.return_value = mock_client
+
+    response = client.post(
+        "/analyze/request",
+        json={"prompts": ["Summarize this essay", "Score it out of 5"]},
+        params={"submission_id": str(test_file.submission_id)},
+        headers=teacher_headers,
+    )
+
+    assert response.status_code == 201
+    result = response.json()["data"][test_file.filename]
+    assert result["analysis"] == "Summary"
+    assert result["model"] == mock_client.post.call_args_list[0].kwargs["json"]["model"]
+    assert [r["analysis"] for r in result["responses"]] == ["Summary", "Score: 4/5"]
+
+    # only the first request carries the document, the follow-up sends the context
+    first_payload = mock_client.post.call_args_list[0].kwargs["json"]
+    follow_up_payload = mock_client.post.call_args_list[1].kwargs["json"]
+    assert "Test file content" in first_payload["prompt"]
+    assert follow_up_payload["prompt"] == "Score it out of 5"
+    assert follow_up_payload["context"] == [1, 2, 3]
+    assert first_payload["options"]["num_ctx"] == result["tokens"]["num_ctx"]
+    assert follow_up_payload["options"]["num_ctx"] == result["tokens"]["num_ctx"]
+
+
+def test_request_analytic_requires_prompt(
+    client, test_analytic, test_file, teacher_headers
+):
+    """Test that an empty prompt list is rejected."""
+    response = client.post(
+        "/analyze/request",
+        json={"prompts": []},
+        params={"submission_id": str(test_file.submission_id)},
+        headers=teacher_headers,
+    )
+
+    assert response.status_code == 400
+    assert "At least one prompt is required" in response.json()["detail"]
+
+
+@patch("httpx.AsyncClient")
+def test_request_analytic_reasoning_budget(
+    mock_async_client, client, test_analytic, test_file, teacher_headers
+):
+    """Test that thinking controls are forwarded and token usage is recorded."""
+    mock_client = MagicMock()
+    mock_client.__aenter__.return_value = mock_client
+    mock_client.post = AsyncMock(
+        return_value=MockResponse(
+            status_code=200,
+            json_data={
+                "response": "<think>long reasoning</think>Short answer",
+                "eval_count": 120,
+            },
+        )
+    )
+    mock_async_client.return_value = mock_client
+
+    response = client.post(
+        "/analyze/request",
+        json={"prompt": "Summarize", "think": False, "num_predict": 256},
+        params={"submission_id": str(test_file.submission_id)},
+        headers=teacher_headers,
+    )
+
+    assert response.status_code == 201
+    result = response.json()["data"][test_file.filename]
+    assert result["analysis"] == "Short answer"
+    assert result["tokens"]["eval_count"] == 120
+    assert result["tokens"]["discarded_tokens"] == 120 - result["tokens"]["kept_tokens"]
+
+    payload = mock_client.post.call_args.kwargs["json"]
+    assert payload["think"] is False
+    assert payload["options"]["num_predict"] == 256
+
+
+@patch("httpx.AsyncClient")
+def test_request_analytic_batch(
+    mock_async_client, client, db_session, test_analytic, test_file, teacher_headers
+):
+    """Test that small files are packed into one request and split back up."""
+    second_path = f"uploads/submission_{test_file.submission_id}_second.txt"
+    with open(second_path, "w") as f:
+        f.write("Second file content")
+
+    second_file = File(
+        id=uuid.uuid4(),
+        filename="second.txt",
+        filepath=second_path,
+        content_type="text/plain",
+        submission_id=test_file.submission_id,
+    )
+    db_session.add(second_file)
+    db_session.commit()
+
+    mock_client = MagicMock()
+    mock_client.__aenter__.return_value = mock_client
+    mock_client.post = AsyncMock(
+        return_value=MockResponse(
+            status_code=200,
+            json_data={
+                "response": f"### FILE: {test_file.filename}\nFirst answer\n"
+                "### FILE: second.txt\nSecond answer"
+            },
+        )
+    )
+    mock_async_client.return_value = mock_client
+
+    try:
+        response = client.post(
+            "/analyze/request",
+            json={"prompt": "Grade this answer", "batch": True},
+            params={"submission_id": str(test_file.submission_id)},
+            headers=teacher_headers,
+        )
+    finally:
+        os.remove(second_path)
+
+    assert response.status_code == 201
+    data = response.json()["data"]
+    assert data[test_file.filename]["analysis"] == "First answer"
+    assert data["second.txt"]["analysis"] == "Second answer"
+    assert mock_client.post.call_count == 1
+
+
+def test_batch_slot_per_call_and_context(tmp_path):
+    """Test that every batched call waits for a slot and packs fit the context."""
+    files = []
+    for name, size in [("a.txt", 1000), ("b.txt", 1000), ("c.txt", 1000)] + [
+        ("d.txt", 1000),
+        ("long.txt", 8000),
+    ]:
+        path = tmp_path / name
+        path.write_text("word " * (size // 5))
+        files.append(File(filename=name, filepath=str(path), content_type="text/plain"))
+
+    slots = []
+
+    @asynccontextmanager
+    async def slot(user_id, priority):
+        slots.append(priority)
+        yield
+
+    async def packed(documents, *args):
+        return {
+            d[0].filename: {"status": 200, "batch": len(documents)} for d in documents
+        }
+
+    with patch("app.routers.analyze.scheduler.slot", slot), patch(
+        "app.routers.analyze.analyze_packed", side_effect=packed
+    ) as analyze_packed, patch(
+        "app.routers.analyze.analyze_text",
+        new_callable=AsyncMock,
+        return_value={"status": 200},
+    ) as analyze_text, patch(
+        # a model with room for three small files and their answers
+        "app.routers.analyze.max_num_ctx",
+        return_value=3000,
+    ):
+        results = asyncio.run(
+            analyze.llm_analyze_batch(
+                uuid.uuid4(), files, "Grade this", num_predict=500, priority="bulk"
+            )
+        )
+
+    assert list(results) == [f.filename for f in files]
+    assert [results[n].get("batch") for n in ("a.txt", "b.txt", "c.txt")] == [3] * 3
+    assert analyze_packed.call_count == 1
+    # the file that didn't fit and the long one, each on its own
+    assert [c.args[0].filename for c in analyze_text.call_args_list] == [
+        "long.txt",
+        "d.txt",
+    ]
+    assert slots == ["bulk"] * 3
+
+
+def test_request_analytic_batch_options(
+    client, test_analytic, test_file, teacher_headers
+):
+    """Test that batching with several prompts or retrieval is refused."""
+    for body in (
+        {"prompts": ["Summarize", "Grade it"], "batch": True},
+        {"prompt": "Summarize", "batch": True, "retrieve": True},
+    ):
+        response = client.post(
+            "/analyze/request",
+            json=body,
+            params={"submission_id": str(test_file.submission_id)},
+            headers=teacher_headers,
+        )
+        assert response.status_code == 422
+
+
+@patch("app.routers.analyze.retrieve_chunks", new_callable=AsyncMock)
+@patch("httpx.AsyncClient")
+def test_request_analytic_retrieve(
+    mock_async_client,
+    mock_retrieve,
+    client,
+    test_analytic,
+    test_file,
+    teacher_headers,
+    mock_httpx_client,
+):
+    """Test that only the retrieved parts are sent, and all of it on failure."""
+    mock_httpx_client.post = AsyncMock(
+        return_value=MockResponse(status_code=200, json_data={"response": "Answer"})
+    )
+    mock_async_client.return_value = mock_httpx_client
+    mock_retrieve.side_effect = [
+        ("Relevant part", {"used": True, "full_tokens": 5000, "sent_tokens": 4}),
+        httpx.ConnectError("embedding model unavailable"),
+    ]
+
+    def request(prompt):
+        return client.post(
+            "/analyze/request",
+            json={"prompts": [prompt, "Any follow-up"], "retrieve": True},
+            params={"submission_id": str(test_file.submission_id)},
+            headers=teacher_headers,
+        )
+
+    response = request("What does it say about question 2?")
+
+    assert response.status_code == 201
+    result = response.json()["data"][test_file.filename]
+    assert result["retrieval"]["used"] is True
+    assert mock_retrieve.call_args.args[2] == [
+        "What does it say about question 2?",
+        "Any follow-up",
+    ]
+    prompt = mock_httpx_client.post.call_args_list[0].kwargs["json"]["prompt"]
+    assert "Relevant part" in prompt
+    assert "Test file content" not in prompt
+
+    response = request("What does it say about question 3?")
+
+    assert response.status_code == 201
+    result = response.json()["data"][test_file.filename]
+    assert result["retrieval"] == {
+        "used": False,
+        "error": "embedding model unavailable",
+    }
+    prompt = mock_httpx_client.post.call_args.kwargs["json"]["prompt"]
+    assert "Test file content" in prompt
+
+
+def test_request_analytic_rate_limited(
+    client, test_analytic, test_file, teacher_headers
+):
+    """Test that requests over the admission limits get 429 with Retry-After."""
+    with patch(
+        "app.routers.analyze.scheduler.admit",
+        side_effect=AdmissionError("Too many analysis requests, try again later", 12),
+    ):
+        response = client.post(
+            "/analyze/request",
+            json={"prompt": "Please analyze this submission"},
+            params={"submission_id": str(test_file.submission_id)},
+            headers=teacher_headers,
+        )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "12"
+
+
+def test_request_analytic_priority_and_cost(
+    client, test_analytic, test_file, teacher_headers
+):
+    """Test that requests are bulk unless they ask otherwise, and pay per call."""
+    priorities = []
+
+    @asynccontextmanager
+    async def slot(user_id, priority):
+        priorities.append(priority)
+        yield
+
+    def request(**body):
+        return client.post(
+            "/analyze/request",
+            json={"prompts": ["Summarize", "Grade it"], **body},
+            params={"submission_id": str(test_file.submission_id)},
+            headers=teacher_headers,
+        )
+
+    with patch("app.routers.analyze.scheduler") as scheduler, patch(
+        "app.routers.analyze.llm_analyze",
+        new_callable=AsyncMock,
+        return_value={"status": 200, "analysis": "Fine"},
+    ):
+        scheduler.slot = slot
+        assert request().status_code == 201
+        assert request(priority="interactive").status_code == 201
+
+    assert priorities == ["bulk", "interactive"]
+    # one file, a prompt and a follow-up
+    assert [c.kwargs["cost"] for c in scheduler.admit.call_args_list] == [2, 2]
@@ -206,6 +206,34 @@ def test_create_submission(
     mock_copy2.assert_called()
 
 
+def test_create_submission_rejects_files(
+    client, db_session, test_assignment, student_headers
+):
+    """Test that submissions over the limits or of other types are refused."""
+    test_assignment.max_files = 1
+    db_session.add(test_assignment)
+    db_session.commit()
+
+    form_data = {"assignment_id": str(test_assignment.id)}
+
+    files = [
+        ("files", ("one.txt", io.BytesIO(b"one"), "text/plain")),
+        ("files", ("two.txt", io.BytesIO(b"two"), "text/plain")),
+    ]
+    response = client.post(
+        "/assignments/submit", data=form_data, files=files, headers=student_headers
+    )
+    assert response.status_code == 400
+
+    files = {
+        "files": ("photo.pdf", io.BytesIO(b"\x89PNG\r\n\x1a\n"), "application/pdf")
+    }
+    response = client.post(
+        "/assignments/submit", data=form_data, files=files, headers=student_headers
+    )
+    assert response.status_code == 415
+
+
 def test_get_assignment_submissions(
     client, test_assignment, test_submission, teacher_headers, student_headers
 ):
@@ -227,3 +255,33 @@ def test_get_assignment_submissions(
     submissions = response.json()
     assert len(submissions) >= 1
     assert all(s["student_id"] == str(test_submission.student_id) for s in submissions)
+
+
+def test_get_assignment_submissions_query_budget(
+    client, db_session, test_assignment, test_student, teacher_headers, query_budget
+):
+    """Test that listing submissions doesn't load files one submission at a time."""
+    for i in range(6):
+        submission = Submission(
+            assignment_id=test_assignment.id, student_id=test_student.id
+        )
+        db_session.add(submission)
+        db_session.add(
+            File(
+                filename=f"essay{i}.txt",
+                filepath=f"uploads/essay{i}.txt",
+                size=1,
+                content_type="text/plain",
+                submission_id=submission.id,
+            )
+        )
+    db_session.commit()
+
+    with query_budget(8):
+        response = client.get(
+            f"/assignments/{test_assignment.id}/submissions", headers=teacher_headers
+        )
+
+    assert response.status_code == 200
+    assert len(response.json()) == 6
+    assert all(len(s["files"]) == 1 for s in response.json())
@@ -0,0 +1,46 @@
+from app.llm.batching import build_batch_prompt, pack_files, split_batch_response
+
+
+def test_pack_files_respects_budget():
+    """Test that files are grouped without exceeding the token budget."""
+    groups = pack_files([300, 300, 500, 200, 900], budget=1000)
+
+    assert groups == [[0, 1, 3], [2], [4]]
+
+
+def test_pack_files_leaves_room_for_answers():
+    """Test that a group's content and an answer per file fit in the room."""
+    groups = pack_files([300, 300, 300, 300], budget=4096, room=1500, reserve=200)
+    # three files need 900 + 3 * 200 tokens, a fourth wouldn't fit
+    assert groups == [[0, 1, 2], [3]]
+
+
+def test_build_batch_prompt_delimits_files():
+    """Test that every file gets its own section and is named in the instructions."""
+    prompt = build_batch_prompt(
+        "Grade this answer",
+        [("a.txt", "text/plain", "first answer"), ("b.txt", "text/plain", "second")],
+    )
+
+    assert "=== FILE: a.txt (File Type: text/plain) ===\nfirst answer" in prompt
+    assert "=== FILE: b.txt (File Type: text/plain) ===\nsecond" in prompt
+    assert "Grade this answer" in prompt
+    assert "### FILE: <file name>" in prompt
+
+
+def test_split_batch_response():
+    """Test that a packed response is split back into answers per file."""
+    text = "### FILE: a.txt\nGood work.\n\n### FILE: **b.txt**\nMissing a test case."
+
+    assert split_batch_response(text, ["a.txt", "b.txt"]) == {
+        "a.txt": "Good work.",
+        "b.txt": "Missing a test case.",
+    }
+
+
+def test_split_batch_response_missing_answer():
+    """Test that a response without an answer for every file is rejected."""
+    assert (
+        split_batch_response("### FILE: a.txt\nGood work.", ["a.txt", "b.txt"]) is None
+    )
+    assert split_batch_response("Both files look fine.", ["a.txt", "b.txt"]) is None
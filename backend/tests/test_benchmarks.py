@@ -0,0 +1,93 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.extraction import extract_text
+from app.models import File
+from benchmarks.corpus import generate_corpus
+from benchmarks.deadline_rush import arrival_times, parse_metrics
+from benchmarks.fake_ollama import FakeOllamaSettings, create_app
+
+FAST = FakeOllamaSettings(load_seconds=0.5, speed=1000.0, response_tokens=20)
+
+
+def test_fake_ollama_generate():
+    """Test that the fake answers deterministically and reports timings."""
+    client = TestClient(create_app(FAST))
+    payload = {"model": "fake", "prompt": "Summarize this", "stream": False}
+
+    first = client.post("/api/generate", json=payload).json()
+    second = client.post("/api/generate", json=payload).json()
+
+    assert first["response"] == second["response"]
+    assert first["eval_count"] == 20
+    assert first["eval_duration"] == 20 / FAST.tokens_per_second * 1e9
+    # only the first request loads the model
+    assert first["load_duration"] > 0
+    assert second["load_duration"] == 0
+
+
+def test_fake_ollama_streaming():
+    """Test that streamed chunks add up to the same answer."""
+    client = TestClient(create_app(FAST))
+    payload = {
+        "model": "fake",
+        "prompt": "Summarize this",
+        "options": {"num_predict": 5},
+    }
+
+    response = client.post("/api/generate", json={**payload, "stream": False}).json()
+    lines = client.post("/api/generate", json=payload).text.splitlines()
+    chunks = [json.loads(line) for line in lines]
+
+    assert "".join(chunk["response"] for chunk in chunks) == response["response"]
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] == 5
+
+
+def test_corpus_pdf_extracts(tmp_path):
+    """Test that generated PDFs extract with their running headers removed."""
+    corpus = generate_corpus(str(tmp_path), per_size=1)
+    pdf = next(entry for entry in corpus if entry["filename"] == "medium0.pdf")
+    txt = next(entry for entry in corpus if entry["filename"] == "medium0.txt")
+
+    text, report = extract_text(
+        File(
+            filename=pdf["filename"],
+            filepath=pdf["filepath"],
+            content_type=pdf["content_type"],
+        )
+    )
+
+    assert "Essay medium 0" not in text
+    assert "Page 1 of" not in text
+    assert report["bytes_saved"] > 0
+    assert text.split()[:20] == open(txt["filepath"]).read().split()[:20]
+
+
+def test_deadline_rush_arrivals():
+    """Test that arrivals bunch up towards the deadline."""
+    offsets = arrival_times(1000, window=600, peak=3)
+
+    assert offsets == sorted(offsets)
+    assert 0 <= offsets[0] and offsets[-1] <= 600
+    last_minute = sum(1 for offset in offsets if offset >= 540)
+    first_minute = sum(1 for offset in offsets if offset < 60)
+    assert last_minute > 10 * first_minute
+
+
+def test_deadline_rush_metrics():
+    """Test reading pool and disk numbers from a metrics scrape."""
+    text = (
+        "# TYPE db_pool_checked_out gauge\n"
+        'db_pool_checked_out{pid="1"} 3.0\n'
+        'db_pool_checked_out{pid="2"} 4.0\n'
+        "# TYPE upload_bytes_written counter\n"
+        "upload_bytes_written_total 2048.0\n"
+        "# TYPE http_requests counter\n"
+        "http_requests_total 9.0\n"
+    )
+
+    assert parse_metrics(text) == {
+        "db_pool_checked_out": 7.0,
+        "upload_bytes_written_total": 2048.0,
+    }
@@ -0,0 +1,106 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.llm import cancellation, stats
+from app.llm.cancellation import (
+    LLM_REQUEST_TIMEOUT,
+    LLM_TIMEOUT,
+    ClientDisconnected,
+    llm_timeout,
+    request_timeout,
+    run_until_disconnected,
+    set_deadline,
+)
+from app.llm.limiter import AdaptiveLimiter
+
+
+class FakeRequest:
+    """Request that reports a disconnect after a number of checks."""
+
+    def __init__(self, disconnect_after):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks >= self.disconnect_after
+
+
+def test_request_timeout():
+    """Test that the client can shorten but not extend the request budget."""
+    assert request_timeout(None) == LLM_REQUEST_TIMEOUT
+    assert request_timeout("10") == 10
+    assert request_timeout("not a number") == LLM_REQUEST_TIMEOUT
+    assert request_timeout(str(LLM_REQUEST_TIMEOUT * 10)) == LLM_REQUEST_TIMEOUT
+
+
+def test_llm_timeout_follows_deadline():
+    """Test that outbound calls never wait past the request deadline."""
+
+    async def timeouts():
+        without_deadline = llm_timeout()
+        set_deadline(5)
+        return without_deadline, llm_timeout()
+
+    without_deadline, with_deadline = asyncio.run(timeouts())
+
+    assert without_deadline == LLM_TIMEOUT
+    assert with_deadline <= 5
+
+
+def test_run_until_disconnected_returns_result():
+    """Test that work finishing first returns its result."""
+
+    async def run():
+        return await run_until_disconnected(
+            FakeRequest(disconnect_after=100), asyncio.sleep(0, result="done")
+        )
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_run_until_disconnected_cancels_work():
+    """Test that the work is cancelled once the client goes away."""
+    cancelled = []
+
+    async def generate():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with patch.object(cancellation, "DISCONNECT_POLL_SECONDS", 0.01):
+            await run_until_disconnected(FakeRequest(disconnect_after=2), generate())
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(run())
+    assert cancelled == [True]
+
+
+def test_abandoned_generation_is_counted_as_wasted():
+    """Test that time spent on a cancelled outbound call is recorded."""
+    stats.reset()
+    limiter = AdaptiveLimiter(initial=2)
+
+    async def call():
+        async with limiter.acquire("deepseek-r1:8b"):
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    counters = stats.snapshot()["counters"]
+    assert counters["abandoned_generations"] == 1
+    assert counters["wasted_generation_seconds"] > 0
+    assert limiter.in_flight == 0
+    assert limiter.limit == 2
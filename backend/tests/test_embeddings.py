@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import uuid
+
+import httpx
+import numpy as np
+import pytest
+
+from app.llm import embeddings
+from app.llm.cancellation import LLM_TIMEOUT, set_deadline
+from app.llm.embeddings import (
+    EmbeddingIndex,
+    chunk_spans,
+    embed,
+    normalize,
+    retrieve,
+)
+from app.llm.limiter import AdaptiveLimiter
+from benchmarks.corpus import essay_text
+from benchmarks.fake_ollama import create_app
+
+TOPIC = (
+    "Glaciers carve valleys as ice grinds over bedrock. Moraines mark "
+    "where a glacier stopped, and meltwater leaves lakes behind."
+)
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBED_INDEX_DIR", str(tmp_path))
+    return tmp_path
+
+
+def fake_client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+
+
+def test_chunk_spans_cover_text():
+    """Test that chunks cover the text, overlap a little and end on a break."""
+    text = essay_text(20_000, "chunks")
+    spans = chunk_spans(text, size=1000, overlap=100)
+
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert (spans[:, 1] - spans[:, 0] <= 1000).all()
+    # every chunk starts before the previous one ends
+    assert (spans[1:, 0] <= spans[:-1, 1]).all()
+    assert all(text[end - 1] in " .\n" for _, end in spans[:-1])
+    assert chunk_spans("").shape == (0, 2)
+
+
+def test_top_k_cosine():
+    """Test picking the chunks closest to any question, in document order."""
+    index = EmbeddingIndex(
+        vectors=normalize(
+            np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0]], dtype=np.float32)
+        ),
+        spans=np.array([[0, 1], [1, 2], [2, 3], [3, 4]]),
+        model="fake",
+        digest="",
+    )
+    queries = normalize(np.array([[0, 0, 5], [0.1, 1, 0]], dtype=np.float32))
+
+    assert index.top_k(queries, 2).tolist() == [1, 2]
+    assert index.top_k(queries, 10).tolist() == [0, 1, 2, 3]
+
+
+def test_index_round_trip(tmp_path):
+    """Test that an index is stored as compact float32 arrays."""
+    index = EmbeddingIndex(
+        vectors=normalize(np.random.rand(5, 8).astype(np.float32)),
+        spans=np.arange(10).reshape(5, 2),
+        model="fake",
+        digest="abc",
+    )
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = EmbeddingIndex.load(path)
+    assert loaded.vectors.dtype == np.float32
+    assert np.array_equal(loaded.vectors, index.vectors)
+    assert loaded.model == "fake" and loaded.digest == "abc"
+
+
+def test_retrieve_sends_relevant_chunks(index_dir, monkeypatch):
+    """Test that a long document is cut down to the parts a question is about."""
+    monkeypatch.setattr(embeddings, "RAG_MIN_TOKENS", 1000)
+    parts = [essay_text(3000, f"filler{i}") for i in range(10)]
+    parts.insert(6, TOPIC)
+    text = "\n\n".join(parts)
+    file_id = uuid.uuid4()
+    app = create_app()
+
+    async def run():
+        async with fake_client(app) as client:
+            first = await retrieve(
+                file_id, text, ["How do glaciers carve valleys?"], 2, client
+            )
+            # the stored index is reused, only the question is embedded
+            monkeypatch.setattr(embeddings, "build_index", None)
+            again = await retrieve(
+                file_id, text, ["Moraines and meltwater lakes"], 2, client
+            )
+            return first, again
+
+    (selected, report), (selected_again, _) = asyncio.run(run())
+
+    assert "Glaciers carve valleys" in selected
+    assert report["used"] and report["sent_tokens"] < report["full_tokens"] / 4
+    assert len(report["selected_chunks"]) == 2
+    assert "Moraines" in selected_again
+    assert os.listdir(index_dir) == [f"{file_id}.npz"]
+
+
+def test_retrieve_short_document(index_dir):
+    """Test that short documents are sent whole without calling ollama."""
+    text, report = asyncio.run(retrieve(uuid.uuid4(), "A short essay.", ["Summarize"]))
+
+    assert text == "A short essay."
+    assert report == {"used": False, "full_tokens": 4}
+    assert os.listdir(index_dir) == []
+
+
+def test_embed_uses_limiter_and_deadline(monkeypatch):
+    """Test that embedding calls wait for the limiter and stop at the deadline."""
+    limiter = AdaptiveLimiter(initial=1)
+    monkeypatch.setattr(embeddings, "limiter", limiter)
+    monkeypatch.setattr(embeddings, "EMBED_BATCH", 2)
+    seen = []
+
+    def handler(request):
+        seen.append((limiter.in_flight, request.extensions["timeout"]["read"]))
+        inputs = json.loads(request.content)["input"]
+        return httpx.Response(200, json={"embeddings": [[1.0, 0.0]] * len(inputs)})
+
+    async def run():
+        set_deadline(5)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await embed(client, ["a", "b", "c"], "fake")
+
+    vectors = asyncio.run(run())
+
+    assert vectors.shape == (3, 2)
+    assert [in_flight for in_flight, _ in seen] == [1, 1]
+    assert all(timeout <= min(5, LLM_TIMEOUT) for _, timeout in seen)
+    assert limiter.in_flight == 0
+    assert "fake" in limiter.snapshot()["rtt_per_token"]
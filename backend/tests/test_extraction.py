@@ -0,0 +1,134 @@
+import pytest
+
+from app import extraction
+from app.extraction import extract_text, normalize_pages, normalize_text, read_text
+from app.models import File
+
+
+def test_normalize_text_collapses_whitespace():
+    """Test that runs of spaces and blank lines are squeezed."""
+    text = "  The   quick\t\tbrown fox  \n\n\n\n\njumps over   the dog  "
+    assert normalize_text(text) == "The quick brown fox\n\njumps over the dog"
+
+
+def test_normalize_text_rejoins_hyphenation():
+    """Test that words split across lines are rejoined."""
+    assert normalize_text("plants use photo-\nsynthesis") == "plants use photosynthesis"
+    # capitalised continuations are most likely real hyphens, not line breaks
+    assert normalize_text("North-\nAmerica") == "North-\nAmerica"
+
+
+def test_normalize_pages_drops_repeated_headers_and_footers():
+    """Test that running headers, footers and page numbers are removed."""
+    bodies = [
+        "Plants convert light into chemical energy.",
+        "Chlorophyll absorbs mostly red and blue light.",
+        "The Calvin cycle fixes carbon dioxide.",
+        "Oxygen is released as a by-product.",
+    ]
+    pages = [
+        f"Biology 101 - Lab Report\n{body}\nPage {n} of 4"
+        for n, body in enumerate(bodies, start=1)
+    ]
+
+    text, report = normalize_pages(pages)
+
+    assert "Biology 101" not in text
+    assert "Page" not in text
+    for body in bodies:
+        assert body in text
+    assert report["bytes_saved"] > 0
+    assert report["tokens_saved"] > 0
+    assert report["bytes_before"] - report["bytes_after"] == report["bytes_saved"]
+
+
+def test_normalize_pages_keeps_single_page_content():
+    """Test that a single page document keeps its first and last lines."""
+    text, report = normalize_pages(["Title\nSome content\n3"])
+
+    assert text == "Title\nSome content\n3"
+    assert report["bytes_saved"] == 0
+
+
+def test_extract_text_keeps_code_layout(tmp_path):
+    """Test that indentation and line end hyphens of uploaded code survive."""
+    code = (
+        "def area(width, height):\n"
+        "    total = width -\n"
+        "        height\n"
+        "    return total\n"
+    )
+    path = tmp_path / "solution.py"
+    path.write_text(code + "   \n\n\n\n# done  \n")
+
+    text, _ = extract_text(
+        File(filename="solution.py", filepath=str(path), content_type="text/x-python")
+    )
+
+    # only trailing whitespace and the extra blank lines are dropped
+    assert text == code + "\n# done"
+
+
+@pytest.mark.parametrize("mmap_min_bytes", [0, 10**9])
+def test_read_text_stays_within_budget(tmp_path, monkeypatch, mmap_min_bytes):
+    """Test that only the budget is decoded, memory mapped or buffered."""
+    monkeypatch.setattr(extraction, "EXTRACT_MMAP_MIN_BYTES", mmap_min_bytes)
+    # multi-byte characters get split across chunk boundaries
+    monkeypatch.setattr(extraction, "READ_CHUNK_BYTES", 7)
+    path = tmp_path / "log.txt"
+    path.write_text("héllo wörld " * 1000, encoding="utf-8")
+
+    text, truncated = read_text(str(path), max_bytes=140)
+
+    assert truncated
+    assert len(text.encode("utf-8")) <= 140
+    assert text.startswith("héllo wörld héllo")
+    assert "\ufffd" not in text
+
+    text, truncated = read_text(str(path), max_bytes=10**6)
+    assert not truncated
+    assert text == "héllo wörld " * 1000
+
+
+def test_extract_text_reports_truncation(tmp_path, monkeypatch):
+    """Test that a file over the budget is cut short and reported."""
+    monkeypatch.setattr(extraction, "EXTRACT_MAX_BYTES", 100)
+    path = tmp_path / "notes.txt"
+    path.write_text("page one\f" + "x" * 500)
+
+    text, report = extract_text(
+        File(filename="notes.txt", filepath=str(path), content_type="text/plain")
+    )
+
+    assert text.startswith("page one")
+    assert text.count("x") == 100 - len("page one\f")
+    assert report["read_truncated"]
+
+
+def test_extract_pdf_budget_counts_bytes(tmp_path, monkeypatch):
+    """Test that non-ASCII PDF text is held to the budget in bytes."""
+    import pypdf
+
+    class Page:
+        def __init__(self, text):
+            self.text = text
+
+        def extract_text(self):
+            return self.text
+
+    class Reader:
+        def __init__(self, stream):
+            self.pages = [Page("héllo wörld " * 10), Page("ünused")]
+
+    monkeypatch.setattr(pypdf, "PdfReader", Reader)
+    path = tmp_path / "essay.pdf"
+    path.write_bytes(b"%PDF-1.4")
+
+    # the budget ends halfway through an é
+    pages, truncated = extraction.extract_pages(
+        File(filename="essay.pdf", filepath=str(path)), max_bytes=16
+    )
+
+    assert truncated
+    assert pages == ["héllo wörld h"]
+    assert len(pages[0].encode("utf-8")) <= 16
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import uuid
+
+import pytest
+
+from app import gradebook
+from app.models import Analytic, Assignment, Submission, User
+
+
+@pytest.fixture
+def graded_submissions(db_session, test_assignment, test_submission):
+    """Add results to the test submission and a second one without any."""
+    other_student = User(
+        username=f"student_{uuid.uuid4().hex[:8]}",
+        name="Another Student",
+        password="password123",
+        role="student",
+    )
+    ungraded = Submission(
+        assignment_id=test_assignment.id,
+        student_id=other_student.id,
+        comment='Late, "sorry"',
+    )
+    test_submission.analytic = Analytic(
+        data={
+            "essay.txt": {
+                "status": 200,
+                "model": "deepseek-r1:8b",
+                "prompt": "Grade this",
+                "analysis": "Good work,\nwell argued",
+                "tokens": {"eval_count": 42},
+            },
+            "notes.txt": {"status": 500, "analysis": "Error: timed out"},
+        }
+    )
+    db_session.add_all([other_student, ungraded, test_submission])
+    db_session.commit()
+    return test_submission, ungraded
+
+
+def test_export_csv(client, teacher_headers, test_assignment, graded_submissions):
+    """Test exporting a row per file, and a row for submissions without results."""
+    response = client.get("/assignments/export", headers=teacher_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert "gradebook.csv" in response.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(r["student_name"], r["file_name"], r["status"]) for r in rows] == [
+        ("Another Student", "", ""),
+        ("Test Student", "essay.txt", "200"),
+        ("Test Student", "notes.txt", "500"),
+    ]
+    assert rows[0]["comment"] == 'Late, "sorry"'
+    assert rows[1]["analysis"] == "Good work,\nwell argued"
+    assert rows[1]["assignment_title"] == test_assignment.title
+    assert rows[1]["submission_id"] == str(graded_submissions[0].id)
+
+
+def test_export_ndjson(
+    client, db_session, teacher_headers, test_teacher, graded_submissions
+):
+    """Test exporting whole results as JSON lines, for one assignment."""
+    other = Assignment(title="Other assignment", teacher_id=test_teacher.id)
+    db_session.add(other)
+    db_session.commit()
+    db_session.add(
+        Submission(
+            assignment_id=other.id,
+            student_id=graded_submissions[0].student_id,
+            analytic=Analytic(data={"other.txt": {"status": 200}}),
+        )
+    )
+    db_session.commit()
+
+    response = client.get(
+        "/assignments/export",
+        params={"format": "ndjson", "assignment_id": str(other.id)},
+        headers=teacher_headers,
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["assignment_title"] == "Other assignment"
+    assert lines[0]["file_name"] == "other.txt"
+    assert lines[0]["result"] == {"status": 200}
+
+    response = client.get(
+        "/assignments/export", params={"format": "ndjson"}, headers=teacher_headers
+    )
+    results = [json.loads(line)["result"] for line in response.text.splitlines()]
+    # ordered by assignment, then student, the ungraded submission has no result
+    assert results[0] == {"status": 200}
+    assert results[1] is None
+    assert results[2]["tokens"] == {"eval_count": 42}
+    assert results[3]["status"] == 500
+
+
+def test_export_streams_in_batches(
+    db_session,
+    test_db_engine,
+    monkeypatch,
+    test_teacher,
+    test_assignment,
+    test_student,
+    query_budget,
+):
+    """Test that rows are fetched in batches from one query, not all at once."""
+    monkeypatch.setattr(gradebook, "EXPORT_BATCH", 10)
+    db_session.add_all(
+        Submission(
+            assignment_id=test_assignment.id,
+            student_id=test_student.id,
+            analytic=Analytic(data={f"file{j}.txt": {"status": 200} for j in range(3)}),
+        )
+        for _ in range(20)
+    )
+    db_session.commit()
+
+    statement = gradebook.export_statement(test_teacher.id)
+    with query_budget(1):
+        chunks = list(gradebook.stream_csv(test_db_engine, statement))
+
+    # the header, then 60 rows in batches of 10
+    assert len(chunks) == 7
+    assert sum(chunk.count("\n") for chunk in chunks) == 61
+
+
+def test_export_scope(client, db_session, student_headers, teacher_headers):
+    """Test that only teachers export, and only their own assignments."""
+    response = client.get("/assignments/export", headers=student_headers)
+    assert response.status_code == 403
+
+    other_teacher = User(
+        username=f"teacher_{uuid.uuid4().hex[:8]}",
+        name="Other Teacher",
+        password="password123",
+        role="teacher",
+    )
+    other_assignment = Assignment(title="Other", teacher_id=other_teacher.id)
+    db_session.add_all([other_teacher, other_assignment])
+    db_session.commit()
+
+    response = client.get(
+        "/assignments/export",
+        params={"assignment_id": str(other_assignment.id)},
+        headers=teacher_headers,
+    )
+    assert response.status_code == 403
+
+
+def test_export_closes_its_session(test_db_engine, test_teacher, graded_submissions):
+    """Test that an export dropped halfway gives its connection back."""
+    statement = gradebook.export_statement(test_teacher.id)
+    checked_out = test_db_engine.pool.checkedout()
+    chunks = gradebook.stream_ndjson(test_db_engine, statement)
+
+    next(chunks)
+    assert test_db_engine.pool.checkedout() == checked_out + 1
+
+    # what starlette does when the client goes away mid stream
+    chunks.close()
+    assert test_db_engine.pool.checkedout() == checked_out
@@ -0,0 +1,99 @@
+import asyncio
+from unittest.mock import patch
+
+from app.llm import limiter as limiter_module
+from app.llm.limiter import AdaptiveLimiter
+from app.llm.scheduler import FairScheduler
+
+
+def run_call(limiter, seconds, tokens=10, failed=False, model="deepseek-r1:8b"):
+    """Run one call through the limiter that appears to take the given time."""
+
+    async def call():
+        with patch.object(limiter_module.time, "monotonic", side_effect=[0.0, seconds]):
+            async with limiter.acquire(model) as handle:
+                handle.tokens = tokens
+                handle.failed = failed
+
+    asyncio.run(call())
+
+
+def test_limit_grows_while_latency_is_flat():
+    """Test additive increase while saturated and latency stays at baseline."""
+    limiter = AdaptiveLimiter(initial=1, max_limit=4)
+
+    for _ in range(10):
+        run_call(limiter, 1.0)
+
+    # one call at a time only uses up a limit of 1, so it grows no further
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_limit_backs_off_when_latency_rises():
+    """Test multiplicative decrease once latency per token climbs."""
+    limiter = AdaptiveLimiter(initial=4, max_limit=8)
+
+    run_call(limiter, 1.0)
+    before = limiter.limit
+    for _ in range(10):
+        run_call(limiter, 5.0)
+
+    assert limiter.limit < before
+    snapshot = limiter.snapshot()["rtt_per_token"]["deepseek-r1:8b"]
+    assert snapshot["ewma"] > snapshot["min"]
+
+
+def test_limit_backs_off_on_failures():
+    """Test that failed calls shrink the limit down to the minimum."""
+    limiter = AdaptiveLimiter(initial=4, min_limit=1)
+
+    for _ in range(30):
+        run_call(limiter, 1.0, failed=True)
+
+    assert limiter.limit == 1
+
+
+def test_latency_is_normalized_per_token():
+    """Test that a long answer isn't mistaken for overload."""
+    limiter = AdaptiveLimiter(initial=2, max_limit=4)
+
+    run_call(limiter, 1.0, tokens=10)
+    before = limiter.limit
+    run_call(limiter, 10.0, tokens=100)
+
+    assert limiter.limit >= before
+
+
+def test_acquire_waits_for_capacity():
+    """Test that calls over the limit wait until one finishes."""
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+
+    async def calls():
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.acquire("deepseek-r1:8b"):
+                await release.wait()
+
+        first = asyncio.create_task(hold())
+        second = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1
+        assert limiter.snapshot()["waiting"] == 1
+
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(calls())
+    assert limiter.in_flight == 0
+
+
+def test_scheduler_follows_limiter():
+    """Test that the scheduler's slot count tracks the adaptive limit."""
+    limiter = AdaptiveLimiter(initial=3, max_limit=8)
+    scheduler = FairScheduler(limiter=limiter)
+
+    assert scheduler.limit == 3
+    limiter.limit = 5.5
+    assert scheduler.limit == 5
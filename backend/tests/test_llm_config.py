@@ -0,0 +1,27 @@
+from unittest.mock import patch
+
+from app.llm import config
+from app.llm.config import generation_settings
+
+
+def test_generation_settings_defaults():
+    """Test that nothing is forced on the model when unconfigured."""
+    with patch.object(config, "LLM_THINK", None), patch.object(
+        config, "LLM_NUM_PREDICT", None
+    ), patch.object(config, "LLM_OPTIONS", {}):
+        assert generation_settings() == {"options": {}}
+
+
+def test_generation_settings_request_overrides_deployment():
+    """Test that per-request values take precedence over env defaults."""
+    with patch.object(config, "LLM_THINK", True), patch.object(
+        config, "LLM_NUM_PREDICT", 4096
+    ), patch.object(config, "LLM_OPTIONS", {"temperature": 0.2}):
+        assert generation_settings() == {
+            "options": {"temperature": 0.2, "num_predict": 4096},
+            "think": True,
+        }
+        assert generation_settings(think=False, num_predict=512) == {
+            "options": {"temperature": 0.2, "num_predict": 512},
+            "think": False,
+        }
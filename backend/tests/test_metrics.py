@@ -0,0 +1,49 @@
+from prometheus_client import REGISTRY
+
+from app.metrics import observe_generation, statement_type
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+def test_statement_type():
+    """Test that statements are labelled by verb only."""
+    assert statement_type("SELECT * FROM file WHERE id = %(id)s") == "SELECT"
+    assert statement_type("  insert into file VALUES (1)") == "INSERT"
+    assert statement_type("BEGIN") == "OTHER"
+    assert statement_type("") == "OTHER"
+
+
+def test_observe_generation():
+    """Test time to first token and tokens per second from ollama's timings."""
+    labels = {"model": "metrics-test"}
+    before = sample("llm_time_to_first_token_seconds_count", labels)
+
+    observe_generation(
+        "metrics-test",
+        {
+            "load_duration": 500_000_000,
+            "prompt_eval_duration": 1_500_000_000,
+            "eval_count": 100,
+            "eval_duration": 4_000_000_000,
+        },
+    )
+
+    assert sample("llm_time_to_first_token_seconds_count", labels) == before + 1
+    assert sample("llm_time_to_first_token_seconds_sum", labels) >= 2.0
+    assert sample("llm_generation_tokens_per_second_sum", labels) >= 25.0
+
+
+def test_metrics_endpoint(client):
+    """Test that requests are counted by route template and served as text."""
+    labels = {"method": "GET", "route": "/", "status": "200"}
+    before = sample("http_request_duration_seconds_count", labels)
+
+    client.get("/")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_request_duration_seconds" in response.text
+    assert sample("http_request_duration_seconds_count", labels) == before + 1
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.queries import QueryLog, assert_max_queries, instrument_engine, statement_shape
+
+
+def test_statement_shape():
+    """Test that literals and whitespace don't split statement shapes."""
+    assert statement_shape("SELECT *\n  FROM file WHERE id = 42") == statement_shape(
+        "SELECT * FROM file WHERE id = 7"
+    )
+    assert statement_shape("SELECT 'it''s'") == "SELECT ?"
+
+
+def test_repeated_shapes():
+    """Test that only shapes over the threshold are reported."""
+    log = QueryLog()
+    for i in range(5):
+        log.record(f"SELECT * FROM file WHERE submission_id = {i}", 0.001)
+    log.record("SELECT * FROM submission", 0.001)
+
+    assert log.count == 6
+    assert log.repeated(5) == {"SELECT * FROM file WHERE submission_id = ?": 5}
+    assert log.repeated(6) == {}
+
+
+def test_assert_max_queries():
+    """Test that a block over its query budget fails with the statements run."""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    with engine.connect() as conn:
+        with assert_max_queries(2) as log:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        assert log.count == 2
+
+        with pytest.raises(AssertionError, match="3 queries run, budget is 2"):
+            with assert_max_queries(2):
+                for i in range(3):
+                    conn.execute(text(f"SELECT {i}"))
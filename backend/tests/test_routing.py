@@ -0,0 +1,29 @@
+from app.llm.config import LLM_MODEL
+from app.llm.routing import Route, select_route
+
+ROUTES = [
+    Route(model="deepseek-r1:8b", tasks=["grading"]),
+    Route(model="llama3.2:3b", max_tokens=2000, think=False),
+]
+
+
+def test_select_route_by_size():
+    """Test that short prompts go to the small model."""
+    route, index = select_route(500, routes=ROUTES)
+    assert route.model == "llama3.2:3b"
+    assert route.think is False
+    assert index == 1
+
+
+def test_select_route_by_task():
+    """Test that a task hint takes its own rule regardless of size."""
+    route, index = select_route(500, task="grading", routes=ROUTES)
+    assert route.model == "deepseek-r1:8b"
+    assert index == 0
+
+
+def test_select_route_falls_back_to_default_model():
+    """Test that prompts matching no rule use the configured model."""
+    route, index = select_route(50000, task="summary", routes=ROUTES)
+    assert route.model == LLM_MODEL
+    assert index is None
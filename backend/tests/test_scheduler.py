@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.llm.scheduler import BULK, INTERACTIVE, AdmissionError, FairScheduler
+
+
+async def run_jobs(scheduler, jobs):
+    """Queue jobs behind a blocker and return the order they were served in."""
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot("blocker"):
+            await release.wait()
+
+    async def job(user_id, priority, name):
+        async with scheduler.slot(user_id, priority):
+            order.append(name)
+
+    blocking = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+
+    tasks = []
+    for user_id, priority, name in jobs:
+        tasks.append(asyncio.create_task(job(user_id, priority, name)))
+        await asyncio.sleep(0)
+
+    release.set()
+    await asyncio.gather(blocking, *tasks)
+    return order
+
+
+def test_interactive_before_bulk():
+    """Test that interactive calls jump ahead of queued bulk calls."""
+    scheduler = FairScheduler(limit=1)
+    jobs = [
+        ("teacher_a", BULK, "bulk_1"),
+        ("teacher_a", BULK, "bulk_2"),
+        ("teacher_b", INTERACTIVE, "interactive"),
+    ]
+
+    order = asyncio.run(run_jobs(scheduler, jobs))
+
+    assert order == ["interactive", "bulk_1", "bulk_2"]
+
+
+def test_users_are_interleaved():
+    """Test that a user with a long queue doesn't starve another user."""
+    scheduler = FairScheduler(limit=1)
+    jobs = [("teacher_a", BULK, f"a{i}") for i in range(4)]
+    jobs.append(("teacher_b", BULK, "b0"))
+
+    order = asyncio.run(run_jobs(scheduler, jobs))
+
+    assert order.index("b0") <= 1
+    assert scheduler.in_flight == 0
+    assert scheduler.queued == 0
+    assert scheduler.snapshot()["wait_seconds"]["teacher_a"]["count"] == 4
+
+
+def test_admit_token_bucket():
+    """Test that a user over their rate is rejected with a retry hint."""
+    scheduler = FairScheduler(rate_per_minute=60, burst=3)
+
+    scheduler.admit("teacher_a", cost=2)
+    scheduler.admit("teacher_a", cost=1)
+    with pytest.raises(AdmissionError) as exc_info:
+        scheduler.admit("teacher_a", cost=1)
+
+    assert exc_info.value.retry_after >= 1
+    # other users have their own bucket
+    scheduler.admit("teacher_b", cost=3)
+
+
+def test_admit_queue_full():
+    """Test that requests are rejected when the queue is full."""
+    scheduler = FairScheduler(limit=1, queue_limit=1)
+
+    async def fill_queue():
+        release = asyncio.Event()
+
+        async def job():
+            async with scheduler.slot("teacher_a"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(job()) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(AdmissionError):
+                scheduler.admit("teacher_b")
+        finally:
+            release.set()
+            await asyncio.gather(*tasks)
+
+    asyncio.run(fill_queue())
+
+
+def test_cancelled_waiter_leaves_queue():
+    """Test that a call cancelled while queued gives up its place."""
+    scheduler = FairScheduler(limit=1)
+
+    async def cancel_waiter():
+        release = asyncio.Event()
+
+        async def job():
+            async with scheduler.slot("teacher_a"):
+                await release.wait()
+
+        running = asyncio.create_task(job())
+        waiting = asyncio.create_task(job())
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued == 0
+
+        release.set()
+        await running
+
+    asyncio.run(cancel_waiter())
+    assert scheduler.in_flight == 0
+
+
+def test_weighted_users():
+    """Test that a user with twice the weight gets twice the slots."""
+    scheduler = FairScheduler(limit=1, weights={"teacher_a": 2})
+    jobs = [("teacher_a", BULK, f"a{i}") for i in range(4)]
+    jobs += [("teacher_b", BULK, f"b{i}") for i in range(4)]
+
+    order = asyncio.run(run_jobs(scheduler, jobs))
+
+    assert order[:6] == ["a0", "a1", "b0", "a2", "a3", "b1"]
+
+
+def test_idle_users_are_forgotten():
+    """Test that per user state and metric series don't outlive the user."""
+    scheduler = FairScheduler(limit=1, rate_per_minute=60, burst=5, idle_seconds=60)
+    scheduler.admit("teacher_idle", cost=2)
+    asyncio.run(run_jobs(scheduler, [("teacher_idle", BULK, "only")]))
+
+    def wait_count():
+        return REGISTRY.get_sample_value(
+            "llm_user_queue_wait_seconds_count", {"user": "teacher_idle"}
+        )
+
+    assert wait_count() == 1
+    assert (
+        REGISTRY.get_sample_value("llm_user_queued", {"user": "teacher_idle"}) is None
+    )
+
+    # refilled and caught up with, but the wait stats are still recent
+    scheduler.prune(time.monotonic() + 10)
+    assert "teacher_idle" not in scheduler._buckets
+    assert "teacher_idle" not in scheduler._finish
+    assert "teacher_idle" in scheduler.snapshot()["wait_seconds"]
+
+    scheduler.prune(time.monotonic() + 120)
+    assert "teacher_idle" not in scheduler.snapshot()["wait_seconds"]
+    assert wait_count() is None
@@ -0,0 +1,164 @@
+import uuid
+
+import pytest
+
+from app.models import Assignment, File, FileContent, User
+from app.search_index import index_file, index_pending
+
+
+@pytest.fixture
+def indexed_files(db_session, test_submission, tmp_path):
+    """Store and index a few files for the test submission."""
+    texts = {
+        "plants.txt": "Photosynthesis turns light into chemical energy in plants.",
+        "cells.txt": "Cells use photosynthesis. Photosynthesis needs chlorophyll, "
+        "and photosynthesis happens in the chloroplast.",
+        "war.txt": "The causes of the war were economic and political.",
+    }
+    for filename, text in texts.items():
+        path = tmp_path / filename
+        path.write_text(text)
+        db_session.add(
+            File(
+                filename=filename,
+                filepath=str(path),
+                content_type="text/plain",
+                submission_id=test_submission.id,
+            )
+        )
+    db_session.commit()
+
+    assert index_pending(db_session) == 3
+    # files are only indexed once
+    assert index_pending(db_session) == 0
+    return texts
+
+
+def test_search_ranks_and_highlights(client, teacher_headers, indexed_files):
+    """Test that matches come back best first with the terms marked."""
+    response = client.get(
+        "/search/", params={"q": "photosynthesis"}, headers=teacher_headers
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert [hit["filename"] for hit in data["results"]] == ["cells.txt", "plants.txt"]
+    assert data["results"][0]["rank"] >= data["results"][1]["rank"]
+    assert "<mark>Photosynthesis</mark>" in data["results"][1]["headline"]
+    assert data["results"][0]["student_name"] == "Test Student"
+
+
+def test_search_pagination(client, teacher_headers, indexed_files):
+    """Test paging through results while the total stays the same."""
+    pages = [
+        client.get(
+            "/search/",
+            params={"q": "photosynthesis", "limit": 1, "offset": offset},
+            headers=teacher_headers,
+        ).json()
+        for offset in (0, 1, 2)
+    ]
+
+    assert [len(page["results"]) for page in pages] == [1, 1, 0]
+    assert [page["total"] for page in pages] == [2, 2, 2]
+    assert pages[0]["results"][0]["file_id"] != pages[1]["results"][0]["file_id"]
+
+
+def test_search_scope(
+    client, db_session, teacher_headers, student_headers, test_assignment, indexed_files
+):
+    """Test that search only covers what the user may see."""
+    response = client.get("/search/", params={"q": "war"}, headers=student_headers)
+    assert response.json()["total"] == 1
+
+    other_teacher = User(
+        username="other_teacher",
+        name="Other Teacher",
+        password="password123",
+        role="teacher",
+    )
+    other_assignment = Assignment(title="Other", teacher_id=other_teacher.id)
+    db_session.add_all([other_teacher, other_assignment])
+    db_session.commit()
+
+    response = client.get(
+        "/search/",
+        params={"q": "war", "assignment_id": str(other_assignment.id)},
+        headers=teacher_headers,
+    )
+    assert response.status_code == 403
+
+    response = client.get(
+        "/search/",
+        params={"q": "war", "assignment_id": str(test_assignment.id)},
+        headers=teacher_headers,
+    )
+    assert response.json()["total"] == 1
+
+
+def test_search_missing_file_is_indexed_empty(db_session, test_submission):
+    """Test that a file missing on disk isn't retried on every pass."""
+    file_record = File(
+        filename="gone.txt",
+        filepath=f"/nonexistent/{uuid.uuid4()}.txt",
+        content_type="text/plain",
+        submission_id=test_submission.id,
+    )
+    db_session.add(file_record)
+    db_session.commit()
+
+    assert index_pending(db_session) == 1
+    assert db_session.get(FileContent, file_record.id).text == ""
+
+
+def test_search_headline_is_escaped(
+    client, db_session, teacher_headers, tmp_path, test_submission
+):
+    """Test that markup in a submitted file comes back escaped in headlines."""
+    path = tmp_path / "xss.txt"
+    path.write_text(
+        "Photosynthesis & <scr<script>ipt>alert(1)</script> "
+        # a student can't forge a match with the markers
+        "\ue000fake\ue001 <img src=x onerror=alert(1)>"
+    )
+    db_session.add(
+        File(
+            filename="xss.txt",
+            filepath=str(path),
+            content_type="text/plain",
+            submission_id=test_submission.id,
+        )
+    )
+    db_session.commit()
+    index_pending(db_session)
+
+    response = client.get(
+        "/search/", params={"q": "photosynthesis"}, headers=teacher_headers
+    )
+
+    headline = response.json()["results"][0]["headline"]
+    assert headline.startswith("<mark>Photosynthesis</mark> &amp;")
+    assert headline.count("<") == 2 and headline.count(">") == 2
+    assert "<mark>fake" not in headline
+
+
+def test_index_file_twice(db_session, test_submission, tmp_path):
+    """Test that a file another worker already indexed is left alone."""
+    path = tmp_path / "twice.txt"
+    path.write_text("Indexed once")
+    file_record = File(
+        filename="twice.txt",
+        filepath=str(path),
+        content_type="text/plain",
+        submission_id=test_submission.id,
+    )
+    db_session.add(file_record)
+    db_session.commit()
+
+    index_file(db_session, file_record)
+    path.write_text("Indexed twice")
+    index_file(db_session, file_record)
+    db_session.commit()
+
+    assert db_session.get(FileContent, file_record.id).text == "Indexed once"
@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+
+from app.models import File, Submission, User
+from app.search_index import index_pending
+from app.similarity import (
+    NUM_PERM,
+    ROWS,
+    candidate_pairs,
+    clusters,
+    minhash,
+    shingle_hashes,
+    sign_pending,
+    signature_for,
+    similar_pairs,
+)
+from benchmarks.corpus import essay_text
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return len(np.intersect1d(a, b)) / len(np.union1d(a, b))
+
+
+def test_shingles_ignore_case_and_punctuation():
+    """Test that reformatting a text doesn't change its shingles."""
+    text = "The cell wall, made of cellulose, protects the plant cell."
+
+    assert np.array_equal(
+        shingle_hashes(text), shingle_hashes(text.upper().replace(",", " ;"))
+    )
+    assert len(shingle_hashes("too short")) == 0
+
+
+def test_minhash_estimates_jaccard():
+    """Test that matching signature slots track the real overlap."""
+    original = essay_text(6000, "original")
+    edited = original[:4500] + essay_text(1500, "edited")
+    unrelated = essay_text(6000, "unrelated")
+
+    a, b, c = (shingle_hashes(text) for text in (original, edited, unrelated))
+    sa, sb, sc = (minhash(hashes) for hashes in (a, b, c))
+
+    assert sa.shape == (NUM_PERM,) and sa.dtype == np.uint32
+    assert abs((sa == sb).mean() - jaccard(a, b)) < 0.15
+    assert (sa == sc).mean() < 0.1
+
+
+def test_similar_pairs_and_clusters():
+    """Test that copies are paired up and chained copies end in one cluster."""
+    texts = [essay_text(6000, str(i)) for i in range(50)]
+    # 2 and 3 are edited copies of 1, 11 is a cut down copy of 10
+    texts[2] = texts[1][:5500] + essay_text(500, "two")
+    texts[3] = texts[1][200:]
+    texts[11] = texts[10][:5000]
+    signatures = np.stack([signature_for(text)[0] for text in texts])
+
+    pairs, estimates = similar_pairs(signatures, threshold=0.5)
+
+    assert {tuple(pair) for pair in pairs.tolist()} == {
+        (1, 2),
+        (1, 3),
+        (2, 3),
+        (10, 11),
+    }
+    assert (estimates >= 0.5).all()
+    assert clusters(len(texts), pairs) == [[1, 2, 3], [10, 11]]
+
+
+def test_candidate_pairs_share_a_band():
+    """Test that candidates are exactly the pairs sharing a band, once each."""
+    rng = np.random.RandomState(0)
+    signatures = rng.randint(0, 1 << 32, size=(30, NUM_PERM), dtype=np.uint64)
+    signatures = signatures.astype(np.uint32)
+    # 0, 1 and 2 share a band, 3 and 4 two of them
+    signatures[[1, 2], :ROWS] = signatures[0, :ROWS]
+    signatures[4, ROWS : 3 * ROWS] = signatures[3, ROWS : 3 * ROWS]
+
+    pairs = candidate_pairs(signatures)
+
+    assert pairs.tolist() == [[0, 1], [0, 2], [1, 2], [3, 4]]
+
+
+def test_candidate_pairs_skip_common_bands():
+    """Test that a band most files share, like starter code, pairs nobody up."""
+    signatures = np.arange(20 * NUM_PERM, dtype=np.uint32).reshape(20, NUM_PERM)
+    signatures[:, :ROWS] = 7
+    signatures[5, -ROWS:] = signatures[6, -ROWS:]
+
+    assert candidate_pairs(signatures, max_bucket=10).tolist() == [[5, 6]]
+    assert len(candidate_pairs(signatures, max_bucket=20)) == 20 * 19 // 2
+
+
+@pytest.fixture
+def other_student(db_session):
+    student = User(
+        username="other_student",
+        name="Other Student",
+        password="password123",
+        role="student",
+    )
+    db_session.add(student)
+    db_session.commit()
+    return student
+
+
+def add_file(db_session, tmp_path, submission, filename, text):
+    path = tmp_path / filename
+    path.write_text(text)
+    db_session.add(
+        File(
+            filename=filename,
+            filepath=str(path),
+            content_type="text/plain",
+            submission_id=submission.id,
+        )
+    )
+    db_session.commit()
+
+
+def test_assignment_similarity(
+    client,
+    db_session,
+    tmp_path,
+    teacher_headers,
+    student_headers,
+    test_assignment,
+    test_submission,
+    other_student,
+):
+    """Test clustering copied files across an assignment's submissions."""
+    copied = essay_text(6000, "copied")
+    copy = Submission(assignment_id=test_assignment.id, student_id=other_student.id)
+    db_session.add(copy)
+    db_session.commit()
+
+    add_file(db_session, tmp_path, test_submission, "mine.txt", copied)
+    add_file(db_session, tmp_path, copy, "theirs.txt", copied[:5000])
+    # the same student submitting twice isn't copying
+    add_file(db_session, tmp_path, copy, "draft.txt", copied[1000:])
+    add_file(db_session, tmp_path, test_submission, "own.txt", essay_text(6000, "own"))
+    index_pending(db_session)
+    assert sign_pending(db_session) == 4
+
+    response = client.get(
+        f"/assignments/{test_assignment.id}/similarity", headers=teacher_headers
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["files_compared"] == 4
+    assert len(report["clusters"]) == 1
+    cluster = report["clusters"][0]
+    assert sorted(f["filename"] for f in cluster["files"]) == [
+        "draft.txt",
+        "mine.txt",
+        "theirs.txt",
+    ]
+    assert len(cluster["pairs"]) == 2
+    assert cluster["max_similarity"] > 0.7
+
+    # too low for the banding to find what it asks for
+    response = client.get(
+        f"/assignments/{test_assignment.id}/similarity",
+        params={"threshold": 0.2},
+        headers=teacher_headers,
+    )
+    assert response.status_code == 422
+
+    response = client.get(
+        f"/assignments/{test_assignment.id}/similarity", headers=student_headers
+    )
+    assert response.status_code == 403
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.llm.singleflight import SingleFlight
+
+
+def test_concurrent_duplicates_share_one_call():
+    """Test that identical concurrent calls run once and share the result."""
+    flight = SingleFlight()
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"analysis": "shared"}
+
+    async def run():
+        first = asyncio.create_task(flight.do("key", analyze))
+        second = asyncio.create_task(flight.do("key", analyze))
+        await asyncio.sleep(0)
+        assert flight.snapshot() == {"in_flight": 1, "waiters": 2, "max_waiters": 2}
+        return await asyncio.gather(first, second)
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert results[0] is results[1]
+    assert flight.snapshot()["in_flight"] == 0
+
+
+def test_different_keys_run_separately():
+    """Test that different keys are not coalesced."""
+    flight = SingleFlight()
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("a", lambda: asyncio.sleep(0, result="a")),
+            flight.do("b", lambda: asyncio.sleep(0, result="b")),
+        )
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_errors_are_shared():
+    """Test that every waiter sees the error of the shared call."""
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("LLM unavailable")
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_call_survives_until_last_waiter_leaves():
+    """Test that one waiter leaving doesn't cancel the call for the others."""
+    flight = SingleFlight()
+    started = []
+
+    async def analyze():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def run():
+        first = asyncio.create_task(flight.do("key", analyze))
+        second = asyncio.create_task(flight.do("key", analyze))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+        # with nobody left waiting the call itself is cancelled
+        third = asyncio.create_task(flight.do("other", analyze))
+        await asyncio.sleep(0)
+        task = flight._calls["other"]["task"]
+        third.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await third
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(run())
+    assert len(started) == 2
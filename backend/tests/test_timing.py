@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+
+from app.timing import Span, TimingMiddleware, _current, server_timing, span, totals
+
+
+def test_span_outside_request():
+    """Test that spans are a no-op when no request is being timed."""
+    with span("db"):
+        pass
+
+    assert _current.get() is None
+
+
+def test_span_tree():
+    """Test that nested spans are summed per name."""
+    root = Span("request")
+    token = _current.set(root)
+    try:
+        with span("auth"):
+            with span("db"):
+                pass
+        with span("db"):
+            pass
+    finally:
+        _current.reset(token)
+
+    assert [child.name for child in root.children] == ["auth", "db"]
+    assert root.children[0].children[0].name == "db"
+    assert totals(root)["db"]["count"] == 2
+
+    header = server_timing(root)
+    assert header.startswith("auth;dur=")
+    assert "db;dur=" in header and 'desc="2x"' in header
+    assert "total;dur=" in header
+
+
+def test_slow_request_log(caplog):
+    """Test that slow requests are logged with their spans."""
+
+    async def app(scope, receive, send):
+        with span("extract"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/slow"}
+    with caplog.at_level(logging.WARNING, logger="app.slow_requests"):
+        asyncio.run(TimingMiddleware(app, slow_seconds=0)(scope, None, send))
+
+    headers = dict(sent[0]["headers"])
+    assert b"extract;dur=" in headers[b"server-timing"]
+
+    entry = json.loads(caplog.records[0].getMessage())
+    assert entry["path"] == "/slow"
+    assert entry["status"] == 200
+    assert entry["spans"][0]["name"] == "extract"
+
+
+def test_server_timing_header(client):
+    """Test that responses carry a Server-Timing header."""
+    response = client.get("/")
+
+    assert "total;dur=" in response.headers["server-timing"]
@@ -0,0 +1,46 @@
+from app.llm.tokens import (
+    MIN_NUM_CTX,
+    TRUNCATION_MARKER,
+    estimate_tokens,
+    fit_content,
+    max_num_ctx,
+    size_num_ctx,
+)
+
+
+def test_estimate_tokens():
+    """Test the character based token estimate."""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_size_num_ctx_rounds_to_power_of_two():
+    """Test that num_ctx is sized to the prompt and capped by the model."""
+    assert size_num_ctx(10, "deepseek-r1:8b") == MIN_NUM_CTX
+    assert size_num_ctx(3000, "deepseek-r1:8b") == 4096
+    assert size_num_ctx(10**7, "deepseek-r1:8b") == max_num_ctx("deepseek-r1:8b")
+    assert size_num_ctx(10**7, "phi3:mini") == 4096
+
+
+def test_fit_content_short_document():
+    """Test that short content is sent as is with a small context."""
+    content, report = fit_content("Test file content", 20, "deepseek-r1:8b", 512)
+
+    assert content == "Test file content"
+    assert report["truncated"] is False
+    assert report["dropped_tokens"] == 0
+    assert report["num_ctx"] == MIN_NUM_CTX
+    assert report["prompt_tokens"] == 20 + estimate_tokens("Test file content")
+
+
+def test_fit_content_truncates_long_document():
+    """Test that content over the model context is trimmed and reported."""
+    content, report = fit_content("x" * 100000, 100, "phi3:mini", 1024)
+
+    assert content.endswith(TRUNCATION_MARKER)
+    assert report["truncated"] is True
+    assert report["dropped_tokens"] > 0
+    assert report["num_ctx"] == 4096
+    assert report["prompt_tokens"] + 1024 <= 4096
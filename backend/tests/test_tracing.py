@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from sqlalchemy import create_engine, text
+
+from app import tracing
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    # put the app's provider back afterwards
+    monkeypatch.setattr(tracing, "_provider", tracing._provider)
+    return InMemorySpanExporter()
+
+
+def test_tracing_off_by_default(monkeypatch):
+    """Test that nothing is set up without an exporter or OTLP endpoint."""
+    monkeypatch.setattr(tracing, "_provider", None)
+    monkeypatch.setattr(tracing, "OTLP_ENDPOINT", None)
+
+    assert tracing.configure() is None
+    tracing.instrument_client(httpx.AsyncClient())
+
+
+def test_sampling(exporter):
+    """Test that new traces are sampled but traced callers are always kept."""
+    provider = tracing.configure(exporter, sample_ratio=0.0, batch=False)
+    tracer = provider.get_tracer("test")
+
+    with tracer.start_as_current_span("unsampled"):
+        pass
+
+    parent = trace.SpanContext(
+        trace_id=0x0AF7651916CD43DD8448EB211C80319C,
+        span_id=0xB7AD6B7169203331,
+        is_remote=True,
+        trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+    )
+    with tracer.start_as_current_span(
+        "from frontend",
+        context=trace.set_span_in_context(trace.NonRecordingSpan(parent)),
+    ):
+        pass
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["from frontend"]
+
+
+def test_engine_spans(exporter):
+    """Test that SQL statements are traced under the current span."""
+    provider = tracing.configure(exporter, batch=False)
+    engine = create_engine("sqlite://")
+    tracing.instrument_engine(engine)
+
+    with provider.get_tracer("test").start_as_current_span("request") as parent:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert spans["SELECT"].parent.span_id == parent.get_span_context().span_id
+    assert spans["SELECT"].attributes["db.statement"] == "SELECT 1"
+
+
+def test_engine_instrumented_once(exporter):
+    """Test that instrumenting an engine again doesn't duplicate its spans."""
+    tracing.configure(exporter, batch=False)
+    engine = create_engine("sqlite://")
+    tracing.instrument_engine(engine)
+    tracing.instrument_engine(engine)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["SELECT"]
+
+
+def test_app_startup_instruments_engine(exporter, monkeypatch):
+    """Test that the engine is traced when tracing is configured after import."""
+    from app import main
+
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(main, "engine", engine)
+    tracing.configure(exporter, batch=False)
+    main.start_tracing()
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert [span.name for span in exporter.get_finished_spans()] == ["SELECT"]
+
+
+def test_llm_client_propagation(exporter):
+    """Test that outbound LLM calls are traced and carry the trace context."""
+    provider = tracing.configure(exporter, batch=False)
+    headers = {}
+
+    def handler(request):
+        headers.update(request.headers)
+        return httpx.Response(200, json={"response": "ok"})
+
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            tracing.instrument_client(client)
+            with provider.get_tracer("test").start_as_current_span("analyze") as span:
+                await client.post("http://ollama/api/generate", json={})
+                return span.get_span_context().trace_id
+
+    trace_id = asyncio.run(call())
+
+    assert headers["traceparent"].split("-")[1] == format(trace_id, "032x")
+    client_spans = [
+        span
+        for span in exporter.get_finished_spans()
+        if span.kind == trace.SpanKind.CLIENT
+    ]
+    assert client_spans and client_spans[0].context.trace_id == trace_id
@@ -0,0 +1,143 @@
+import asyncio
+import io
+
+import pytest
+
+from app.upload_limits import (
+    LimitedWriter,
+    RequestSizeLimitMiddleware,
+    UploadLimits,
+    UploadRejected,
+    sniff_content_type,
+)
+
+
+@pytest.mark.parametrize(
+    "filename, head, content_type",
+    [
+        ("essay.pdf", b"%PDF-1.4\n...", "application/pdf"),
+        ("essay.txt", "Résumé of the essay".encode(), "text/plain"),
+        ("notes", b"", "text/plain"),
+        # a prefix can end half way through a character
+        ("essay.txt", "Résumé".encode()[:2], "text/plain"),
+    ],
+)
+def test_sniff_supported(filename, head, content_type):
+    """Test telling PDFs and text apart from their first bytes."""
+    assert sniff_content_type(filename, head) == content_type
+
+
+@pytest.mark.parametrize(
+    "filename, head, complete",
+    [
+        ("essay.docx", b"PK\x03\x04rest of the zip", False),
+        ("photo.txt", b"\x89PNG\r\n\x1a\n", False),
+        ("essay.pdf", b"Just text", False),
+        ("essay.txt", b"%PDF-1.4", False),
+        ("data.txt", b"text\x00with a null", False),
+        ("latin1.txt", "Résumé".encode("latin-1"), False),
+        ("cut.txt", "Résumé".encode()[:2], True),
+    ],
+)
+def test_sniff_rejected(filename, head, complete):
+    """Test that anything extraction can't read is turned away."""
+    with pytest.raises(UploadRejected) as e:
+        sniff_content_type(filename, head, complete)
+
+    assert e.value.status_code == 415
+
+
+def test_upload_limits_for_assignment():
+    """Test that an assignment's own limits replace the defaults."""
+
+    class Assignment:
+        max_files = 2
+        max_file_bytes = None
+        max_total_bytes = 100
+
+    limits = UploadLimits.for_assignment(Assignment())
+
+    assert limits.max_files == 2
+    assert limits.max_file_bytes == UploadLimits().max_file_bytes
+    limits.check_files([50, 50])
+    # sizes that aren't known yet are left to the copy
+    limits.check_files([None, 100])
+
+    for sizes, status in (([1, 1, 1], 400), ([60, 41], 413)):
+        with pytest.raises(UploadRejected) as e:
+            limits.check_files(sizes)
+        assert e.value.status_code == status
+
+
+def test_limited_writer():
+    """Test that a copy stops as soon as it goes over the limit."""
+    out = io.BytesIO()
+    writer = LimitedWriter(out, 10, "too big")
+    writer.write(b"12345")
+
+    with pytest.raises(UploadRejected):
+        writer.write(b"123456")
+
+    assert out.getvalue() == b"12345"
+
+
+def run_middleware(body_chunks, headers=(), path="/upload"):
+    received = []
+    sent = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message)
+            if message["type"] == "http.disconnect" or not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(body_chunks) - 1}
+        for i, chunk in enumerate(body_chunks)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    middleware = RequestSizeLimitMiddleware(app, max_bytes=10, paths=["/upload"])
+    asyncio.run(middleware(scope, receive, send))
+    return received, sent
+
+
+def test_request_size_limit_content_length():
+    """Test that a declared length over the limit is refused unread."""
+    received, sent = run_middleware([b"x" * 20], headers=[(b"content-length", b"20")])
+
+    assert received == []
+    assert sent[0]["status"] == 413
+
+
+def test_request_size_limit_streaming():
+    """Test that a body without a length is cut off once it's too big."""
+    received, sent = run_middleware([b"x" * 6, b"x" * 6, b"x" * 6])
+
+    assert [message["type"] for message in received] == [
+        "http.request",
+        "http.disconnect",
+    ]
+    assert [message["type"] for message in sent] == [
+        "http.response.start",
+        "http.response.body",
+    ]
+    assert sent[0]["status"] == 413
+
+
+def test_request_size_limit_other_paths():
+    """Test that bodies on other paths and within the limit get through."""
+    _, sent = run_middleware([b"x" * 20], path="/elsewhere")
+    assert sent[0]["status"] == 201
+
+    _, sent = run_middleware([b"x" * 5, b"x" * 5])
+    assert sent[0]["status"] == 201
@@ -0,0 +1,382 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlmodel import Session
+
+from app.database import get_session
+from app.main import app
+from app.models import UploadSession
+from app.routers import uploads
+from app.routers.uploads import PARTIAL_DIR, cleanup_abandoned_uploads, partial_path
+
+CONTENT = b"A long transcript of the lecture. " * 1000
+
+
+@pytest.fixture
+def start_upload(client, student_headers, test_assignment):
+    created = []
+
+    def start(**fields):
+        payload = {
+            "assignment_id": str(test_assignment.id),
+            "filename": "transcript.txt",
+            "content_type": "text/plain",
+            "size": len(CONTENT),
+            **fields,
+        }
+        response = client.post("/uploads/", json=payload, headers=student_headers)
+        assert response.status_code == 201
+        created.append(response.json()["id"])
+        return response.json()
+
+    yield start
+
+    for upload_id in created:
+        try:
+            os.remove(partial_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+
+def put_chunk(client, headers, upload_id, offset, data, **extra):
+    return client.put(
+        f"/uploads/{upload_id}",
+        params={"offset": offset},
+        content=data,
+        headers={**headers, **extra},
+    )
+
+
+def test_chunked_upload_creates_submission(client, student_headers, start_upload):
+    """Test uploading a file in chunks and attaching it on finalize."""
+    upload = start_upload(sha256=hashlib.sha256(CONTENT).hexdigest(), comment="Chunked")
+    assert upload["offset"] == 0
+
+    middle = len(CONTENT) // 2
+    first = CONTENT[:middle]
+    response = put_chunk(
+        client,
+        student_headers,
+        upload["id"],
+        0,
+        first,
+        **{"Chunk-SHA256": hashlib.sha256(first).hexdigest()},
+    )
+    assert response.status_code == 200
+    assert response.json()["offset"] == middle
+
+    # a client that lost track of its progress asks where to resume
+    response = client.get(f"/uploads/{upload['id']}", headers=student_headers)
+    assert response.json()["offset"] == middle
+
+    response = put_chunk(
+        client, student_headers, upload["id"], middle, CONTENT[middle:]
+    )
+    assert response.json()["offset"] == len(CONTENT)
+
+    response = client.post(f"/uploads/{upload['id']}/finalize", headers=student_headers)
+    assert response.status_code == 201
+    data = response.json()
+    assert data["comment"] == "Chunked"
+    assert len(data["files"]) == 1
+
+    path = data["files"][0]["filepath"]
+    try:
+        with open(path, "rb") as f:
+            assert f.read() == CONTENT
+        assert not os.path.exists(partial_path(upload["id"]))
+        response = client.get(f"/uploads/{upload['id']}", headers=student_headers)
+        assert response.status_code == 404
+    finally:
+        os.remove(path)
+
+
+def test_chunk_at_wrong_offset(client, student_headers, start_upload):
+    """Test that a chunk has to start where the last one ended."""
+    upload = start_upload()
+    put_chunk(client, student_headers, upload["id"], 0, CONTENT[:100])
+
+    # a retried chunk that already arrived
+    response = put_chunk(client, student_headers, upload["id"], 0, CONTENT[:100])
+
+    assert response.status_code == 409
+    assert response.json()["offset"] == 100
+    assert response.headers["Upload-Offset"] == "100"
+
+
+def test_chunk_checksum_mismatch(client, student_headers, start_upload):
+    """Test that a corrupted chunk is dropped and can be sent again."""
+    upload = start_upload()
+
+    response = put_chunk(
+        client,
+        student_headers,
+        upload["id"],
+        0,
+        CONTENT[:100],
+        **{"Chunk-SHA256": hashlib.sha256(b"something else").hexdigest()},
+    )
+
+    assert response.status_code == 400
+    assert os.path.getsize(partial_path(upload["id"])) == 0
+    response = client.get(f"/uploads/{upload['id']}", headers=student_headers)
+    assert response.json()["offset"] == 0
+
+
+@pytest.fixture
+def stale_offset(monkeypatch):
+    """
+    Make the offset check before streaming see offset 0, as it would for a
+    chunk that started before another one for the same offset was written.
+    """
+    get_upload = uploads.get_upload
+
+    def stale_get_upload(*args):
+        upload = get_upload(*args)
+        upload.offset = 0
+        return upload
+
+    monkeypatch.setattr(uploads, "get_upload", stale_get_upload)
+
+
+def test_losing_chunk_leaves_data_alone(
+    client, student_headers, start_upload, stale_offset
+):
+    """Test that a chunk beaten to its offset doesn't touch what was written."""
+    upload = start_upload()
+    put_chunk(client, student_headers, upload["id"], 0, CONTENT[:100])
+
+    response = put_chunk(client, student_headers, upload["id"], 0, b"x" * 50)
+    assert response.status_code == 409
+    assert response.json()["offset"] == 100
+
+    # a failing loser mustn't cut the file back to its own offset either
+    response = put_chunk(
+        client,
+        student_headers,
+        upload["id"],
+        0,
+        b"x" * 50,
+        **{"Chunk-SHA256": hashlib.sha256(b"something else").hexdigest()},
+    )
+    assert response.status_code == 400
+
+    with open(partial_path(upload["id"]), "rb") as f:
+        assert f.read() == CONTENT[:100]
+    assert not [name for name in os.listdir(PARTIAL_DIR) if name.endswith(".chunk")]
+
+
+@pytest.fixture
+def concurrent_client(client, test_db_engine):
+    """
+    An async client on the app's own event loop, each request with a session
+    of its own, so requests overlap the way they do in production.
+    """
+
+    def own_session():
+        with Session(test_db_engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = own_session
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    )
+
+
+def test_concurrent_chunks(
+    monkeypatch, concurrent_client, student_headers, start_upload
+):
+    """Test that a chunk waiting for another's row lock doesn't stall the server."""
+    upload = start_upload()
+    append = uploads._append
+
+    def slow_append(*args):
+        # hold the row lock long enough for the other chunk to ask for it
+        time.sleep(0.5)
+        append(*args)
+
+    monkeypatch.setattr(uploads, "_append", slow_append)
+
+    async def send():
+        async with concurrent_client as client:
+            return await asyncio.gather(
+                *(
+                    client.put(
+                        f"/uploads/{upload['id']}",
+                        params={"offset": 0},
+                        content=CONTENT[:100],
+                        headers=student_headers,
+                    )
+                    for _ in range(2)
+                )
+            )
+
+    responses = asyncio.run(send())
+
+    assert sorted(r.status_code for r in responses) == [200, 409]
+    assert [r.json()["offset"] for r in responses] == [100, 100]
+    with open(partial_path(upload["id"]), "rb") as f:
+        assert f.read() == CONTENT[:100]
+
+
+def test_chunk_past_end_of_file(client, student_headers, start_upload):
+    """Test that chunks can't add up to more than the declared size."""
+    upload = start_upload(size=10)
+
+    response = put_chunk(client, student_headers, upload["id"], 0, CONTENT[:11])
+
+    assert response.status_code == 400
+    assert os.path.getsize(partial_path(upload["id"])) == 0
+
+
+def test_finalize_checks_upload(client, student_headers, start_upload):
+    """Test finalizing an incomplete upload and one with the wrong checksum."""
+    upload = start_upload(sha256="0" * 64)
+    put_chunk(client, student_headers, upload["id"], 0, CONTENT[:100])
+
+    response = client.post(f"/uploads/{upload['id']}/finalize", headers=student_headers)
+    assert response.status_code == 409
+    assert response.json()["offset"] == 100
+
+    put_chunk(client, student_headers, upload["id"], 100, CONTENT[100:])
+    response = client.post(f"/uploads/{upload['id']}/finalize", headers=student_headers)
+    assert response.status_code == 400
+    assert not os.path.exists(partial_path(upload["id"]))
+
+
+def test_upload_permissions(
+    client, teacher_headers, student_headers, test_assignment, start_upload
+):
+    """Test that only the student who started an upload can use it."""
+    response = client.post(
+        "/uploads/",
+        json={
+            "assignment_id": str(test_assignment.id),
+            "filename": "transcript.txt",
+            "size": 10,
+        },
+        headers=teacher_headers,
+    )
+    assert response.status_code == 403
+
+    upload = start_upload()
+    response = put_chunk(client, teacher_headers, upload["id"], 0, CONTENT[:10])
+    assert response.status_code == 403
+
+
+def test_cleanup_abandoned_uploads(db_session, test_assignment, test_student):
+    """Test that stale uploads are deleted along with their data."""
+    stale = UploadSession(
+        assignment_id=test_assignment.id,
+        student_id=test_student.id,
+        filename="stale.txt",
+        size=10,
+        updated_at=datetime.now(timezone.utc) - timedelta(days=2),
+    )
+    fresh = UploadSession(
+        assignment_id=test_assignment.id,
+        student_id=test_student.id,
+        filename="fresh.txt",
+        size=10,
+    )
+    db_session.add_all([stale, fresh])
+    db_session.commit()
+    for upload in (stale, fresh):
+        open(partial_path(upload.id), "wb").close()
+
+    try:
+        assert cleanup_abandoned_uploads(db_session, ttl=3600) == 1
+
+        assert db_session.get(UploadSession, stale.id) is None
+        assert not os.path.exists(partial_path(stale.id))
+        assert db_session.get(UploadSession, fresh.id) is not None
+        assert os.path.exists(partial_path(fresh.id))
+    finally:
+        os.remove(partial_path(fresh.id))
+
+
+def test_upload_limits(
+    client, db_session, student_headers, test_assignment, start_upload
+):
+    """Test that uploads over the assignment's limits are refused up front."""
+    test_assignment.max_file_bytes = 1000
+    db_session.add(test_assignment)
+    db_session.commit()
+
+    response = client.post(
+        "/uploads/",
+        json={
+            "assignment_id": str(test_assignment.id),
+            "filename": "transcript.txt",
+            "size": 1001,
+        },
+        headers=student_headers,
+    )
+
+    assert response.status_code == 413
+
+
+def test_first_chunk_is_sniffed(client, student_headers, start_upload):
+    """Test that the type is told from the first chunk before it's written."""
+    upload = start_upload(filename="lecture.txt")
+
+    response = put_chunk(
+        client, student_headers, upload["id"], 0, b"\x89PNG\r\n\x1a\n" + b"\x00" * 5000
+    )
+
+    assert response.status_code == 415
+    assert os.path.getsize(partial_path(upload["id"])) == 0
+
+    upload = start_upload(content_type="application/octet-stream")
+    response = put_chunk(client, student_headers, upload["id"], 0, CONTENT[:5000])
+
+    assert response.json()["content_type"] == "text/plain"
+
+
+def test_finalize_twice(client, student_headers, start_upload):
+    """Test that finalizing an upload that was already finalized is a 404."""
+    upload = start_upload()
+    put_chunk(client, student_headers, upload["id"], 0, CONTENT)
+
+    response = client.post(f"/uploads/{upload['id']}/finalize", headers=student_headers)
+    assert response.status_code == 201
+    path = response.json()["files"][0]["filepath"]
+    try:
+        response = client.post(
+            f"/uploads/{upload['id']}/finalize", headers=student_headers
+        )
+        assert response.status_code == 404
+    finally:
+        os.remove(path)
+
+
+def test_same_file_name_twice(client, student_headers, start_upload):
+    """Test that a second file of the same name doesn't overwrite the first."""
+    upload = start_upload()
+    put_chunk(client, student_headers, upload["id"], 0, CONTENT)
+    submission = client.post(
+        f"/uploads/{upload['id']}/finalize", headers=student_headers
+    ).json()
+
+    second = CONTENT.upper()
+    upload = start_upload(submission_id=submission["id"])
+    put_chunk(client, student_headers, upload["id"], 0, second)
+    response = client.post(f"/uploads/{upload['id']}/finalize", headers=student_headers)
+
+    assert response.status_code == 201
+    paths = [f["filepath"] for f in response.json()["files"]]
+    try:
+        assert len(set(paths)) == 2
+        contents = set()
+        for path in paths:
+            with open(path, "rb") as f:
+                contents.add(f.read())
+        assert contents == {CONTENT, second}
+    finally:
+        for path in paths:
+            os.remove(path)
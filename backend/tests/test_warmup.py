@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from app.llm import stats
+from app.llm.warmup import in_warm_window, parse_days, preload_models, record_load
+
+
+class AsyncMock(MagicMock):
+    """Mock for async methods."""
+
+    async def __call__(self, *args, **kwargs):
+        return super(AsyncMock, self).__call__(*args, **kwargs)
+
+
+def test_parse_days():
+    """Test day ranges and lists."""
+    assert parse_days("mon-fri") == {0, 1, 2, 3, 4}
+    assert parse_days("mon, wed,sat") == {0, 2, 5}
+
+
+def test_in_warm_window():
+    """Test that models are only kept warm during school hours."""
+    monday_morning = datetime(2025, 9, 1, 8, 30)
+    monday_night = datetime(2025, 9, 1, 20, 0)
+    saturday_morning = datetime(2025, 9, 6, 8, 30)
+
+    assert in_warm_window(monday_morning, "07:00-16:00", "mon-fri")
+    assert not in_warm_window(monday_night, "07:00-16:00", "mon-fri")
+    assert not in_warm_window(saturday_morning, "07:00-16:00", "mon-fri")
+    assert not in_warm_window(monday_morning, "", "mon-fri")
+
+
+def test_record_load_cold_and_warm():
+    """Test that generations are classified by model load time."""
+    stats.reset()
+
+    cold = record_load({"load_duration": 8e9, "total_duration": 12e9})
+    warm = record_load({"load_duration": 2e7, "total_duration": 3e9})
+
+    assert cold == {"total_s": 12.0, "load_s": 8.0, "cold": True}
+    assert warm["cold"] is False
+
+    timings = stats.snapshot()["timings"]
+    assert timings["cold_generation"]["count"] == 1
+    assert timings["warm_generation"]["sum"] == 3.0
+
+
+@patch("httpx.AsyncClient")
+def test_preload_models(mock_async_client):
+    """Test that every configured model is loaded with the keep_alive."""
+    mock_client = MagicMock()
+    mock_client.__aenter__.return_value = mock_client
+    mock_client.post = AsyncMock(return_value=MagicMock(status_code=200))
+    mock_async_client.return_value = mock_client
+
+    asyncio.run(preload_models(["deepseek-r1:8b", "llama3.2:3b"], "30m"))
+
+    payloads = [call.kwargs["json"] for call in mock_client.post.call_args_list]
+    assert payloads == [
+        {"model": "deepseek-r1:8b", "keep_alive": "30m"},
+        {"model": "llama3.2:3b", "keep_alive": "30m"},
+    ]
@@ -189,6 +189,8 @@ const SubmissionPage = () => {
         },
         body: JSON.stringify({
           prompt: prompt,
+          // a teacher is waiting on this one, ahead of bulk runs
+          priority: 'interactive',
         })
       });
 